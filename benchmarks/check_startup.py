@@ -0,0 +1,75 @@
+"""
+檢查純資料模式的啟動時間
+
+在新的 python process 中載入讀檔、重新網格化與批次處理模組，
+確認沒有載入任何繪圖 / pyart 套件，且載入時間低於目標值。
+
+用法: python benchmarks/check_startup.py [--target 0.5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 純資料模式的 import surface
+DATA_MODULES = [
+    'main',
+    'radar_processing.RadarDataProcessorClass',
+    'radar_processing.regrid',
+    'radar_processing.radar_polar_processor',
+    'radar_processing.batch',
+]
+
+# 不應在純資料模式載入的套件
+HEAVY_MODULES = ['pyart', 'matplotlib', 'mpl_toolkits.basemap', 'PIL']
+
+_CHILD = """
+import importlib, json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed,
+                   'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_startup(modules=DATA_MODULES, repeat: int = 3) -> dict:
+    """
+    在新的 process 中量測載入時間 (取多次中最短的)
+    """
+    code = _CHILD.format(modules=list(modules), heavy=HEAVY_MODULES)
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    best = min(results, key=lambda r: r['seconds'])
+    return {'seconds': best['seconds'],
+            'loaded': sorted({m for r in results for m in r['loaded']})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', type=float, default=0.5, help='載入時間上限(秒)')
+    args = parser.parse_args()
+
+    result = measure_startup()
+    print(json.dumps(result))
+    ok = True
+    if result['loaded']:
+        print(f"FAIL: data-only imports pulled in {', '.join(result['loaded'])}")
+        ok = False
+    if result['seconds'] > args.target:
+        print(f"FAIL: import took {result['seconds']:.3f}s (target {args.target:.3f}s)")
+        ok = False
+    if ok:
+        print(f"OK: {result['seconds']:.3f}s <= {args.target:.3f}s")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
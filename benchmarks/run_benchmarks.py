@@ -0,0 +1,193 @@
+"""
+熱點路徑的效能量測 (使用合成的 RCWF 檔案)
+
+量測讀檔解碼、重新網格化、Radar 物件建立、出圖與動畫的執行時間
+(多次取中位數與最小值) 與 tracemalloc 記憶體峰值，結果寫成 JSON，
+可用 --compare 與先前的結果比較。缺少的選用套件 (pyart, Basemap) 對應的項目會略過。
+
+用法: python benchmarks/run_benchmarks.py [--nray 360] [--ngate 1840] [--repeat 5]
+      [--output benchmark.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import THETAS, write_sweep, write_volume  # noqa: E402
+from radar_processing.RadarDataProcessorClass import RadarDataProcessor  # noqa: E402
+from radar_processing.geometry import check_shapefile  # noqa: E402
+from radar_processing.radar_polar_processor import regrid_polar_data, regrid_volume  # noqa: E402
+
+
+def measure(func, repeat: int = 5) -> dict:
+    """
+    執行 func 數次，回傳時間 (秒) 與 tracemalloc 記憶體峰值 (bytes)
+
+    第一次執行 (含快取建立) 另外記錄為 'first'，記憶體峰值在最後一次單獨量測
+    """
+    start = time.perf_counter()
+    func()
+    first = time.perf_counter() - start
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'first': first, 'median': statistics.median(times), 'min': min(times),
+            'repeat': repeat, 'peak_bytes': peak}
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'commit': commit}
+
+
+def benchmark_cases(workdir: str, nray: int, ngate: int):
+    """
+    產生合成檔案並回傳 (名稱, 函式) 列表；缺少選用套件的項目不列入
+    """
+    gz_path = write_sweep(os.path.join(workdir, 'RCWF.sweep.bref_qc.gz'), nray, ngate)
+    raw_path = write_sweep(os.path.join(workdir, 'RCWF.sweep.bref_qc.bin'), nray, ngate)
+    volume_paths = write_volume(os.path.join(workdir, 'volume'), nray=nray, ngate=ngate)
+    sweep = RadarDataProcessor(gz_path, dtype=np.float32)
+    sweeps = [RadarDataProcessor(path, dtype=np.float32) for path in volume_paths]
+    new_data, new_header = regrid_polar_data(sweep)
+
+    cases = [
+        ('decode_gz', lambda: RadarDataProcessor(gz_path).data),
+        ('decode_raw', lambda: RadarDataProcessor(raw_path).data),
+        ('decode_volume_gz', lambda: [RadarDataProcessor(p).data for p in volume_paths]),
+        ('regrid_nearest', lambda: regrid_polar_data(sweep, method='nearest')),
+        ('regrid_mean', lambda: regrid_polar_data(sweep, method='mean')),
+        ('regrid_max', lambda: regrid_polar_data(sweep, method='max')),
+        ('regrid_volume_nearest', lambda: regrid_volume(sweeps)),
+    ]
+
+    try:
+        import pyart  # noqa: F401
+    except ImportError:
+        print('pyart not installed, skipping Radar construction')
+    else:
+        from radar_processing.radar_polar_processor import (create_radar_object_from_regridded,
+                                                            create_radar_volume)
+        volume, volume_header = regrid_volume(sweeps)
+        cases += [
+            ('radar_sweep', lambda: create_radar_object_from_regridded(gz_path, new_data, sweep,
+                                                                       new_header)),
+            ('radar_volume', lambda: create_radar_volume(gz_path, volume, sweeps, volume_header)),
+        ]
+
+    try:
+        from radar_processing.raster import get_raster_renderer
+        from radar_processing.animation import write_animation
+    except ImportError:
+        print('PIL not installed, skipping rendering')
+        return cases
+    try:
+        check_shapefile()
+    except FileNotFoundError as exc:
+        print(f'{exc}, skipping rendering')
+        return cases
+    renderer = get_raster_renderer(sweep.rlat, sweep.rlon, new_header, sweep.theta)
+    layer_data = [regrid_polar_data(obj)[0] for obj in sweeps]
+    frames = [get_raster_renderer(obj.rlat, obj.rlon, new_header, obj.theta).render(data)
+              for obj, data in zip(sweeps, layer_data)]
+    png_path = os.path.join(workdir, 'frame.png')
+    gif_path = os.path.join(workdir, 'animation.gif')
+    cases += [
+        ('render_raster', lambda: renderer.render(new_data, 'benchmark')),
+        ('render_raster_png', lambda: renderer.save(new_data, png_path, 'benchmark')),
+        ('animation_gif', lambda: write_animation(frames, gif_path, 'gif')),
+    ]
+
+    try:
+        from radar_processing.visualization import render_frame
+        from radar_processing.radar_polar_processor import create_radar_object_from_regridded
+    except ImportError:
+        print('pyart / Basemap not installed, skipping Basemap rendering')
+    else:
+        radar, _ = create_radar_object_from_regridded(gz_path, new_data, sweep, new_header)
+        cases.append(('render_basemap', lambda: render_frame(radar, 1, '20230101', '2204', 'bref_qc')))
+    return cases
+
+
+def run_benchmarks(nray: int = 360, ngate: int = 1840, repeat: int = 5, only=None) -> dict:
+    """
+    執行所有量測項目，回傳可寫成 JSON 的結果
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, func in benchmark_cases(workdir, nray, ngate):
+            if only and name not in only:
+                continue
+            results[name] = measure(func, repeat)
+            print(f"{name:24s} median {results[name]['median'] * 1000:9.2f} ms  "
+                  f"peak {results[name]['peak_bytes'] / 2 ** 20:8.1f} MiB")
+    return {'environment': _environment(),
+            'params': {'nray': nray, 'ngate': ngate, 'nsweeps': len(THETAS), 'repeat': repeat},
+            'results': results}
+
+
+def compare(current: dict, previous: dict, threshold: float = 1.2) -> list:
+    """
+    與先前結果比較，回傳中位數時間變慢超過 threshold 倍的項目
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        old = previous.get('results', {}).get(name)
+        if old is None:
+            continue
+        ratio = result['median'] / old['median']
+        print(f"{name:24s} {old['median'] * 1000:9.2f} -> {result['median'] * 1000:9.2f} ms  x{ratio:.2f}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nray', type=int, default=360)
+    parser.add_argument('--ngate', type=int, default=1840)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help='只執行指定的項目')
+    parser.add_argument('--output', default='benchmark.json', help='結果 JSON 路徑')
+    parser.add_argument('--compare', help='先前的結果 JSON，變慢超過 --threshold 倍時以狀態碼 1 結束')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    result = run_benchmarks(args.nray, args.ngate, args.repeat, args.only)
+    with open(args.output, 'w') as fh:
+        json.dump(result, fh, indent=2)
+    print(f"Saved {args.output}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(result, json.load(fh), args.threshold)
+        if regressions:
+            print(f"FAIL: slower than {args.threshold}x: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
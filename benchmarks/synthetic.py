@@ -0,0 +1,137 @@
+"""
+產生合成的 CWB 極座標雷達二進位檔 (RCWF 格式)
+
+header 為 '<16s36i' (站名 + 36 個整數，除 var_miss 外皆乘上 h_scale)，
+之後為 (nray, ngate) 的 int32 資料，可選擇 gzip 壓縮。
+檔名與 batch.input_filename 相同，可直接作為 input_dir 使用。
+
+用法: python benchmarks/synthetic.py OUTPUT_DIR [--nray 360] [--ngate 1840] [--raw]
+"""
+import argparse
+import gzip
+import os
+import struct
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from radar_processing.RadarDataProcessorClass import HEADER_FORMAT, PAYLOAD_DTYPE  # noqa: E402
+
+H_SCALE = 100
+VAR_MISS = -99900
+# RCWF (五分山) 的站點資訊
+SITE = {'name': 'RCWF', 'rlat': 25.07, 'rlon': 121.77, 'radar_elev': 766.0}
+# VCP 21 的 15 層仰角
+THETAS = (0.5, 1.4, 2.4, 3.4, 4.3, 5.3, 6.2, 7.5, 8.7, 10.0, 12.0, 14.0, 16.7, 19.5, 23.0)
+
+
+def sweep_header(nray: int, ngate: int, theta: float, date: str = '20230101', time: str = '2204',
+                 site: dict = SITE, gate_start: float = 250.0, gate_sp: float = 250.0,
+                 var_scale: float = 100.0, nyquist: float = 26.5) -> bytes:
+    """
+    組合 160 bytes 的 header (欄位順序與 RadarDataProcessor._parse_header 相同)
+    """
+    values = [site['radar_elev'], site['rlat'], site['rlon'],
+              int(date[:4]), int(date[4:6]), int(date[6:8]), int(time[:2]), int(time[2:4]), 0,
+              nyquist, 21]
+    info = [H_SCALE] + [int(round(v * H_SCALE)) for v in values]
+    info += [0,  # itit (不乘 h_scale)
+             int(round(theta * H_SCALE)), nray * H_SCALE, ngate * H_SCALE,
+             0, int(round(360.0 / nray * H_SCALE)),
+             int(round(gate_start * H_SCALE)), int(round(gate_sp * H_SCALE)),
+             int(round(var_scale * H_SCALE)), VAR_MISS]
+    info += [0] * (36 - len(info))
+    name = site['name'].encode().ljust(16)
+    return struct.pack(HEADER_FORMAT, name, *info)
+
+
+def synthetic_field(nray: int, ngate: int, theta: float = 0.5, seed: int = 0) -> np.ndarray:
+    """
+    類似回波場的資料 (dBZ)：幾個高斯對流胞加上雜訊，弱回波與遠處設為缺失 (NaN)
+    """
+    rng = np.random.default_rng(seed)
+    azimuth = np.radians(np.arange(nray) * 360.0 / nray)[:, None]
+    distance = np.linspace(0.0, 1.0, ngate)[None, :]
+    x, y = distance * np.sin(azimuth), distance * np.cos(azimuth)
+    field = np.zeros((nray, ngate))
+    for _ in range(6):
+        cx, cy = rng.uniform(-0.7, 0.7, 2)
+        width = rng.uniform(0.03, 0.15)
+        field += rng.uniform(30, 60) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * width ** 2))
+    field += rng.normal(0.0, 3.0, field.shape) - theta
+    field[(field < 5) | (distance > 0.9)] = np.nan
+    return field
+
+
+def write_sweep(path: str, nray: int = 360, ngate: int = 1840, theta: float = 0.5,
+                compress: bool = None, seed: int = 0, var_scale: float = 100.0, **header_kw) -> str:
+    """
+    寫出一個 sweep 的二進位檔
+
+    Parameters
+    ----------
+    path : str
+        輸出路徑 (compress 未指定時依是否以 .gz 結尾決定是否壓縮)
+    nray, ngate : int
+        方位角與距離方向格點數
+    theta : float
+        仰角(度)
+    seed : int
+        亂數種子 (相同參數產生相同檔案)
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    field = synthetic_field(nray, ngate, theta, seed)
+    raw = np.where(np.isnan(field), VAR_MISS, np.round(np.nan_to_num(field) * var_scale))
+    buf = sweep_header(nray, ngate, theta, var_scale=var_scale, **header_kw) + \
+        raw.astype(PAYLOAD_DTYPE).tobytes()
+    if compress:
+        # mtime=0 讓壓縮檔內容可重現
+        with open(path, 'wb') as fh, gzip.GzipFile(fileobj=fh, mode='wb', mtime=0) as gz:
+            gz.write(buf)
+    else:
+        with open(path, 'wb') as fh:
+            fh.write(buf)
+    return path
+
+
+def write_volume(input_dir: str, date: str = '20230101', time: str = '2204',
+                 param_type: str = 'bref_qc', nray: int = 360, ngate: int = 1840,
+                 thetas=THETAS, compress: bool = True, seed: int = 0) -> list:
+    """
+    以 batch.input_filename 的檔名寫出一個 volume 的所有層，回傳檔案路徑
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    paths = []
+    for layer_num, theta in enumerate(thetas, start=1):
+        name = f"{SITE['name']}.{date}.{time}.{param_type}.{layer_num:02d}"
+        if compress:
+            name += '.gz'
+        paths.append(write_sweep(os.path.join(input_dir, name), nray, ngate, theta,
+                                 compress=compress, seed=seed + layer_num, date=date, time=time))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--dates', nargs='+', default=['20230101'])
+    parser.add_argument('--times', nargs='+', default=['2204'])
+    parser.add_argument('--param-types', nargs='+', default=['bref_qc'])
+    parser.add_argument('--nray', type=int, default=360)
+    parser.add_argument('--ngate', type=int, default=1840)
+    parser.add_argument('--raw', action='store_true', help='不壓縮 (預設 gzip)')
+    args = parser.parse_args()
+
+    for date in args.dates:
+        for time in args.times:
+            for seed, param_type in enumerate(args.param_types):
+                paths = write_volume(args.output_dir, date, time, param_type, args.nray, args.ngate,
+                                     compress=not args.raw, seed=100 * seed)
+                print(f"{date} {time} {param_type}: {len(paths)} files")
+
+
+if __name__ == '__main__':
+    main()
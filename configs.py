@@ -7,7 +7,75 @@ config = {
     'output_dir': "./output/",
     'dates': ["20230101"],
     'times': ["2204"],
-    'param_types': ["bref_qc"]
+    'param_types': ["bref_qc"],
+    # 降解析度方式: 'nearest', 'mean' (回波場在線性 Z 平均), 'max', 'median', 'fraction'
+    'regrid_method': "nearest",
+    # False 為純資料模式：只輸出重新網格化後的資料，不載入任何繪圖套件
+    'render': True,
+    # 出圖方式: 'basemap' (pyart + Basemap) 或 'raster' (預先計算像素查表的快速出圖)
+    'renderer': "basemap",
+    # 是否保存各層 png；動畫格式 'gif', 'apng', 'mp4' (None 為不輸出動畫)，每張畫面顯示時間(ms)
+    'save_png': True,
+    'animation_format': "gif",
+    'frame_duration': 500,
+    # 平行處理的 process 數 (None 為使用全部 CPU)
+    'workers': os.cpu_count(),
+    # 多解析度輸出 (None 為不輸出)：一次聚合出數個距離間隔(km)，較粗的層由較細一層合併，
+    # method 為 'mean', 'max' 或 'fraction'；輸出 output_dir/{date}/{time}/{param}/pyramid_{param}.npz
+    'pyramid': None,
+    # 'pyramid': {'levels': (0.5, 1.0, 2.0, 4.0), 'method': "mean"},
+    # 單一 process (workers=1) 時背景預先讀檔、解壓縮的 thread 數 (0 為不預先讀取)
+    'prefetch': 4,
+    # 以每個欄位的整數編碼 (uint8/int16 code，見 radar_processing/quantize.py) 保存資料，
+    # 只在出圖與網格內插時換算成物理量
+    'quantize': False,
+    # 輸出: 每個 volume 一個 npy，以及/或每站每天一個可附加的分塊壓縮資料庫
+    # (資料庫為選用；mosaic、測站時間序列與點查詢需要啟用 archive)
+    'save_npy': True,
+    'archive': False,
+    # 增量處理：依 output_dir/manifest.json 跳過已是最新的 volume
+    'incremental': True,
+    # 笛卡兒網格 (None 為不輸出)：mode 為 '3d', 'cappi' (nz=1) 或 'column_max'；
+    # grid_shape 為 (nz, ny, nx)，grid_limits 為 z (海拔)、y、x (相對雷達站) 的範圍(m)
+    'gridding': None,
+    # 'gridding': {
+    #     'mode': "column_max",
+    #     'grid_shape': (20, 301, 301),
+    #     'grid_limits': ((500, 10000), (-150000, 150000), (-150000, 150000)),
+    # },
+    # WebMercator (XYZ) PNG tile pyramid (None 為不輸出)：zooms 為 (最小, 最大) zoom，
+    # composite 輸出垂直最大值，layers 另外輸出的單層；全部缺失的 tile 不輸出，
+    # 輸出 output_dir/tiles/{date}/{time}/{param}/{composite|layerNN}/{z}/{x}/{y}.png
+    'tiles': None,
+    # 'tiles': {'zooms': (6, 9), 'composite': True, 'layers': [1], 'threads': 4},
+    # 最近 window 個掃描的逐格點累計 (None 為不累計)：最大值、超過 threshold 的次數，回波場另有
+    # Z-R (Z=200R^1.6) 降雨累積量(mm，每個掃描代表 interval_minutes 分)；
+    # 輸出 output_dir/rolling/{date}/{time}/rolling_{param}.npz，params 預設為全部 param_types
+    'rolling': None,
+    # 'rolling': {'window': 12, 'threshold': 35.0, 'interval_minutes': 7.5, 'params': ["bref_qc"]},
+    # 各階段 (解壓縮、解碼、重新網格化、出圖、存檔...) 的時間/記憶體記錄，
+    # 輸出 output_dir/telemetry.json (各階段百分位數) 與 telemetry.csv
+    'telemetry': False,
+    # 以 cProfile 分析的工作單位 ('date/time/param_type/layer'，例如 "20230101/2204/bref_qc/01")
+    'profile_unit': None,
+    # 即時處理模式 (python main.py --serve)：輪詢間隔(秒)、佇列上限 (None 為 2 倍 workers)、
+    # 第一層到達後等待其餘各層的最長時間(秒)
+    'poll_interval': 5.0,
+    'queue_size': None,
+    'volume_timeout': 600.0,
+    # 地面測站時間序列 (None 為不輸出)：由 output_dir/archive 取出各測站上方每一層的值，
+    # names 為 radar_processing/stations.py 中的測站 (None 為全部)，kernel 為 ray/gate 鄰近範圍，
+    # statistic 為 'center', 'mean', 'max' 或 'median'；輸出 output_dir/stations/{site}_{date}_{param}.csv
+    'stations': None,
+    # 'stations': {'names': ["Banqiao", "Hualien", "Taitung"], 'kernel': 1, 'statistic': "mean"},
+    # 本機查詢服務 (python main.py --query)：位址、埠號與 volume 快取上限(MB)
+    'query': {'host': "127.0.0.1", 'port': 8765, 'cache_mb': 1024},
+    # 多雷達 mosaic (None 為不輸出)：由 output_dir/archive 中各站的資料庫合併到台灣範圍的經緯度網格，
+    # rule 為 'max', 'nearest' (最近的雷達站) 或 'weighted' (距離加權)，resolution 單位為度；
+    # 每次執行只處理 site 一站，其他站需各自執行，output_dirs 指定各站資料庫所在的 output_dir
+    'mosaic': None,
+    # 'mosaic': {'sites': ["RCWF", "RCHL", "RCCG", "RCKT"], 'rule': "max", 'resolution': 0.01,
+    #            'output_dirs': {"RCHL": "output_RCHL", "RCCG": "output_RCCG", "RCKT": "output_RCKT"}},
 
     #'param_types': ["bref_qc", "bphi", "bspw", "bzdr", "bvel_da"]
 }
\ No newline at end of file
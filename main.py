@@ -1,58 +1,38 @@
+import argparse
 from configs import config
-from radar_processing.visualization import visualize_and_save,create_gif
-import os
-import numpy as np
-from radar_processing.radar_polar_processor import regrid_polar_data,create_radar_object_from_regridded
-from radar_processing.RadarDataProcessorClass import RadarDataProcessor
-
-def main(config):
-    input_dir = os.path.normpath(os.path.abspath(config['input_dir']))
-    output_dir = os.path.normpath(os.path.abspath(config['output_dir']))
-    dates = config['dates']
-    times = config['times']
-    param_types = config['param_types']
-
-    for date in dates:
-        date_output_dir = os.path.join(output_dir, date)  # 為每個日期創建資料夾
-        os.makedirs(date_output_dir, exist_ok=True)
-
-    for time in times:            
-        time_output_dir = os.path.join(date_output_dir, time)  # 為每個時間創建資料夾
-        os.makedirs(time_output_dir, exist_ok=True)
-
-        for param_type in param_types:
-            print(f"Processing {date} - {time} - {param_type}")
-
-            param_output_dir = os.path.join(time_output_dir, param_type)
-            os.makedirs(param_output_dir, exist_ok=True)
-
-            gif_path = os.path.join(param_output_dir, f"radar_animation_{param_type}.gif")
-            radar_matrix = []
-
-            # 處理 1-15 層
-            for layer_num in range(1, 16):
-                filename = os.path.join(input_dir, f"RCWF.{date}.{time}.{param_type}.{layer_num:02d}.gz")
-                if not os.path.exists(filename):
-                    print(f"File not found: {filename}")
-                    continue
-
-                radar_obj = RadarDataProcessor(filename)
-                new_data, new_header = regrid_polar_data(radar_obj)
-                radar, distances = create_radar_object_from_regridded(filename, new_data, radar_obj, new_header)
-
-                # 可視化並保存圖片
-                visualize_and_save(radar,layer_num, param_output_dir, date, time, param_type)
-
-                # 添加到三維矩陣
-                radar_matrix.append(new_data)
-
-            # 保存三維矩陣
-            if radar_matrix:
-                radar_matrix = np.stack(radar_matrix)
-                np.save(os.path.join(param_output_dir, f"radar_matrix_{param_type}.npy"), radar_matrix)
-
-                # 創建GIF
-                create_gif(param_output_dir, gif_path, date, time, param_type)
+from radar_processing.archive import require_archive
+from radar_processing.batch import run_batch
+
+
+def main(config, serve=False, query=False):
+    if query:
+        # 本機查詢服務：以 HTTP 查詢已處理的 volume (點、ray、sweep、時間序列)
+        from radar_processing.query import run_query_server
+        run_query_server(config)
+        return
+    if serve:
+        # 即時處理模式：監看 input_dir，檔案一到就處理，volume 到齊時輸出
+        from radar_processing.service import run_service
+        run_service(config)
+        return
+    # mosaic 與測站時間序列由資料庫讀取，在處理前就確認 archive 已啟用
+    for feature in ('mosaic', 'stations'):
+        if config.get(feature):
+            require_archive(config, feature)
+    # 將設定展開成 (date, time, param_type, layer) 工作單位，以 process pool 平行處理
+    run_batch(config)
+    if config.get('mosaic'):
+        # 由各站的資料庫合併多雷達 mosaic
+        from radar_processing.mosaic import run_mosaic
+        run_mosaic(config)
+    if config.get('stations'):
+        # 由各天的資料庫取出地面測站上方的時間序列
+        from radar_processing.stations import run_stations
+        run_stations(config)
 
 if __name__ == "__main__":
-    main(config)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', action='store_true', help='監看 input_dir 即時處理新檔案')
+    parser.add_argument('--query', action='store_true', help='執行本機查詢服務')
+    args = parser.parse_args()
+    main(config, serve=args.serve, query=args.query)
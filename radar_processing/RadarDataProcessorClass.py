@@ -1,19 +1,110 @@
+import glob
+import gzip
+import logging
+import os
 import struct
 import numpy as np
+from .quantize import encode
+from .telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+HEADER_END = 160  # after  160 units is data, before it is header info
+HEADER_FORMAT = '<16s36i'  # char(len=16)+36integers
+PAYLOAD_DTYPE = np.dtype('<i4')
+
 
 class RadarDataProcessor:
-    def __init__(self, fname):
+    def __init__(self, fname, dtype=np.float64, lazy=False):
+        """
+        讀取 CWB 極座標雷達二進位檔 (.gz 或未壓縮)
+
+        Parameters
+        ----------
+        fname : str
+            檔案路徑
+        dtype : data-type
+            data 換算成物理量時使用的資料型別 (例如 np.float32)
+        lazy : bool
+            True 時只解壓縮前 160 bytes 的 header，data 在第一次存取時才讀取
+        """
+        self.fname = fname
+        self.dtype = np.dtype(dtype)
+        self._raw = None
+        self._data = None
+        self._codes = None
+
+        if lazy:
+            with self._open() as fh:
+                self._parse_header(fh.read(HEADER_END))
+        else:
+            self._load()
 
+    @classmethod
+    def peek(cls, fname, dtype=np.float64):
+        """
+        只讀取 header 的輕量開檔 (elevation, nray/ngate, 時間, nyquist...)
+        """
+        return cls(fname, dtype=dtype, lazy=True)
+
+    @classmethod
+    def from_buffer(cls, buf, fname='<buffer>', dtype=np.float64):
+        """
+        由已解壓縮的檔案內容 (header + int32 資料) 建立物件，不另外複製資料
+
+        Parameters
+        ----------
+        buf : bytes-like
+            解壓縮後的完整檔案內容 (例如 read_sweep_bytes 的結果)
+        fname : str
+            對應的檔名 (用於判斷欄位與錯誤訊息)
+        """
+        obj = cls.__new__(cls)
+        obj.fname = fname
+        obj.dtype = np.dtype(dtype)
+        obj._raw = None
+        obj._data = None
+        obj._codes = None
+        obj._set_payload(bytes(buf[0:HEADER_END]),
+                         np.frombuffer(buf, dtype=PAYLOAD_DTYPE, offset=HEADER_END))
+        return obj
+
+    def _open(self):
+        if '.gz' in self.fname:
+            return gzip.open(self.fname)
+        return open(self.fname, "rb")
+
+    def _load(self):
+        fname = self.fname
         if '.gz' in fname:
-            import gzip
-            print('unzip files')
-            f = gzip.open(fname).read()
+            logger.debug('unzip file: %s', fname)
+            with stage('decompress', os.path.getsize(fname)):
+                buf = read_sweep_bytes(fname)
+            header_bytes = buf[0:HEADER_END]
+            # 直接以解壓縮後的 buffer 建立 int32 view，不另外複製
+            payload = np.frombuffer(buf, dtype=PAYLOAD_DTYPE, offset=HEADER_END)
         else:
-            f = open(fname, "rb").read()
-        header_end = 160  # after  160 units is data, before it is header info
+            with stage('decompress', os.path.getsize(fname)):
+                with self._open() as fh:
+                    header_bytes = fh.read(HEADER_END)
+                payload = np.memmap(fname, dtype=PAYLOAD_DTYPE, mode='r', offset=HEADER_END)
+        self._set_payload(header_bytes, payload)
+
+    def _set_payload(self, header_bytes, payload):
+        with stage('decode'):
+            self._parse_header(header_bytes)
+
+            n = self.nray*self.ngate
+            if payload.size != n:
+                raise ValueError(f'{self.fname}: expected {n} data values, got {payload.size}')
+            # 原始 int32 計數值，物理量在第一次存取 data 時才換算
+            self._raw = payload.reshape((self.nray, self.ngate), order='C')
+        logger.debug('data_shape: %s', self._raw.shape)
+
+    def _parse_header(self, header_bytes):
         # get header in format char(len=16)+36integers
-        header = struct.unpack('<16s36i', f[0:header_end])
-        print('header:', header)
+        header = struct.unpack(HEADER_FORMAT, header_bytes)
+        logger.debug('header: %s', header)
         info = np.array(header[1:-1])
         if (len(str(header[0], 'utf-8')) == 12):
             self.name = str(header[0], 'utf-8')[0:16:4]
@@ -24,9 +115,8 @@ class RadarDataProcessor:
         info_flt = info/info[0]
         self.radar_elev = info_flt[1]
         self.rlat = info_flt[2]
-        print('rlat:', self.rlat)
         self.rlon = info_flt[3]
-        print('rlon:', self.rlon)
+        logger.debug('rlat: %s, rlon: %s', self.rlat, self.rlon)
         self.yyyy = int(info_flt[4])
         self.mm = int(info_flt[5])
         self.dd = int(info_flt[6])
@@ -47,8 +137,68 @@ class RadarDataProcessor:
         self.var_scale = info_flt[20]
         self.var_miss = info[21]
         self.rf_miss = -44400
-        n = self.nray*self.ngate
-        data = struct.unpack('<'+str(n)+'i', f[header_end:])
-        self.data = np.reshape(data/self.var_scale,
-                               (self.nray, self.ngate), order='C')
-        print('data_shape:', self.data.shape)
\ No newline at end of file
+
+    @property
+    def raw(self):
+        """
+        原始 int32 計數值 (nray, ngate)，lazy 模式下第一次存取時才讀檔
+        """
+        if self._raw is None:
+            self._load()
+        return self._raw
+
+    @property
+    def data(self):
+        """
+        物理量資料 (raw / var_scale)，第一次存取時以 dtype 換算並保留
+        """
+        if self._data is None:
+            self._data = np.divide(self.raw, self.var_scale, dtype=self.dtype)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def codes(self, encoding):
+        """
+        直接由 raw 編碼成整數 code (nray, ngate)，不經過 float64 的 data
+
+        Parameters
+        ----------
+        encoding : quantize.Encoding
+            欄位的整數編碼
+
+        Returns
+        -------
+        np.ndarray
+            encoding.dtype 的 code，var_miss 為 encoding.missing (同一編碼只計算一次)
+        """
+        if self._codes is None or self._codes[0] != encoding:
+            values = np.divide(self.raw, self.var_scale, dtype=np.float32)
+            values[self.raw == self.var_miss] = np.nan
+            self._codes = (encoding, encode(values, encoding, missing_value=self.rf_miss))
+        return self._codes[1]
+
+    def valid_mask(self):
+        """
+        有效資料的遮罩 (排除 var_miss 與 rf_miss)
+        """
+        return ~((self.raw == self.var_miss) |
+                 (self.data == self.rf_miss) | np.isnan(self.data))
+
+
+def read_sweep_bytes(fname):
+    """
+    讀取並解壓縮整個 .gz 檔 (一次解壓縮，zlib 執行時會釋放 GIL，可在 thread 中平行)
+    """
+    with open(fname, 'rb') as fh:
+        return gzip.decompress(fh.read())
+
+
+def scan_directory(input_dir, pattern='*.gz'):
+    """
+    只讀取 header 掃描整個資料夾，回傳依檔名排序的 lazy RadarDataProcessor 列表
+    """
+    return [RadarDataProcessor.peek(fname)
+            for fname in sorted(glob.glob(os.path.join(input_dir, pattern)))]
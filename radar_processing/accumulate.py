@@ -0,0 +1,326 @@
+import datetime
+import os
+from collections import defaultdict
+import numpy as np
+from .archive import META_NAME, VolumeArchive
+from .quantize import MISSING_VALUE, decode, mask_var_miss, matrix_attrs
+from .radar_polar_processor import is_dbz_field
+
+# Marshall-Palmer Z = a R^b
+ZR_A = 200.0
+ZR_B = 1.6
+
+
+def rain_rate(dbz: np.ndarray, a: float = ZR_A, b: float = ZR_B, max_dbz: float = 55.0) -> np.ndarray:
+    """
+    由回波 (dBZ) 以 Z-R 關係換算降雨率 (mm/h)，超過 max_dbz 的回波 (可能為冰雹) 以 max_dbz 計算
+    """
+    dbz = np.minimum(dbz, max_dbz) if max_dbz is not None else dbz
+    return (10.0 ** (dbz / 10.0) / a) ** (1.0 / b)
+
+
+def scan_datetime(date: str, time: str) -> datetime.datetime:
+    return datetime.datetime.strptime(date + time, '%Y%m%d%H%M')
+
+
+class RollingAccumulator:
+    """
+    最近 window 個掃描的逐格點累計 (layer, ray, gate)
+
+    以 ring buffer 保存最近 window 個掃描的值，新的掃描取代最舊的一個；
+    超過門檻的次數與降雨累積量以加入新掃描、減去被取代掃描的方式增量更新，
+    不需要重新讀取先前的 volume。掃描不必依時間順序加入，永遠保留時間最新的 window 個。
+    """
+
+    def __init__(self, shape: tuple, window: int = 12, threshold: float = 35.0,
+                 interval_minutes: float = 7.5, rain: bool = True):
+        """
+        Parameters
+        ----------
+        shape : tuple
+            每個掃描的 (layer, ray, gate)
+        window : int
+            累計的掃描數
+        threshold : float
+            計算次數的門檻 (例如 35 dBZ)
+        interval_minutes : float
+            每個掃描代表的時間長度(分)，用於降雨累積量
+        rain : bool
+            是否以 Z-R 關係計算降雨累積量 (只適用於回波場)
+        """
+        self.shape = tuple(shape)
+        self.window = window
+        self.threshold = threshold
+        self.interval_hours = interval_minutes / 60.0
+        self.rain = rain
+        self.times = [None] * window
+        self._values = np.full((window,) + self.shape, np.nan, dtype=np.float32)
+        self._count = np.zeros(self.shape, dtype=np.int16)
+        self._depth = np.zeros((window,) + self.shape, dtype=np.float32) if rain else None
+        self._accumulation = np.zeros(self.shape, dtype=np.float64) if rain else None
+
+    def update(self, volume: np.ndarray, time: datetime.datetime, missing: float = -44400) -> bool:
+        """
+        加入一個掃描
+
+        Parameters
+        ----------
+        volume : np.ndarray
+            (layer, ray, gate) 的資料，缺失值為 missing 或 NaN
+        time : datetime.datetime
+            掃描時間
+
+        Returns
+        -------
+        bool
+            是否加入 (比 window 中所有掃描都舊時不加入)
+        """
+        if volume.shape != self.shape:
+            raise ValueError(f"volume shape {volume.shape} does not match accumulator {self.shape}")
+        if time in self.times:
+            slot = self.times.index(time)  # 同一時間重新處理時取代舊的值
+        elif None in self.times:
+            slot = self.times.index(None)
+        else:
+            slot = min(range(self.window), key=lambda i: self.times[i])
+            if time < self.times[slot]:
+                return False
+
+        values = np.where(volume == missing, np.nan, volume).astype(np.float32)
+        with np.errstate(invalid='ignore'):
+            above = values >= self.threshold
+            self._count -= self._values[slot] >= self.threshold
+        self._count += above
+        self._values[slot] = values
+        if self.rain:
+            depth = np.nan_to_num(rain_rate(values) * self.interval_hours).astype(np.float32)
+            self._accumulation += depth
+            self._accumulation -= self._depth[slot]
+            self._depth[slot] = depth
+        self.times[slot] = time
+        return True
+
+    @property
+    def count(self) -> int:
+        """
+        window 中的掃描數
+        """
+        return sum(t is not None for t in self.times)
+
+    @property
+    def latest(self):
+        times = [t for t in self.times if t is not None]
+        return max(times) if times else None
+
+    def max(self) -> np.ndarray:
+        """
+        逐格點最大值 (全部缺失時為 NaN)
+        """
+        return np.fmax.reduce(self._values, axis=0)
+
+    def count_above(self) -> np.ndarray:
+        """
+        逐格點超過門檻的掃描數
+        """
+        return self._count.copy()
+
+    def accumulation(self) -> np.ndarray:
+        """
+        逐格點降雨累積量 (mm)
+        """
+        if not self.rain:
+            raise ValueError("rain accumulation is disabled for this accumulator")
+        # 增量更新的浮點誤差可能留下極小的負值
+        return np.maximum(self._accumulation, 0.0).astype(np.float32)
+
+    def products(self) -> dict:
+        """
+        目前所有的累計產品
+        """
+        products = {'max': self.max(), 'count_above': self.count_above()}
+        if self.rain:
+            products['accumulation'] = self.accumulation()
+        return products
+
+
+def update_rolling(accumulators: dict, key: tuple, volume: np.ndarray, layer_nums: list,
+                   settings: dict, save: bool = True):
+    """
+    將組合完成的 volume 加入該參數的 RollingAccumulator，並輸出目前的累計產品到
+    output_dir/rolling/{date}/{time}/rolling_{param_type}.npz (時間為 window 中最新的掃描)；
+    save=False 時只更新累計狀態
+
+    Parameters
+    ----------
+    accumulators : dict
+        param_type -> RollingAccumulator，在整個批次 / 服務期間保留
+    key : tuple
+        (date, time, param_type)
+    volume : np.ndarray
+        (len(layer_nums), ray, gate) 的物理量 (缺失為 -44400)
+    layer_nums : list
+        volume 各層的層數，缺少的層以缺失值補上
+    settings : dict
+        batch_settings 的結果
+
+    Returns
+    -------
+    str or None
+        輸出路徑；掃描比 window 中所有掃描都舊而未加入或 save=False 時為 None
+    """
+    date, time, param_type = key
+    options = settings['rolling']
+    layer_order = settings['layers']
+    full = np.full((len(layer_order),) + volume.shape[1:], MISSING_VALUE, dtype=np.float32)
+    full[[layer_order.index(n) for n in layer_nums]] = volume
+
+    accumulator = accumulators.get(param_type)
+    if accumulator is None:
+        accumulator = accumulators[param_type] = RollingAccumulator(
+            full.shape, options['window'], options['threshold'], options['interval_minutes'],
+            rain=is_dbz_field(param_type))
+    if not accumulator.update(full, scan_datetime(date, time)):
+        print(f"Older than rolling window, skipped: {date} - {time} - {param_type}")
+        return None
+    if not save:
+        return None
+
+    latest = accumulator.latest
+    rolling_dir = os.path.join(settings['output_dir'], 'rolling', latest.strftime('%Y%m%d'),
+                               latest.strftime('%H%M'))
+    os.makedirs(rolling_dir, exist_ok=True)
+    path = os.path.join(rolling_dir, f"rolling_{param_type}.npz")
+    times = sorted(t.strftime('%Y%m%d%H%M') for t in accumulator.times if t is not None)
+    np.savez(path, layers=np.array(layer_order), times=np.array(times),
+             threshold=accumulator.threshold, **accumulator.products())
+    return path
+
+
+def load_processed_volume(settings: dict, key: tuple, layer_nums: list):
+    """
+    讀回先前處理過的 volume：優先使用每站每天的資料庫，否則使用 radar_matrix npy
+
+    Returns
+    -------
+    Tuple[np.ndarray, list] or None
+        (layer, ray, gate) 的物理量 (缺失為 -44400) 與各層的層數；都不存在時為 None
+    """
+    date, time, param_type = key
+    path = os.path.join(settings['output_dir'], 'archive', f"{settings['site']}_{date}")
+    if os.path.exists(os.path.join(path, META_NAME)):
+        archive = VolumeArchive(path)
+        layers = [n for n in layer_nums if (time, param_type, n) in archive]
+        if layers:
+            return archive.read([time], [param_type], layers)[0, 0], layers
+    npy_path = os.path.join(settings['output_dir'], date, time, param_type, f"radar_matrix_{param_type}.npy")
+    if not os.path.exists(npy_path):
+        return None
+    data = np.load(npy_path)
+    if data.shape[0] != len(layer_nums):
+        return None
+    encoding, var_miss = matrix_attrs(npy_path)
+    if encoding is not None:
+        data = decode(data, encoding)
+    elif var_miss:
+        data = mask_var_miss(data, var_miss)
+    return data, sorted(layer_nums)
+
+
+class RollingFeed:
+    """
+    依時間順序將組合完成的 volume 加入各參數的 RollingAccumulator
+
+    process pool 依完成順序回傳結果，比同一參數較早的掃描先完成的 volume 暫存到前面的都加入後才加入；
+    增量處理跳過、但在之後某個要處理的掃描的 window 內的 volume 輪到時由資料庫或 npy 讀回，
+    只更新累計狀態、不重新輸出；跳過的掃描的 window 內有重新處理的 volume 時，
+    它的累計產品也要重新輸出 (同樣由資料庫或 npy 讀回)。沒有排定的 volume (例如即時處理模式) 直接加入。
+    """
+
+    def __init__(self, settings: dict, keys=(), skipped: dict = None):
+        """
+        Parameters
+        ----------
+        settings : dict
+            batch_settings 的結果
+        keys : iterable
+            這次會組合的 volume (date, time, param_type)
+        skipped : dict, optional
+            增量處理跳過的 volume -> 層數
+        """
+        self.settings = settings
+        self.accumulators = {}
+        self.pending = {}
+        keys = set(keys)
+        skipped = skipped or {}
+        window = settings['rolling']['window']
+        by_param = defaultdict(list)
+        for key in keys | set(skipped):
+            by_param[key[2]].append(key)
+        # 要處理的掃描之後 window 個以內的跳過的 volume 需要重新輸出累計產品，
+        # 並讀回每個要輸出的掃描之前 window 個以內的其他跳過的 volume
+        self.seeds = {}
+        self.rebuild = {}
+        self.queues = {}
+        for param_type, param_keys in by_param.items():
+            param_keys.sort()
+            rebuild = set()
+            for i, key in enumerate(param_keys):
+                if key in keys:
+                    rebuild.update(k for k in param_keys[i + 1:i + window] if k not in keys)
+            needed = set()
+            for i, key in enumerate(param_keys):
+                if key in keys or key in rebuild:
+                    needed.update(k for k in param_keys[max(i - window, 0):i] if k not in keys | rebuild)
+            self.seeds.update((key, skipped[key]) for key in needed)
+            self.rebuild.update((key, skipped[key]) for key in rebuild)
+            self.queues[param_type] = [key for key in param_keys if key in keys or key in needed | rebuild]
+
+    def add(self, key: tuple, volume: np.ndarray, layer_nums: list) -> list:
+        """
+        加入一個組合完成的 volume
+
+        Returns
+        -------
+        list
+            這次輸出的累計產品路徑 (可能包含先前暫存的 volume)
+        """
+        queue = self.queues.get(key[2])
+        if not queue or key not in queue:
+            path = update_rolling(self.accumulators, key, volume, layer_nums, self.settings)
+            return [path] if path else []
+        self.pending[key] = (volume, layer_nums)
+        return self._flush(key[2])
+
+    def discard(self, key: tuple) -> list:
+        """
+        排定的 volume 沒有結果 (例如所有層都讀取失敗)，後面的 volume 不再等待它
+        """
+        queue = self.queues.get(key[2])
+        if not queue or key not in queue:
+            return []
+        queue.remove(key)
+        return self._flush(key[2])
+
+    def _flush(self, param_type: str) -> list:
+        queue = self.queues[param_type]
+        paths = []
+        while queue:
+            key = queue[0]
+            if key in self.seeds or key in self.rebuild:
+                save = key in self.rebuild
+                loaded = load_processed_volume(self.settings, key, (self.rebuild if save else self.seeds).pop(key))
+                if loaded is None:
+                    print(f"No processed volume to seed the rolling window: {' - '.join(key)}")
+                else:
+                    path = update_rolling(self.accumulators, key, loaded[0], loaded[1], self.settings, save=save)
+                    if path:
+                        paths.append(path)
+            elif key in self.pending:
+                volume, layer_nums = self.pending.pop(key)
+                path = update_rolling(self.accumulators, key, volume, layer_nums, self.settings)
+                if path:
+                    paths.append(path)
+            else:
+                break
+            queue.pop(0)
+        return paths
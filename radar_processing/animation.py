@@ -0,0 +1,91 @@
+import itertools
+import os
+import shutil
+import subprocess
+from PIL import Image
+
+ANIMATION_FORMATS = {'gif': '.gif', 'apng': '.png', 'mp4': '.mp4'}
+
+
+def to_palette(frame: Image.Image) -> Image.Image:
+    """
+    將畫面轉成 'P' 模式供動畫使用
+
+    已是 'P' 模式的畫面 (raster 出圖，使用共用調色盤) 直接回傳；其他畫面 (Basemap 出圖，
+    含地圖的灰階與反鋸齒顏色，不在色表中) 以各自的自適應調色盤量化，避免被對應到色表上的顏色
+    """
+    if frame.mode == 'P':
+        return frame
+    return frame.convert('RGB').quantize(256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+
+def write_animation(frames, path: str, fmt: str = 'gif', duration: int = 500) -> str:
+    """
+    將記憶體中的畫面直接寫成動畫，不經過 png 檔
+
+    Parameters
+    ----------
+    frames : iterable of PIL.Image
+        依序的畫面
+    path : str
+        輸出路徑
+    fmt : str
+        'gif', 'apng' 或 'mp4' (需要系統有 ffmpeg)
+    duration : int
+        每張畫面的顯示時間(ms)
+
+    Returns
+    -------
+    str
+        輸出路徑
+    """
+    if fmt not in ANIMATION_FORMATS:
+        raise ValueError(f"Unknown animation format: {fmt}")
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError("No frames to write")
+
+    if fmt == 'mp4':
+        return _write_mp4(first, frames, path, duration)
+
+    first = to_palette(first)
+    rest = (to_palette(frame) for frame in frames)
+    if fmt == 'gif':
+        # GIF 每張畫面可以有自己的調色盤
+        first.save(path, save_all=True, append_images=rest, loop=0, duration=duration)
+    else:
+        # PIL 的 APNG 寫入器需要 list，且所有畫面只使用第一張的調色盤；調色盤不同時改存 RGB
+        rest = list(rest)
+        palette = first.getpalette()
+        if any(frame.getpalette() != palette for frame in rest):
+            first, rest = first.convert('RGB'), [frame.convert('RGB') for frame in rest]
+        first.save(path, format='PNG', save_all=True, append_images=rest, loop=0,
+                   duration=duration, compress_level=1)
+    return path
+
+
+def _write_mp4(first, frames, path, duration):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is required to write mp4 animations")
+    width, height = first.size
+    cmd = [ffmpeg, '-y', '-loglevel', 'error',
+           '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+           '-framerate', f'{1000.0 / duration}', '-i', '-',
+           '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', path]
+    # 逐張寫入 ffmpeg 的 stdin，不保留所有畫面
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE) as proc:
+        for frame in itertools.chain([first], frames):
+            proc.stdin.write(frame.convert('RGB').tobytes())
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed writing {path}")
+    return path
+
+
+def animation_path(output_dir: str, name: str, fmt: str = 'gif') -> str:
+    """
+    動畫輸出路徑 (依格式決定副檔名)
+    """
+    return os.path.join(output_dir, name + ANIMATION_FORMATS[fmt])
@@ -0,0 +1,287 @@
+import json
+import os
+import zlib
+import numpy as np
+from .quantize import decode, encoding_attrs, encoding_from_attrs
+
+META_NAME = 'meta.json'
+INDEX_NAME = 'index.jsonl'
+CHUNKS_NAME = 'chunks.bin'
+
+
+class VolumeArchive:
+    """
+    可附加的分塊壓縮 volume 資料庫 (每個站、每天一個)
+
+    邏輯維度為 time × param × layer × ray × gate，每個 (time, param, layer)
+    sweep 是一個 chunk，依序附加到 chunks.bin (重新處理時盡量寫回原位置)；
+    index.jsonl 逐行記錄每個 chunk 的位置。讀取時只解壓縮需要的 chunk，未壓縮 (compression=0) 的 chunk 以
+    np.memmap 直接對應，不需讀入整個檔案。
+
+    參數可設定整數編碼 (set_encoding)，該參數的 chunk 以 code 保存，
+    read 時才換算成物理量。
+    """
+
+    def __init__(self, path: str, shape: tuple = None, dtype='float32',
+                 fill_value: float = -44400, compression: int = 6, attrs: dict = None):
+        """
+        開啟 (不存在時建立) 資料庫
+
+        Parameters
+        ----------
+        path : str
+            資料庫資料夾
+        shape : tuple
+            每個 sweep 的 (nray, ngate)，建立新資料庫時必須提供
+        dtype : data-type
+            資料型別
+        fill_value : float
+            讀取時缺少的 chunk 填入的缺失值
+        compression : int
+            zlib 壓縮等級 (0 表示不壓縮，可用 memmap 讀取)
+        attrs : dict, optional
+            資料庫層級的屬性 (站點位置、網格設定等)
+        """
+        self.path = path
+        meta_path = os.path.join(path, META_NAME)
+        if os.path.exists(meta_path):
+            with open(meta_path) as fh:
+                meta = json.load(fh)
+        else:
+            if shape is None:
+                raise ValueError(f"{path} does not exist and no sweep shape was given")
+            os.makedirs(path, exist_ok=True)
+            meta = {'shape': [int(n) for n in shape], 'dtype': np.dtype(dtype).str,
+                    'fill_value': fill_value, 'compression': int(compression),
+                    'attrs': attrs or {}}
+            _write_json(meta_path, meta)
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.fill_value = meta['fill_value']
+        self.compression = meta['compression']
+        self.attrs = meta['attrs']
+        self._meta = meta
+        self._encodings = {param: encoding_from_attrs(attrs)
+                           for param, attrs in meta.get('encodings', {}).items()}
+        self._chunks_path = os.path.join(path, CHUNKS_NAME)
+        self._index_path = os.path.join(path, INDEX_NAME)
+        self._index = {}
+        self._lines = 0  # index.jsonl 的行數 (含被取代的記錄)
+        self._load_index()
+
+    @classmethod
+    def for_day(cls, output_dir: str, site: str, date: str, **kwargs) -> "VolumeArchive":
+        """
+        開啟某站某天的資料庫 (output_dir/archive/{site}_{date})
+        """
+        return cls(os.path.join(output_dir, 'archive', f"{site}_{date}"), **kwargs)
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path) as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 寫入中斷留下的不完整行
+                    continue
+                self._index[(entry['time'], entry['param'], entry['layer'])] = entry
+                self._lines += 1
+
+    def update_attrs(self, **attrs):
+        """
+        更新資料庫層級的屬性
+        """
+        self.attrs.update(attrs)
+        _write_json(os.path.join(self.path, META_NAME), self._meta)
+
+    def encoding(self, param: str):
+        """
+        參數的整數編碼 (quantize.Encoding)，未設定時為 None
+        """
+        return self._encodings.get(str(param))
+
+    def set_encoding(self, param: str, encoding):
+        """
+        設定參數的整數編碼；已有該參數的 chunk 後不能變更
+        """
+        param = str(param)
+        if self._encodings.get(param) == encoding:
+            return
+        if param in self.params:
+            raise ValueError(f"{self.path}: {param} already has chunks, cannot change its encoding")
+        self._encodings[param] = encoding
+        self._meta.setdefault('encodings', {})[param] = encoding_attrs(encoding)
+        _write_json(os.path.join(self.path, META_NAME), self._meta)
+
+    def _chunk_dtype(self, param: str):
+        encoding = self._encodings.get(param)
+        return self.dtype if encoding is None else np.dtype(encoding.dtype)
+
+    def append(self, time: str, param: str, layer: int, data: np.ndarray, **attrs):
+        """
+        附加一個 sweep；同一個 (time, param, layer) 再次附加時以新的為準
+
+        重新處理 (再次附加) 時，新資料不超過原本 chunk 的空間 (未壓縮時大小一定相同) 就寫回原位置，
+        chunks.bin 不會因重新處理而一直變大；index.jsonl 中被取代的記錄過多時重寫 index。
+
+        Parameters
+        ----------
+        time : str
+            掃描時間 (例如 '2204')
+        param : str
+            參數名稱 (例如 'bref_qc')
+        layer : int
+            層數
+        data : np.ndarray
+            (nray, ngate) 的資料 (有設定編碼的參數為整數 code)
+        attrs
+            此 sweep 的屬性 (例如仰角 theta)
+        """
+        dtype = self._chunk_dtype(str(param))
+        if not np.can_cast(data.dtype, dtype, casting='same_kind'):
+            raise TypeError(f"cannot store {data.dtype} data in {param} ({dtype})")
+        data = np.ascontiguousarray(data, dtype=dtype)
+        if data.shape != self.shape:
+            raise ValueError(f"sweep shape {data.shape} does not match archive shape {self.shape}")
+        payload = data.tobytes()
+        if self.compression:
+            payload = zlib.compress(payload, self.compression)
+
+        key = (str(time), str(param), int(layer))
+        previous = self._index.get(key)
+        capacity = previous.get('capacity', previous['nbytes']) if previous else 0
+        if len(payload) <= capacity:
+            # 寫回原本的 chunk (中斷時這個 sweep 可能不完整，重新處理即可)
+            offset = previous['offset']
+            with open(self._chunks_path, 'r+b') as fh:
+                fh.seek(offset)
+                fh.write(payload)
+        else:
+            # 先寫資料再寫 index，中斷時只會留下沒有 index 的資料
+            with open(self._chunks_path, 'ab') as fh:
+                offset = fh.tell()
+                fh.write(payload)
+            capacity = len(payload)
+        entry = {'time': key[0], 'param': key[1], 'layer': key[2],
+                 'offset': offset, 'nbytes': len(payload), 'capacity': capacity,
+                 'compressed': bool(self.compression), 'attrs': attrs}
+        self._index[key] = entry
+        if self._lines >= 2 * len(self._index) + 16:
+            self._rewrite_index()
+        else:
+            with open(self._index_path, 'a') as fh:
+                fh.write(json.dumps(entry) + '\n')
+            self._lines += 1
+
+    def _rewrite_index(self):
+        # 只保留目前的記錄，先寫暫存檔再取代
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            for entry in self._index.values():
+                fh.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self._index_path)
+        self._lines = len(self._index)
+
+    def append_volume(self, time: str, param: str, volume: np.ndarray, layers=None, layer_attrs=None):
+        """
+        附加整個 volume (layer, nray, ngate)
+
+        Parameters
+        ----------
+        layers : list, optional
+            每個 sweep 的層數，預設為 1, 2, ...
+        layer_attrs : list, optional
+            每個 sweep 的屬性
+        """
+        layers = layers if layers is not None else range(1, len(volume) + 1)
+        layer_attrs = layer_attrs if layer_attrs is not None else [{}] * len(volume)
+        for layer, sweep, attrs in zip(layers, volume, layer_attrs):
+            self.append(time, param, layer, sweep, **attrs)
+
+    def __contains__(self, key) -> bool:
+        time, param, layer = key
+        return (str(time), str(param), int(layer)) in self._index
+
+    @property
+    def times(self) -> list:
+        return sorted({key[0] for key in self._index})
+
+    @property
+    def params(self) -> list:
+        return sorted({key[1] for key in self._index})
+
+    @property
+    def layers(self) -> list:
+        return sorted({key[2] for key in self._index})
+
+    def chunk_attrs(self, time: str, param: str, layer: int) -> dict:
+        """
+        某個 sweep 的屬性
+        """
+        return self._index[(str(time), str(param), int(layer))]['attrs']
+
+    def read_chunk(self, time: str, param: str, layer: int, decoded: bool = True) -> np.ndarray:
+        """
+        讀取單一 sweep；未壓縮且未編碼 (或 decoded=False) 的 chunk 回傳唯讀 memmap
+
+        decoded=False 時有編碼的參數回傳整數 code
+        """
+        entry = self._index[(str(time), str(param), int(layer))]
+        dtype = self._chunk_dtype(entry['param'])
+        if not entry['compressed']:
+            data = np.memmap(self._chunks_path, dtype=dtype, mode='r',
+                             offset=entry['offset'], shape=self.shape)
+        else:
+            with open(self._chunks_path, 'rb') as fh:
+                fh.seek(entry['offset'])
+                payload = fh.read(entry['nbytes'])
+            data = np.frombuffer(zlib.decompress(payload), dtype=dtype).reshape(self.shape)
+        encoding = self._encodings.get(entry['param'])
+        if decoded and encoding is not None:
+            return decode(data, encoding, dtype=self.dtype, fill_value=self.fill_value)
+        return data
+
+    def read(self, times=None, params=None, layers=None) -> np.ndarray:
+        """
+        讀取 time × param × layer × ray × gate 的切片，只讀取選到的 chunk
+
+        Parameters
+        ----------
+        times, params, layers : list, optional
+            要讀取的時間、參數與層數，預設為全部
+
+        Returns
+        -------
+        np.ndarray
+            (len(times), len(params), len(layers), nray, ngate)，缺少的 sweep 為 fill_value
+        """
+        times = self.times if times is None else [str(t) for t in times]
+        params = self.params if params is None else [str(p) for p in params]
+        layers = self.layers if layers is None else [int(n) for n in layers]
+        out = np.full((len(times), len(params), len(layers)) + self.shape,
+                      self.fill_value, dtype=self.dtype)
+        for i, time in enumerate(times):
+            for j, param in enumerate(params):
+                for k, layer in enumerate(layers):
+                    if (time, param, layer) in self._index:
+                        out[i, j, k] = self.read_chunk(time, param, layer)
+        return out
+
+
+def require_archive(config: dict, feature: str):
+    """
+    mosaic、測站時間序列等由資料庫讀取的功能在 archive 未啟用時直接停止 (而不是找不到資料)
+    """
+    if not config.get('archive'):
+        raise ValueError(f"'{feature}' reads the per-site archives in output_dir/archive, "
+                         f"but 'archive' is disabled; set 'archive': True in the config")
+
+
+def _write_json(path: str, obj: dict):
+    # 先寫暫存檔再取代，避免中斷時留下不完整的檔案
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(obj, fh, indent=1)
+    os.replace(tmp_path, path)
@@ -0,0 +1,535 @@
+import json
+import os
+import sys
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .RadarDataProcessorClass import RadarDataProcessor
+from .archive import VolumeArchive
+from .geometry import check_shapefile
+from .manifest import Manifest
+from .quantize import MISSING_VALUE, decode, encoding_attrs, mask_var_miss, output_encoding
+from .telemetry import Recorder, profiled, recording, stage, write_report
+from .radar_polar_processor import (regrid_polar_data, regrid_pyramid, create_radar_object_from_regridded,
+                                    var_miss_value)
+
+# 出圖相關的模組 (PIL, matplotlib, pyart, Basemap) 只在需要出圖時才載入，
+# 純資料模式 (render=False) 的 worker 不會 import 它們
+
+# 一個工作單位：某日期、某時間、某參數的某一層
+WorkUnit = namedtuple('WorkUnit', ['date', 'time', 'param_type', 'layer_num'])
+
+LAYERS = tuple(range(1, 16))  # 處理 1-15 層
+
+
+def expand_work_units(config: dict) -> list:
+    """
+    將設定展開成互相獨立的 (date, time, param_type, layer) 工作單位
+    """
+    layers = config.get('layers', LAYERS)
+    return [WorkUnit(date, time, param_type, layer_num)
+            for date in config['dates']
+            for time in config['times']
+            for param_type in config['param_types']
+            for layer_num in layers]
+
+
+def volume_key(unit: WorkUnit) -> tuple:
+    """
+    工作單位所屬的 volume (date, time, param_type)
+    """
+    return (unit.date, unit.time, unit.param_type)
+
+
+def input_filename(input_dir: str, unit: WorkUnit, site: str = 'RCWF') -> str:
+    """
+    工作單位對應的輸入檔案路徑
+    """
+    return os.path.join(input_dir,
+                        f"{site}.{unit.date}.{unit.time}.{unit.param_type}.{unit.layer_num:02d}.gz")
+
+
+def volume_output_dir(output_dir: str, date: str, time: str, param_type: str) -> str:
+    """
+    volume 的輸出資料夾 (output_dir/date/time/param_type)，不存在時建立
+    """
+    param_output_dir = os.path.join(output_dir, date, time, param_type)
+    os.makedirs(param_output_dir, exist_ok=True)
+    return param_output_dir
+
+
+def batch_settings(config: dict) -> dict:
+    """
+    整理設定：轉換成絕對路徑並補上預設值，傳給每個 worker
+    """
+    settings = {
+        'input_dir': os.path.normpath(os.path.abspath(config['input_dir'])),
+        'output_dir': os.path.normpath(os.path.abspath(config['output_dir'])),
+        'site': config.get('site', 'RCWF'),
+        'regrid_method': config.get('regrid_method', 'nearest'),
+        'render': config.get('render', True),
+        'renderer': config.get('renderer', 'basemap'),
+        'save_png': config.get('save_png', True),
+        'animation_format': config.get('animation_format', 'gif'),
+        'frame_duration': config.get('frame_duration', 500),
+        'workers': config.get('workers') or os.cpu_count() or 1,
+        'save_npy': config.get('save_npy', True),
+        'archive': config.get('archive', False),
+        'incremental': config.get('incremental', True),
+        'gridding': _gridding_settings(config.get('gridding')),
+        'pyramid': _pyramid_settings(config.get('pyramid')),
+        'tiles': _tiles_settings(config.get('tiles')),
+        'rolling': _rolling_settings(config.get('rolling'), config['param_types']),
+        'layers': list(config.get('layers', LAYERS)),
+        'quantize': config.get('quantize', False),
+        'prefetch': config.get('prefetch', 4),
+        'telemetry': config.get('telemetry', False),
+        'profile_unit': config.get('profile_unit'),
+    }
+    # 出圖需要縣市界線，在處理前就檢查，避免每一層都出圖失敗
+    if settings['render']:
+        check_shapefile()
+    return settings
+
+
+def _gridding_settings(gridding: dict):
+    """
+    笛卡兒網格設定 (轉成 list 以便與 manifest 中的 JSON 比較)
+    """
+    if not gridding:
+        return None
+    settings = {'mode': gridding.get('mode', 'column_max'),
+                'grid_shape': [int(n) for n in gridding['grid_shape']],
+                'grid_limits': [[float(v) for v in lim] for lim in gridding['grid_limits']]}
+    # 在處理前就檢查，避免處理完才在組合 volume 時失敗
+    if settings['mode'] == 'cappi' and settings['grid_shape'][0] != 1:
+        raise ValueError(f"gridding mode 'cappi' needs nz=1 in grid_shape, got {settings['grid_shape']}")
+    return settings
+
+
+def _pyramid_settings(pyramid: dict):
+    """
+    多解析度設定 (levels 為由細到粗的距離間隔 km)
+    """
+    if not pyramid:
+        return None
+    return {'levels': sorted(float(sp) for sp in pyramid.get('levels', (0.5, 1.0, 2.0, 4.0))),
+            'method': pyramid.get('method', 'mean')}
+
+
+def _tiles_settings(tiles: dict):
+    """
+    tile pyramid 設定：zooms 為 (最小, 最大) zoom，展開成 list
+    """
+    if not tiles:
+        return None
+    zoom_min, zoom_max = tiles.get('zooms', (6, 9))
+    return {'zooms': list(range(int(zoom_min), int(zoom_max) + 1)),
+            'composite': bool(tiles.get('composite', True)),
+            'layers': [int(n) for n in tiles.get('layers', [])],
+            'vmin': float(tiles.get('vmin', 0)),
+            'vmax': float(tiles.get('vmax', 65)),
+            'threads': int(tiles.get('threads', 4))}
+
+
+def _rolling_settings(rolling: dict, param_types: list):
+    """
+    時間累計設定 (None 為不累計)
+    """
+    if not rolling:
+        return None
+    return {'window': int(rolling.get('window', 12)),
+            'threshold': float(rolling.get('threshold', 35.0)),
+            'interval_minutes': float(rolling.get('interval_minutes', 7.5)),
+            'params': list(rolling.get('params', param_types))}
+
+
+def manifest_params(settings: dict) -> dict:
+    """
+    影響輸出內容的處理參數 (記錄在 manifest 中)
+    """
+    return {k: settings[k] for k in ('site', 'regrid_method', 'render', 'renderer', 'save_png',
+                                   'animation_format', 'frame_duration', 'save_npy', 'archive',
+                                   'gridding', 'pyramid', 'tiles', 'rolling', 'quantize')}
+
+
+def manifest_key(key: tuple) -> str:
+    return '/'.join(key)
+
+
+def unit_label(unit: WorkUnit) -> str:
+    """
+    工作單位的名稱 (date/time/param_type/layer)，用於 telemetry 與 profile_unit
+    """
+    return f"{unit.date}/{unit.time}/{unit.param_type}/{unit.layer_num:02d}"
+
+
+def _init_worker():
+    # worker 不需要互動式視窗，使用 headless backend (不為此提前載入 matplotlib)
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
+    else:
+        os.environ['MPLBACKEND'] = 'Agg'
+
+
+def process_unit(unit: WorkUnit, settings: dict, radar_obj: RadarDataProcessor = None,
+                 prefetch_records: list = None):
+    """
+    處理單一層：讀檔、重新網格化、繪圖
+
+    radar_obj 為已預先讀取的資料 (見 prefetch)，None 時在此讀檔；
+    prefetch_records 為預先讀取時在背景 thread 中的階段記錄，加到此工作單位的記錄中
+
+    Returns
+    -------
+    Tuple[WorkUnit, dict or None]
+        工作單位與處理結果 (檔案不存在時為 None)；結果包含重新網格化後的
+        資料 'data' (quantize 時為整數 code，編碼為 'encoding'；'nearest' 的浮點數輸出中
+        原始 var_miss 的值為 'var_miss')、新的 header 'header'、
+        多解析度的 (資料, header) 列表 'pyramid' (未啟用時為 None)、
+        組合 volume 需要的站點資訊，以及啟用 telemetry 時各階段的記錄 'telemetry'
+    """
+    filename = input_filename(settings['input_dir'], unit, settings['site'])
+    if radar_obj is None and not os.path.exists(filename):
+        print(f"File not found: {filename}")
+        return unit, None
+
+    label = unit_label(unit)
+    recorder = Recorder(label) if settings['telemetry'] else None
+    if recorder and prefetch_records:
+        recorder.extend(dict(record, unit=label) for record in prefetch_records)
+    profile_path = None
+    if settings['profile_unit'] == label:
+        os.makedirs(settings['output_dir'], exist_ok=True)
+        profile_path = os.path.join(settings['output_dir'], f"profile_{label.replace('/', '_')}.prof")
+
+    with recording(recorder), profiled(profile_path):
+        if radar_obj is None:
+            radar_obj = RadarDataProcessor(filename)
+        # quantize 時整個流程保留整數 code，只在出圖與網格內插時換算成物理量
+        encoding = output_encoding(unit.param_type, settings['regrid_method']) if settings['quantize'] else None
+        with stage('decode'):
+            if encoding is not None and settings['regrid_method'] == 'nearest':
+                radar_obj.codes(encoding)
+            else:
+                radar_obj.data
+        with stage('regrid'):
+            new_data, new_header = regrid_polar_data(radar_obj, method=settings['regrid_method'],
+                                                     encoding=encoding)
+        # 多解析度：最細一層由原始資料聚合，較粗的層由前一層合併
+        pyramid = None
+        if settings['pyramid']:
+            with stage('pyramid'):
+                pyramid = regrid_pyramid(radar_obj, settings['pyramid']['levels'],
+                                         method=settings['pyramid']['method'])
+
+        # 可視化 (畫面留在記憶體中，png 視設定保存)；純資料模式不出圖
+        frame, png_path = None, None
+        if settings['render']:
+            values = new_data if encoding is None else decode(new_data, encoding)
+            frame, png_path = render_layer(unit, filename, radar_obj, values, new_header, settings)
+    return unit, {
+        'data': new_data,
+        'encoding': encoding,
+        'header': new_header,
+        'pyramid': pyramid,
+        'theta': float(radar_obj.theta),
+        'var_miss': var_miss_value(radar_obj) if encoding is None and settings['regrid_method'] == 'nearest' else None,
+        'site': {'name': radar_obj.name, 'rlat': float(radar_obj.rlat),
+                 'rlon': float(radar_obj.rlon), 'radar_elev': float(radar_obj.radar_elev)},
+        'frame': frame,
+        'outputs': [png_path] if png_path else [],
+        'telemetry': recorder.records if recorder else [],
+    }
+
+
+def render_layer(unit: WorkUnit, filename: str, radar_obj: RadarDataProcessor,
+                 new_data: np.ndarray, new_header: dict, settings: dict):
+    """
+    依設定的 renderer 出圖
+
+    'raster' 以預先計算的像素查表直接出圖；'basemap' 建立 pyart Radar 物件後以 Basemap 繪製
+
+    Returns
+    -------
+    Tuple[PIL.Image, str or None]
+        動畫用的 'P' 模式畫面 (見 animation.to_palette)，以及 png 路徑 (不保存 png 時為 None)
+    """
+    title = f'{unit.date}{unit.time}_layer_{unit.layer_num:02d}_{unit.param_type}'
+    if settings['renderer'] == 'raster':
+        from .raster import get_raster_renderer
+        with stage('render'):
+            renderer = get_raster_renderer(radar_obj.rlat, radar_obj.rlon, new_header, radar_obj.theta)
+            image = renderer.render(new_data, title)
+    else:
+        from .visualization import render_frame
+        with stage('radar_build'):
+            radar, distances = create_radar_object_from_regridded(filename, new_data, radar_obj, new_header)
+        with stage('render'):
+            image = render_frame(radar, unit.layer_num, unit.date, unit.time, unit.param_type)
+
+    # png 保存原本的畫面，只有送到動畫的畫面才量化
+    png_path = None
+    if settings['save_png']:
+        param_output_dir = volume_output_dir(settings['output_dir'], unit.date, unit.time, unit.param_type)
+        png_path = os.path.join(param_output_dir, f'{title}.png')
+        with stage('save') as timer:
+            image.save(png_path, compress_level=1)
+            timer.bytes = os.path.getsize(png_path)
+    frame = image
+    if settings['animation_format'] and settings['animation_format'] != 'mp4':
+        from .animation import to_palette
+        with stage('render'):
+            frame = to_palette(image)
+    return frame, png_path
+
+
+def finalize_volume(key: tuple, layers: dict, settings: dict, feed=None):
+    """
+    在主程序中組合整個 volume：保存三維矩陣並由記憶體中的畫面創建動畫
+
+    Parameters
+    ----------
+    key : tuple
+        (date, time, param_type)
+    layers : dict
+        layer_num -> process_unit 的處理結果
+    settings : dict
+        batch_settings 的結果
+    feed : accumulate.RollingFeed, optional
+        時間累計的狀態，由呼叫端在整個批次 / 服務期間保留
+
+    Returns
+    -------
+    list
+        此 volume 的所有輸出路徑
+    """
+    date, time, param_type = key
+    param_output_dir = volume_output_dir(settings['output_dir'], date, time, param_type)
+
+    layer_nums = sorted(layers)
+    outputs = [path for n in layer_nums for path in layers[n]['outputs']]
+    radar_matrix = np.stack([layers[layer_num]['data'] for layer_num in layer_nums])
+    first = layers[layer_nums[0]]
+    encoding = first['encoding']
+    sentinels = [layers[n]['var_miss'] for n in layer_nums]
+    has_var_miss = any(v is not None for v in sentinels)
+
+    # 保存三維矩陣 (整數 code 另外保存編碼資訊)
+    if settings['save_npy']:
+        npy_path = os.path.join(param_output_dir, f"radar_matrix_{param_type}.npy")
+        with stage('save', radar_matrix.nbytes):
+            np.save(npy_path, radar_matrix)
+        outputs.append(npy_path)
+        if encoding is not None:
+            encoding_path = os.path.join(param_output_dir, f"radar_matrix_{param_type}.encoding.json")
+            with open(encoding_path, 'w') as fh:
+                json.dump(encoding_attrs(encoding), fh)
+            outputs.append(encoding_path)
+        if has_var_miss:
+            missing_path = os.path.join(param_output_dir, f"radar_matrix_{param_type}.missing.json")
+            with open(missing_path, 'w') as fh:
+                json.dump({'var_miss': sentinels, 'fill_value': MISSING_VALUE}, fh)
+            outputs.append(missing_path)
+
+    # npy 保留原本的 var_miss；資料庫、網格內插、tiles 與時間累計的缺失一律為 -44400
+    if encoding is not None:
+        values = decode(radar_matrix, encoding)
+    elif has_var_miss and (settings['archive'] or settings['gridding'] or settings['tiles'] or settings['rolling']):
+        values = mask_var_miss(radar_matrix.copy(), sentinels)
+    else:
+        values = radar_matrix
+
+    # 多解析度的各層與座標存在同一個 npz
+    if settings['pyramid']:
+        from .pyramid import save_pyramid
+        pyramid_path = os.path.join(param_output_dir, f"pyramid_{param_type}.npz")
+        levels = [np.stack([layers[n]['pyramid'][i][0] for n in layer_nums])
+                  for i in range(len(settings['pyramid']['levels']))]
+        headers = [header for _, header in first['pyramid']]
+        with stage('save', sum(level.nbytes for level in levels)):
+            save_pyramid(pyramid_path, levels, headers, layer_nums, [layers[n]['theta'] for n in layer_nums],
+                         first['site'], settings['pyramid']['method'])
+        outputs.append(pyramid_path)
+
+    # 附加到每站每天一個的 volume 資料庫
+    if settings['archive']:
+        with stage('archive', radar_matrix.nbytes):
+            # 資料庫的 dtype 是讀取 (decode) 後的物理量型別；有編碼的參數 chunk 另外以
+            # encoding.dtype 保存 (set_encoding)，所以整數編碼時仍是 float32
+            archive = VolumeArchive.for_day(settings['output_dir'], settings['site'], date,
+                                            shape=radar_matrix.shape[1:],
+                                            dtype=radar_matrix.dtype if encoding is None else np.float32,
+                                            attrs={'site': first['site'], 'header': first['header']})
+            # 同一天的資料庫中每個參數只能有一種編碼 (例如不能在一天中途切換 quantize)
+            if param_type in archive.params and archive.encoding(param_type) != encoding:
+                raise ValueError(f"{archive.path}: {param_type} is stored with encoding "
+                                 f"{archive.encoding(param_type)}, this run uses {encoding}; "
+                                 f"keep the same quantize / regrid_method for the whole day "
+                                 f"or use another output_dir")
+            if encoding is not None:
+                archive.set_encoding(param_type, encoding)
+            archive.append_volume(time, param_type, radar_matrix if encoding is not None else values,
+                                  layers=layer_nums,
+                                  layer_attrs=[{'theta': layers[n]['theta']} for n in layer_nums])
+        outputs.append(archive.path)
+
+    # 內插到笛卡兒網格 (權重依站點設定快取在 output_dir/cache)
+    if settings['gridding']:
+        from .gridding import grid_volume
+        gridding = settings['gridding']
+        with stage('grid'):
+            grid = grid_volume(values, first['site'], [layers[n]['theta'] for n in layer_nums],
+                               first['header'], gridding['grid_shape'], gridding['grid_limits'],
+                               mode=gridding['mode'],
+                               cache_dir=os.path.join(settings['output_dir'], 'cache'))
+        grid_path = os.path.join(param_output_dir, f"grid_{gridding['mode']}_{param_type}.npy")
+        with stage('save', grid.nbytes):
+            np.save(grid_path, grid)
+        outputs.append(grid_path)
+
+    # WebMercator tile pyramid (每站的 tile 像素查表只計算一次)
+    if settings['tiles']:
+        from .tiles import export_tiles, get_tile_index
+        tiles = settings['tiles']
+        index = get_tile_index(first['site'], first['header'], [layers[n]['theta'] for n in layer_nums],
+                               tiles['zooms'])
+        products = [('composite', None)] if tiles['composite'] else []
+        products += [(f"layer{n:02d}", [layer_nums.index(n)]) for n in tiles['layers'] if n in layers]
+        for name, sweeps in products:
+            tile_dir = os.path.join(settings['output_dir'], 'tiles', date, time, param_type, name)
+            with stage('tiles'):
+                count = export_tiles(values, index, tile_dir, sweeps, vmin=tiles['vmin'],
+                                     vmax=tiles['vmax'], threads=tiles['threads'])
+            print(f"Saved {count} tiles: {tile_dir}")
+            outputs.append(tile_dir)
+
+    # 最近 window 個掃描的逐格點累計，依時間順序加入這個 volume，不重新讀取先前的輸出
+    rolling = settings['rolling']
+    if rolling and feed is not None and param_type in rolling['params']:
+        with stage('rolling'):
+            outputs.extend(feed.add(key, values, layer_nums))
+
+    # 創建動畫 (GIF / APNG / MP4)
+    if settings['render'] and settings['animation_format']:
+        from .animation import animation_path, write_animation
+        anim_path = animation_path(param_output_dir, f"radar_animation_{param_type}",
+                                   settings['animation_format'])
+        with stage('animation') as timer:
+            write_animation((layers[n]['frame'] for n in layer_nums), anim_path,
+                            settings['animation_format'], settings['frame_duration'])
+            timer.bytes = os.path.getsize(anim_path)
+        outputs.append(anim_path)
+    return outputs
+
+
+def _run_unit(unit: WorkUnit, settings: dict, *args):
+    """
+    執行 process_unit；失敗時印出錯誤並視為缺少的層 (與即時處理模式相同)
+    """
+    try:
+        return process_unit(unit, settings, *args)
+    except Exception as exc:
+        print(f"Failed {unit_label(unit)}: {exc!r}")
+        return unit, None
+
+
+def _iter_results(units: list, settings: dict):
+    workers = settings['workers']
+    if workers <= 1:
+        _init_worker()
+        if settings['prefetch']:
+            # 單一 process：背景 thread 預先讀取並解壓縮後面的檔案
+            from .prefetch import prefetch
+            filenames = [input_filename(settings['input_dir'], unit, settings['site']) for unit in units]
+            if settings['telemetry']:
+                loaded = prefetch(filenames, settings['prefetch'], record=True)
+                for unit, (radar_obj, records) in zip(units, loaded):
+                    yield _run_unit(unit, settings, radar_obj, records)
+            else:
+                for unit, radar_obj in zip(units, prefetch(filenames, settings['prefetch'])):
+                    yield _run_unit(unit, settings, radar_obj)
+            return
+        for unit in units:
+            yield _run_unit(unit, settings)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(process_unit, unit, settings): unit for unit in units}
+        for future in as_completed(futures):
+            # 單一工作單位失敗 (例如損壞的檔案) 不中斷整個批次，已完成的 volume 照常輸出
+            try:
+                result = future.result()
+            except Exception as exc:
+                print(f"Failed {unit_label(futures[future])}: {exc!r}")
+                result = futures[future], None
+            yield result
+
+
+def run_batch(config: dict):
+    """
+    以 process pool 平行處理所有工作單位，並在主程序中依 volume 組合結果
+    """
+    settings = batch_settings(config)
+    units = expand_work_units(config)
+
+    # 每個 volume 現有的輸入檔案與層數
+    volume_inputs = defaultdict(list)
+    volume_layers = defaultdict(list)
+    for unit in units:
+        filename = input_filename(settings['input_dir'], unit, settings['site'])
+        if os.path.exists(filename):
+            volume_inputs[volume_key(unit)].append(filename)
+            volume_layers[volume_key(unit)].append(unit.layer_num)
+
+    # 增量處理：跳過輸入、參數與程式版本都沒變的 volume
+    manifest = None
+    up_to_date = set()
+    if settings['incremental']:
+        os.makedirs(settings['output_dir'], exist_ok=True)
+        manifest = Manifest(os.path.join(settings['output_dir'], 'manifest.json'))
+        params = manifest_params(settings)
+        up_to_date = {key for key in volume_inputs
+                      if manifest.is_up_to_date(manifest_key(key), volume_inputs[key], params)}
+        for key in sorted(up_to_date):
+            print(f"Up to date: {' - '.join(key)}")
+        units = [unit for unit in units if volume_key(unit) not in up_to_date]
+
+    remaining = Counter(volume_key(unit) for unit in units)
+    collected = defaultdict(dict)
+    for key in remaining:
+        print(f"Processing {' - '.join(key)}")
+
+    # 時間累計依時間順序加入 (pool 依完成順序回傳)，跳過的 volume 由先前的輸出讀回
+    feed = None
+    if settings['rolling']:
+        from .accumulate import RollingFeed
+        params = settings['rolling']['params']
+        feed = RollingFeed(settings, [key for key in remaining if key[2] in params],
+                           {key: volume_layers[key] for key in up_to_date if key[2] in params})
+
+    # worker 回傳的記錄與主程序組合 volume 的記錄
+    run_records = []
+    for unit, result in _iter_results(units, settings):
+        key = volume_key(unit)
+        if result is not None:
+            collected[key][unit.layer_num] = result
+            run_records.extend(result['telemetry'])
+        remaining[key] -= 1
+        if remaining[key] == 0:
+            layers = collected.pop(key, None)
+            if not layers:
+                if feed is not None:
+                    feed.discard(key)
+                continue
+            recorder = Recorder(manifest_key(key)) if settings['telemetry'] else None
+            with recording(recorder):
+                outputs = finalize_volume(key, layers, settings, feed)
+            if recorder:
+                run_records.extend(recorder.records)
+            if manifest is not None:
+                manifest.record(manifest_key(key), volume_inputs[key],
+                                manifest_params(settings), outputs)
+
+    if settings['telemetry'] and run_records:
+        for path in write_report(run_records, settings['output_dir']):
+            print(f"Saved {path}")
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+
+# 縣市界線 (含海岸線) 的 shapefile (內政部 COUNTY_MOI_1070516，不含副檔名)
+SHAPE_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           "../visualize/mapdata201805310314/COUNTY_MOI_1070516"))
+
+EARTH_RADIUS = 6370997.0  # 與 pyart 的 aeqd 投影相同 (m)
+EFFECTIVE_RADIUS = EARTH_RADIUS * 4.0 / 3.0  # 4/3 等效地球半徑 (m)
+
+
+def latlon_to_polar(lat, lon, rlat, rlon):
+    """
+    經緯度轉換為相對雷達站的地表距離與方位角 (球面等距方位投影)
+
+    Parameters
+    ----------
+    lat, lon : array_like
+        目標點經緯度(度)
+    rlat, rlon : float
+        雷達站經緯度(度)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        地表距離(m) 與方位角(度，正北為 0，順時針)
+    """
+    lat1, lon1 = np.radians(rlat), np.radians(rlon)
+    lat2, lon2 = np.radians(lat), np.radians(lon)
+    dlon = lon2 - lon1
+    cos_c = np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * np.cos(lat2) * np.cos(dlon)
+    distance = EARTH_RADIUS * np.arccos(np.clip(cos_c, -1.0, 1.0))
+    azimuth = np.degrees(np.arctan2(np.sin(dlon) * np.cos(lat2),
+                                    np.cos(lat1) * np.sin(lat2) -
+                                    np.sin(lat1) * np.cos(lat2) * np.cos(dlon)))
+    return distance, np.mod(azimuth, 360.0)
+
+
+def polar_to_latlon(distance, azimuth, rlat, rlon):
+    """
+    相對雷達站的地表距離(m)與方位角(度)轉換為經緯度 (latlon_to_polar 的反函數)
+    """
+    lat1, lon1 = np.radians(rlat), np.radians(rlon)
+    c = np.asarray(distance) / EARTH_RADIUS
+    az = np.radians(azimuth)
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(c) + np.cos(lat1) * np.sin(c) * np.cos(az))
+    lon2 = lon1 + np.arctan2(np.sin(az) * np.sin(c) * np.cos(lat1),
+                             np.cos(c) - np.sin(lat1) * np.sin(lat2))
+    return np.degrees(lat2), np.degrees(lon2)
+
+
+def ground_to_slant_range(distance, elevation):
+    """
+    地表距離(m)換算為某仰角(度)的波束斜距(m) (4/3 等效地球半徑)
+    """
+    e = np.radians(elevation)
+    s = np.asarray(distance) / EFFECTIVE_RADIUS
+    return EFFECTIVE_RADIUS * np.sin(s) / np.cos(e + s)
+
+
+def slant_to_ground_range(slant_range, elevation):
+    """
+    某仰角(度)的波束斜距(m)換算為地表距離(m) (ground_to_slant_range 的反函數)
+    """
+    e = np.radians(elevation)
+    r = np.asarray(slant_range)
+    return EFFECTIVE_RADIUS * np.arctan2(r * np.cos(e), EFFECTIVE_RADIUS + r * np.sin(e))
+
+
+def beam_height(distance, elevation):
+    """
+    地表距離(m)處、某仰角(度)波束離雷達天線的高度(m) (4/3 等效地球半徑)
+    """
+    e = np.radians(elevation)
+    s = np.asarray(distance) / EFFECTIVE_RADIUS
+    return EFFECTIVE_RADIUS * (np.cos(e) / np.cos(e + s) - 1.0)
+
+
+def polar_index(slant_range, azimuth, header: dict):
+    """
+    斜距(m)與方位角(度)對應到重新網格化後資料的最近 (ray, gate) 索引
+
+    Parameters
+    ----------
+    slant_range, azimuth : array_like
+        斜距(m) 與方位角(度)
+    header : dict
+        regrid_polar_data 回傳的 header (gate 單位為 m)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        ray 索引、gate 索引與是否落在資料範圍內的遮罩
+    """
+    gate = np.round((np.asarray(slant_range) - header['gate_start']) / header['gate_sp']).astype(np.intp)
+    ray = np.round((np.asarray(azimuth) - header['azm_start']) / header['azm_sp']).astype(np.intp)
+    ray = np.mod(ray, int(round(360.0 / header['azm_sp'])))
+    valid = (gate >= 0) & (gate < header['ngate']) & (ray < header['nray'])
+    return np.where(valid, ray, 0), np.where(valid, gate, 0), valid
+
+
+def check_shapefile(shape_path: str = SHAPE_PATH):
+    """
+    確認出圖需要的縣市界線 shapefile 存在 (.shp 不在 repo 中，需另外放到該位置)
+    """
+    path = shape_path + '.shp'
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"shapefile not found: {path} (county boundaries are needed for rendering; "
+                                f"put COUNTY_MOI_1070516.shp next to the .dbf/.shx or set render to False)")
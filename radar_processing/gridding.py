@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+import numpy as np
+from .geometry import beam_height, ground_to_slant_range
+
+# 權重演算法改變時遞增，讓磁碟上的快取失效
+WEIGHTS_VERSION = 1
+
+GRID_MODES = ('3d', 'cappi', 'column_max')
+
+
+class GridWeights:
+    """
+    極座標 volume 到笛卡兒網格的稀疏內插權重
+
+    以 ELL 格式存放稀疏矩陣：每個有資料的網格點 (rows) 最多 8 個非零項
+    (上下兩個仰角 × 方位角、距離方向雙線性)，cols 為攤平後 volume
+    (nsweeps * nray * ngate) 的索引。套用時為一次 gather 加上列加總的
+    sparse matrix-vector product，並依有效資料重新正規化權重。
+    """
+
+    def __init__(self, rows, cols, vals, grid_shape, volume_shape):
+        self.rows = rows
+        self.cols = cols
+        self.vals = vals
+        self.grid_shape = tuple(int(n) for n in grid_shape)
+        self.volume_shape = tuple(int(n) for n in volume_shape)
+
+    def apply(self, volume: np.ndarray, missing: float = -44400,
+              min_weight: float = 0.5, fill_value: float = np.nan) -> np.ndarray:
+        """
+        將權重套用到一個 volume
+
+        Parameters
+        ----------
+        volume : np.ndarray
+            (nsweeps, nray, ngate) 的重新網格化資料 (層的順序需與建立權重時相同)
+        missing : float
+            volume 中的缺失值
+        min_weight : float
+            有效資料權重占總權重的最低比例，低於此值視為缺失
+        fill_value : float
+            缺失網格點填入的值
+
+        Returns
+        -------
+        np.ndarray
+            grid_shape (nz, ny, nx) 的網格資料
+        """
+        if volume.shape != self.volume_shape:
+            raise ValueError(f"volume shape {volume.shape} does not match weights {self.volume_shape}")
+        values = volume.reshape(-1)[self.cols]
+        valid = (values != missing) & np.isfinite(values)
+        weights = np.where(valid, self.vals, 0.0)
+        den = weights.sum(axis=1)
+        num = (weights * np.where(valid, values, 0.0)).sum(axis=1)
+        total = self.vals.sum(axis=1)
+
+        out = np.full(int(np.prod(self.grid_shape)), fill_value, dtype=np.float32)
+        ok = (den > 0) & (den >= min_weight * total)
+        out[self.rows[ok]] = num[ok] / den[ok]
+        return out.reshape(self.grid_shape)
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, rows=self.rows, cols=self.cols, vals=self.vals,
+                 grid_shape=self.grid_shape, volume_shape=self.volume_shape)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GridWeights":
+        with np.load(path) as f:
+            return cls(f['rows'], f['cols'], f['vals'], f['grid_shape'], f['volume_shape'])
+
+
+def build_grid_weights(site: dict, thetas: list, header: dict,
+                       grid_shape: tuple, grid_limits: tuple,
+                       beam_width: float = 1.0) -> GridWeights:
+    """
+    計算某站、某組仰角與網格設定的內插權重
+
+    Parameters
+    ----------
+    site : dict
+        雷達站資訊，需有 'radar_elev' (m)
+    thetas : list
+        volume 中各層的仰角(度)，依層的順序
+    header : dict
+        regrid_polar_data 回傳的 header (gate 單位為 m)
+    grid_shape : tuple
+        (nz, ny, nx)
+    grid_limits : tuple
+        ((z_min, z_max), (y_min, y_max), (x_min, x_max))，單位 m；
+        x, y 為相對雷達站的東西、南北距離，z 為海拔高度
+    beam_width : float
+        波束寬度(度)，網格點在最低/最高仰角外半個波束寬度內仍取該仰角
+
+    Returns
+    -------
+    GridWeights
+    """
+    nz, ny, nx = grid_shape
+    (z0, z1), (y0, y1), (x0, x1) = grid_limits
+    z = np.linspace(z0, z1, nz) - site['radar_elev']
+    y = np.linspace(y0, y1, ny)
+    x = np.linspace(x0, x1, nx)
+    xx, yy = np.meshgrid(x, y)
+    distance = np.hypot(xx, yy).ravel()
+    azimuth = np.mod(np.degrees(np.arctan2(xx, yy)), 360.0).ravel()
+
+    thetas = np.asarray(thetas, dtype=np.float64)
+    order = np.argsort(thetas)
+    nsweeps = len(thetas)
+    nray, ngate = header['nray'], header['ngate']
+    full_circle = int(round(360.0 / header['azm_sp']))
+
+    # 每個仰角在每個水平位置的波束高度，以及對應的方位角/距離雙線性索引
+    heights = np.stack([beam_height(distance, thetas[k]) for k in order])  # (nsweeps, npts)
+    tolerance = distance * np.tan(np.radians(beam_width / 2))
+    ray_f = (azimuth - header['azm_start']) / header['azm_sp']
+    ray0 = np.floor(ray_f).astype(np.intp)
+    ray_w = ray_f - ray0
+    ray0 = np.mod(ray0, full_circle)
+    ray1 = np.mod(ray0 + 1, full_circle)
+    ray_ok = (ray0 < nray) & (ray1 < nray)
+
+    sweep_cols, sweep_vals = [], []
+    for k in order:
+        gate_f = (ground_to_slant_range(distance, thetas[k]) - header['gate_start']) / header['gate_sp']
+        gate0 = np.clip(np.floor(gate_f).astype(np.intp), 0, ngate - 2)
+        gate_w = gate_f - gate0
+        ok = ray_ok & (gate_f >= 0) & (gate_f <= ngate - 1)
+        base = k * nray * ngate
+        cols = np.stack([base + ray0 * ngate + gate0, base + ray0 * ngate + gate0 + 1,
+                         base + ray1 * ngate + gate0, base + ray1 * ngate + gate0 + 1], axis=1)
+        vals = np.stack([(1 - ray_w) * (1 - gate_w), (1 - ray_w) * gate_w,
+                         ray_w * (1 - gate_w), ray_w * gate_w], axis=1)
+        sweep_cols.append(np.where(ok[:, None], cols, 0))
+        sweep_vals.append(np.where(ok[:, None], vals, 0.0))
+    sweep_cols = np.stack(sweep_cols)  # (nsweeps, npts, 4)，依仰角由低到高
+    sweep_vals = np.stack(sweep_vals)
+
+    all_rows, all_cols, all_vals = [], [], []
+    npts = distance.size
+    pts = np.arange(npts)
+    for iz in range(nz):
+        h = z[iz]
+        # 上下兩個仰角與垂直方向的線性權重
+        upper = np.clip((heights <= h).sum(axis=0), 1, nsweeps - 1) if nsweeps > 1 else np.zeros(npts, np.intp)
+        lower = upper - 1 if nsweeps > 1 else upper
+        h_lo = heights[lower, pts]
+        h_hi = heights[upper, pts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            w_hi = np.where(h_hi > h_lo, (h - h_lo) / (h_hi - h_lo), 0.0)
+        below = h < heights[0] - tolerance
+        above = h > heights[-1] + tolerance
+        w_hi = np.clip(w_hi, 0.0, 1.0)
+        inside = ~(below | above)
+
+        cols = np.concatenate([sweep_cols[lower, pts], sweep_cols[upper, pts]], axis=1)
+        vals = np.concatenate([sweep_vals[lower, pts] * (1 - w_hi)[:, None],
+                               sweep_vals[upper, pts] * w_hi[:, None]], axis=1)
+        keep = inside & (vals.sum(axis=1) > 0)
+        all_rows.append(iz * npts + pts[keep])
+        all_cols.append(cols[keep])
+        all_vals.append(vals[keep])
+
+    return GridWeights(np.concatenate(all_rows).astype(np.int64),
+                       np.concatenate(all_cols).astype(np.int64),
+                       np.concatenate(all_vals).astype(np.float32),
+                       grid_shape, (nsweeps, nray, ngate))
+
+
+def _weights_key(site, thetas, header, grid_shape, grid_limits, beam_width) -> str:
+    spec = {'version': WEIGHTS_VERSION,
+            'site': [round(float(site[k]), 6) for k in ('rlat', 'rlon', 'radar_elev')],
+            'thetas': [round(float(t), 3) for t in thetas],
+            'header': {k: float(v) for k, v in sorted(header.items())},
+            'grid_shape': [int(n) for n in grid_shape],
+            'grid_limits': [[float(v) for v in lim] for lim in grid_limits],
+            'beam_width': float(beam_width)}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=8)
+def _load_or_build(key, cache_dir, site_items, thetas, header_items, grid_shape, grid_limits, beam_width):
+    path = os.path.join(cache_dir, f'grid_weights_{key}.npz') if cache_dir else None
+    if path and os.path.exists(path):
+        return GridWeights.load(path)
+    weights = build_grid_weights(dict(site_items), thetas, dict(header_items),
+                                 grid_shape, grid_limits, beam_width)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        weights.save(path)
+    return weights
+
+
+def get_grid_weights(site: dict, thetas: list, header: dict,
+                     grid_shape: tuple, grid_limits: tuple,
+                     beam_width: float = 1.0, cache_dir: str = None) -> GridWeights:
+    """
+    取得某站設定的內插權重：先查記憶體，再查 cache_dir 中的 npz，都沒有才計算
+    """
+    grid_shape = tuple(int(n) for n in grid_shape)
+    grid_limits = tuple(tuple(float(v) for v in lim) for lim in grid_limits)
+    thetas = tuple(float(t) for t in thetas)
+    key = _weights_key(site, thetas, header, grid_shape, grid_limits, beam_width)
+    site_items = tuple((k, float(site[k])) for k in ('rlat', 'rlon', 'radar_elev'))
+    return _load_or_build(key, cache_dir, site_items, thetas, tuple(sorted(header.items())),
+                          grid_shape, grid_limits, float(beam_width))
+
+
+def grid_volume(volume: np.ndarray, site: dict, thetas: list, header: dict,
+                grid_shape: tuple, grid_limits: tuple, mode: str = '3d',
+                missing: float = -44400, cache_dir: str = None) -> np.ndarray:
+    """
+    將重新網格化後的 volume 內插到笛卡兒網格
+
+    Parameters
+    ----------
+    volume : np.ndarray
+        (nsweeps, nray, ngate) 的資料
+    site, thetas, header, grid_shape, grid_limits
+        見 build_grid_weights；'cappi' 模式下 grid_shape 的 nz 須為 1
+    mode : str
+        '3d' 回傳 (nz, ny, nx)；'cappi' 回傳 (ny, nx)；'column_max' 回傳垂直最大值 (ny, nx)
+    missing : float
+        volume 中的缺失值 (regrid_polar_data 的輸出一律為 -44400)，NaN 也視為缺失
+    cache_dir : str, optional
+        權重快取資料夾
+
+    Returns
+    -------
+    np.ndarray
+        網格資料，缺失為 NaN
+    """
+    if mode not in GRID_MODES:
+        raise ValueError(f"Unknown gridding mode: {mode}")
+    if mode == 'cappi' and int(grid_shape[0]) != 1:
+        raise ValueError(f"'cappi' mode needs nz=1 in grid_shape, got {tuple(grid_shape)}")
+    weights = get_grid_weights(site, thetas, header, grid_shape, grid_limits, cache_dir=cache_dir)
+    grid = weights.apply(volume, missing=missing)
+    if mode == 'cappi':
+        return grid[0]
+    if mode == 'column_max':
+        all_missing = np.isnan(grid).all(axis=0)
+        return np.where(all_missing, np.nan, np.nanmax(np.where(np.isnan(grid), -np.inf, grid), axis=0))
+    return grid
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+
+# 輸出格式或處理演算法改變時遞增，讓既有的輸出全部重做
+PIPELINE_VERSION = '3'
+
+
+def file_sha1(path: str, block_size: int = 1 << 20) -> str:
+    """
+    計算檔案內容的 sha1
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def file_fingerprint(path: str, previous: dict = None) -> dict:
+    """
+    檔案的 size / mtime / sha1；size 與 mtime 和上次相同時沿用上次的 sha1
+    """
+    st = os.stat(path)
+    fingerprint = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in fingerprint.items()):
+        fingerprint['sha1'] = previous['sha1']
+    else:
+        fingerprint['sha1'] = file_sha1(path)
+    return fingerprint
+
+
+class Manifest:
+    """
+    記錄每個輸出的輸入檔案指紋、處理參數與程式版本
+
+    重新執行時跳過輸入、參數、版本都沒有改變且輸出仍存在的工作；
+    每完成一個輸出就寫回檔案，中途中斷後可以從中斷處繼續。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as fh:
+                self.entries = json.load(fh)
+
+    def is_up_to_date(self, key: str, inputs: list, params: dict) -> bool:
+        """
+        檢查某個輸出是否已是最新
+
+        Parameters
+        ----------
+        key : str
+            輸出的名稱 (例如 'date/time/param_type')
+        inputs : list
+            輸入檔案路徑
+        params : dict
+            影響輸出的處理參數
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if entry['version'] != PIPELINE_VERSION or entry['params'] != params:
+            return False
+        if sorted(entry['inputs']) != sorted(inputs):
+            return False
+        if not all(os.path.exists(path) for path in entry['outputs']):
+            return False
+        refreshed = False
+        for path in inputs:
+            if not os.path.exists(path):
+                return False
+            previous = entry['inputs'][path]
+            # 只有 size / mtime 改變時才重新計算 sha1
+            fingerprint = file_fingerprint(path, previous)
+            if fingerprint['sha1'] != previous['sha1']:
+                return False
+            if fingerprint != previous:
+                # 內容相同但 size / mtime 改變 (例如重新複製)：記下新的指紋，之後不必再計算 sha1
+                entry['inputs'][path] = fingerprint
+                refreshed = True
+        if refreshed:
+            self.save()
+        return True
+
+    def record(self, key: str, inputs: list, params: dict, outputs: list):
+        """
+        記錄一個完成的輸出並寫回檔案
+        """
+        previous = self.entries.get(key, {}).get('inputs', {})
+        self.entries[key] = {
+            'version': PIPELINE_VERSION,
+            'params': params,
+            'inputs': {path: file_fingerprint(path, previous.get(path)) for path in inputs},
+            'outputs': list(outputs),
+        }
+        self.save()
+
+    def save(self):
+        # 先寫暫存檔再取代，避免中斷時留下不完整的 manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(self.entries, fh, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,228 @@
+import os
+import numpy as np
+from .archive import META_NAME, VolumeArchive, require_archive
+from .geometry import ground_to_slant_range, latlon_to_polar, polar_index
+
+# 與 visualize/Taiwan.py 的 Basemap 範圍相同 (lon_min, lon_max, lat_min, lat_max)
+TAIWAN_EXTENT = (119.0, 122.05, 21.8, 25.4)
+MERGE_RULES = ('max', 'nearest', 'weighted')
+
+
+def mosaic_grid(extent: tuple = TAIWAN_EXTENT, resolution: float = 0.01):
+    """
+    mosaic 的等經緯度網格中心點
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        緯度 (由南到北) 與經度 (由西到東) 的一維陣列
+    """
+    lon_min, lon_max, lat_min, lat_max = extent
+    nlon = int(round((lon_max - lon_min) / resolution))
+    nlat = int(round((lat_max - lat_min) / resolution))
+    lon = lon_min + (np.arange(nlon) + 0.5) * resolution
+    lat = lat_min + (np.arange(nlat) + 0.5) * resolution
+    return lat, lon
+
+
+class SiteIndex:
+    """
+    某站在 mosaic 網格上的查表
+
+    每一層、每個網格點對應到攤平後 volume (nsweeps * nray * ngate) 的最近索引，
+    以及網格點到雷達站的地表距離；之後每個時間只需要一次 gather。
+    """
+
+    def __init__(self, site: dict, header: dict, thetas: list,
+                 extent: tuple = TAIWAN_EXTENT, resolution: float = 0.01):
+        lat, lon = mosaic_grid(extent, resolution)
+        lon2d, lat2d = np.meshgrid(lon, lat)
+        distance, azimuth = latlon_to_polar(lat2d, lon2d, site['rlat'], site['rlon'])
+        distance, azimuth = distance.ravel(), azimuth.ravel()
+
+        nray, ngate = header['nray'], header['ngate']
+        self.shape = (len(thetas), lat.size, lon.size)
+        self.volume_shape = (len(thetas), nray, ngate)
+        self.index = np.empty((len(thetas), distance.size), dtype=np.intp)
+        self.valid = np.empty((len(thetas), distance.size), dtype=bool)
+        for k, theta in enumerate(thetas):
+            ray, gate, valid = polar_index(ground_to_slant_range(distance, theta), azimuth, header)
+            self.index[k] = k * nray * ngate + ray * ngate + gate
+            self.valid[k] = valid
+        self.distance = distance.astype(np.float32)
+
+    def sample(self, volume: np.ndarray, sweeps=None, missing: float = -44400) -> np.ndarray:
+        """
+        取出網格上的值；多個 sweep 時取垂直最大值 (composite)
+
+        Parameters
+        ----------
+        volume : np.ndarray
+            (nsweeps, nray, ngate) 的資料
+        sweeps : list, optional
+            使用 volume 中的哪幾層 (位置索引)，預設為全部
+        missing : float
+            volume 中的缺失值 (重新網格化的輸出一律為 -44400)，非有限值也視為缺失
+
+        Returns
+        -------
+        np.ndarray
+            (nlat * nlon,) 的 float32，缺失或超出範圍為 NaN
+        """
+        if volume.shape != self.volume_shape:
+            raise ValueError(f"volume shape {volume.shape} does not match index {self.volume_shape}")
+        sweeps = slice(None) if sweeps is None else list(sweeps)
+        values = volume.reshape(-1)[self.index[sweeps]].astype(np.float32)
+        values[~self.valid[sweeps] | (values == missing) | ~np.isfinite(values)] = np.nan
+        # fmax 忽略 NaN，全部為 NaN 時結果為 NaN
+        return np.fmax.reduce(values, axis=0)
+
+
+_site_indexes = {}
+
+
+def get_site_index(site: dict, header: dict, thetas: list,
+                   extent: tuple = TAIWAN_EXTENT, resolution: float = 0.01) -> SiteIndex:
+    """
+    取得 (並快取) 某站、網格與仰角組合的 SiteIndex
+    """
+    key = (round(float(site['rlat']), 4), round(float(site['rlon']), 4),
+           tuple(sorted(header.items())), tuple(round(float(t), 2) for t in thetas),
+           tuple(extent), resolution)
+    if key not in _site_indexes:
+        _site_indexes[key] = SiteIndex(site, header, thetas, extent, resolution)
+    return _site_indexes[key]
+
+
+def merge(values: np.ndarray, distances: np.ndarray, rule: str = 'max') -> np.ndarray:
+    """
+    合併多站的值
+
+    Parameters
+    ----------
+    values : np.ndarray
+        (nsites, npix)，缺失為 NaN
+    distances : np.ndarray
+        (nsites, npix) 網格點到各站的地表距離(m)
+    rule : str
+        'max' 取最大值；'nearest' 取有資料的最近雷達站；
+        'weighted' 以距離平方反比加權平均
+
+    Returns
+    -------
+    np.ndarray
+        (npix,)
+    """
+    if rule not in MERGE_RULES:
+        raise ValueError(f"Unknown merge rule: {rule}")
+    valid = np.isfinite(values)
+    if rule == 'max':
+        return np.fmax.reduce(values, axis=0)
+    if rule == 'nearest':
+        nearest = np.argmin(np.where(valid, distances, np.inf), axis=0)
+        out = np.take_along_axis(values, nearest[None], axis=0)[0]
+        out[~valid.any(axis=0)] = np.nan
+        return out
+    weights = np.where(valid, 1.0 / np.maximum(distances, 1000.0) ** 2, 0.0)
+    total = weights.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (weights * np.where(valid, values, 0.0)).sum(axis=0) / total
+
+
+def build_mosaic(volumes: list, rule: str = 'max', sweeps=None,
+                 extent: tuple = TAIWAN_EXTENT, resolution: float = 0.01,
+                 missing: float = -44400):
+    """
+    將多個雷達站同一時間的 volume 合併到共同的經緯度網格
+
+    Parameters
+    ----------
+    volumes : list
+        每站一個 (volume, site, header, thetas)，site 需有 rlat, rlon
+    rule : str
+        合併方式，見 merge
+    sweeps : list, optional
+        使用各 volume 的哪幾層 (位置索引)，預設為全部層的 composite
+    extent, resolution
+        網格範圍 (lon_min, lon_max, lat_min, lat_max) 與解析度(度)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        (nlat, nlon) 的 mosaic (缺失為 NaN)、緯度與經度
+    """
+    lat, lon = mosaic_grid(extent, resolution)
+    values = np.empty((len(volumes), lat.size * lon.size), dtype=np.float32)
+    distances = np.empty_like(values)
+    for i, (volume, site, header, thetas) in enumerate(volumes):
+        index = get_site_index(site, header, thetas, extent, resolution)
+        values[i] = index.sample(volume, sweeps, missing)
+        distances[i] = index.distance
+    return merge(values, distances, rule).reshape(lat.size, lon.size), lat, lon
+
+
+def load_archived_volume(output_dir: str, site: str, date: str, time: str, param_type: str):
+    """
+    由每站每天的資料庫讀出某時間、某參數的 volume
+
+    Returns
+    -------
+    tuple or None
+        (volume, site, header, thetas)，資料庫或該時間不存在時為 None；
+        整數編碼的參數已換算成物理量
+    """
+    path = os.path.join(output_dir, 'archive', f"{site}_{date}")
+    if not os.path.exists(os.path.join(path, META_NAME)):
+        return None
+    archive = VolumeArchive(path)
+    layers = [n for n in archive.layers if (time, param_type, n) in archive]
+    if not layers:
+        return None
+    volume = archive.read([time], [param_type], layers)[0, 0]
+    thetas = [archive.chunk_attrs(time, param_type, n)['theta'] for n in layers]
+    return volume, archive.attrs['site'], archive.attrs['header'], thetas
+
+
+def run_mosaic(config: dict) -> list:
+    """
+    依設定對每個 date/time/param_type 合併 config['mosaic']['sites'] 各站的資料庫，
+    存成 output_dir/mosaic/{date}/{time}/mosaic_{param_type}.npz (data, lat, lon)
+
+    批次處理與即時處理模式每次只處理 config['site'] 一站，只會更新該站的資料庫；
+    其他站需要各自以自己的 site (與 output_dir) 執行，資料庫所在的 output_dir 以
+    config['mosaic']['output_dirs'] (site -> output_dir，預設為 config['output_dir']) 指定。
+    缺少資料庫的站會列出並略過；archive 未啟用時丟出 ValueError。
+
+    Returns
+    -------
+    list
+        輸出路徑
+    """
+    require_archive(config, 'mosaic')
+    options = config['mosaic']
+    output_dir = os.path.normpath(os.path.abspath(config['output_dir']))
+    site_dirs = {site: os.path.normpath(os.path.abspath(options.get('output_dirs', {}).get(site, output_dir)))
+                 for site in options['sites']}
+    extent = tuple(options.get('extent', TAIWAN_EXTENT))
+    outputs = []
+    for date in config['dates']:
+        for time in config['times']:
+            for param_type in config['param_types']:
+                volumes = {site: load_archived_volume(site_dirs[site], site, date, time, param_type)
+                           for site in options['sites']}
+                missing_sites = [site for site, v in volumes.items() if v is None]
+                volumes = [v for v in volumes.values() if v is not None]
+                if volumes and missing_sites:
+                    print(f"No archived volume for {', '.join(missing_sites)}: {date} - {time} - {param_type}")
+                if not volumes:
+                    print(f"No archived volumes for mosaic: {date} - {time} - {param_type}")
+                    continue
+                data, lat, lon = build_mosaic(volumes, options.get('rule', 'max'), options.get('sweeps'),
+                                              extent, options.get('resolution', 0.01))
+                mosaic_dir = os.path.join(output_dir, 'mosaic', date, time)
+                os.makedirs(mosaic_dir, exist_ok=True)
+                path = os.path.join(mosaic_dir, f"mosaic_{param_type}.npz")
+                np.savez(path, data=data, lat=lat, lon=lon)
+                print(f"Mosaic of {len(volumes)} sites: {path}")
+                outputs.append(path)
+    return outputs
@@ -0,0 +1,73 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .RadarDataProcessorClass import RadarDataProcessor, read_sweep_bytes
+from .telemetry import Recorder, recording, stage
+
+
+def load_sweep(fname, dtype=np.float64):
+    """
+    在 thread 中讀檔：.gz 一次解壓縮後以 from_buffer 建立，未壓縮檔以 memmap 對應；
+    檔案不存在時回傳 None
+    """
+    if not os.path.exists(fname):
+        return None
+    if '.gz' in fname:
+        with stage('decompress', os.path.getsize(fname)):
+            buf = read_sweep_bytes(fname)
+        return RadarDataProcessor.from_buffer(buf, fname, dtype=dtype)
+    return RadarDataProcessor(fname, dtype=dtype)
+
+
+def _load_recorded(fname, dtype):
+    # telemetry 以 thread-local 的 Recorder 記錄，背景 thread 中的階段另外收集，交給工作單位
+    recorder = Recorder()
+    with recording(recorder):
+        radar_obj = load_sweep(fname, dtype)
+    return radar_obj, recorder.records
+
+
+def prefetch(filenames, threads: int = 4, depth: int = None, dtype=np.float64, record: bool = False):
+    """
+    依序回傳每個檔案的 RadarDataProcessor (不存在時為 None)，同時在背景 thread
+    預先讀取並解壓縮後面的檔案，讓讀檔與後續計算重疊
+
+    Parameters
+    ----------
+    filenames : iterable of str
+        依處理順序排列的檔案
+    threads : int
+        讀檔 thread 數
+    depth : int, optional
+        最多預先讀取的檔案數 (限制記憶體)，預設為 2 倍 threads
+    dtype : data-type
+        見 RadarDataProcessor
+    record : bool
+        是否記錄背景 thread 中的階段 (decompress, decode)；啟用時回傳 (RadarDataProcessor, 記錄)
+
+    Yields
+    ------
+    RadarDataProcessor or None
+        檔案不存在或讀取失敗時為 None
+    """
+    depth = depth or 2 * threads
+    filenames = iter(filenames)
+    load = _load_recorded if record else load_sweep
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='prefetch') as executor:
+        pending = deque()
+        for fname in filenames:
+            pending.append(executor.submit(load, fname, dtype))
+            if len(pending) >= depth:
+                break
+        while pending:
+            try:
+                result = pending.popleft().result()
+            except Exception:
+                # 讀取失敗時回傳 None，呼叫端重新讀取時再回報錯誤
+                result = (None, []) if record else None
+            # 取走一個就補一個，佇列中最多 depth 個
+            fname = next(filenames, None)
+            if fname is not None:
+                pending.append(executor.submit(load, fname, dtype))
+            yield result
@@ -0,0 +1,50 @@
+import json
+import numpy as np
+
+
+def save_pyramid(path: str, levels: list, headers: list, layers: list, thetas: list,
+                 site: dict, method: str) -> str:
+    """
+    將多解析度的各層存成一個 npz
+
+    每一層 i 存成 data_{i} (layer, ray, gate) 與 range_{i} (各 gate 中心距離 m)，
+    共用的 azimuth、layers、theta，以及 levels (距離間隔 km)；
+    各層 header、站點與聚合方式以 JSON 字串存在 attrs
+    """
+    arrays = {'levels': np.array([header['gate_sp'] / 1000 for header in headers]),
+              'layers': np.array(layers), 'theta': np.array(thetas)}
+    first = headers[0]
+    arrays['azimuth'] = first['azm_start'] + first['azm_sp'] * np.arange(first['nray'])
+    for i, (data, header) in enumerate(zip(levels, headers)):
+        arrays[f'data_{i}'] = data
+        arrays[f'range_{i}'] = header['gate_start'] + header['gate_sp'] * np.arange(header['ngate'])
+    arrays['attrs'] = np.array(json.dumps({'headers': headers, 'site': site, 'method': method}))
+    np.savez(path, **arrays)
+    return path
+
+
+def load_pyramid(path: str, level: float = None):
+    """
+    讀取 save_pyramid 的結果
+
+    Parameters
+    ----------
+    level : float, optional
+        只讀取某個距離間隔 (km) 的一層，預設為全部
+
+    Returns
+    -------
+    Tuple[list, dict]
+        各層 (layer, ray, gate) 的資料，以及座標 (levels, layers, theta, azimuth, range, headers, site, method)
+    """
+    with np.load(path) as npz:
+        attrs = json.loads(str(npz['attrs']))
+        levels = npz['levels'].tolist()
+        selected = range(len(levels)) if level is None else [levels.index(float(level))]
+        data = [npz[f'data_{i}'] for i in selected]
+        coords = {'levels': [levels[i] for i in selected], 'layers': npz['layers'].tolist(),
+                  'theta': npz['theta'], 'azimuth': npz['azimuth'],
+                  'range': [npz[f'range_{i}'] for i in selected],
+                  'headers': [attrs['headers'][i] for i in selected],
+                  'site': attrs['site'], 'method': attrs['method']}
+    return data, coords
@@ -0,0 +1,118 @@
+import json
+import os
+from collections import namedtuple
+import numpy as np
+
+# 整數編碼：物理量 = code * scale + offset，missing 為保留給缺失值的 code
+Encoding = namedtuple('Encoding', ['dtype', 'scale', 'offset', 'missing'])
+
+MISSING_VALUE = -44400  # 未編碼資料使用的缺失值 (rf_miss)
+
+# 檔名 / param_type 關鍵字 -> 編碼 (依序比對)
+FIELD_ENCODINGS = [
+    ('ref', Encoding('uint8', 0.5, -32.0, 255)),      # -32 ~ 95 dBZ
+    ('vel', Encoding('int16', 0.01, 0.0, -32768)),    # ±327 m/s
+    ('phi', Encoding('uint16', 0.01, -180.0, 65535)),  # -180 ~ 475 度
+    ('zdr', Encoding('int16', 0.01, 0.0, -32768)),    # ±327 dB
+    ('rho', Encoding('uint16', 0.0001, 0.0, 65535)),  # 0 ~ 6.5
+    ('spw', Encoding('uint8', 0.2, 0.0, 255)),        # 0 ~ 50.8 m/s
+]
+DEFAULT_ENCODING = Encoding('int16', 0.01, 0.0, -32768)
+# 'fraction' 聚合的結果為有效 gate 比例 (0 ~ 1)，不是欄位的物理量
+FRACTION_ENCODING = Encoding('uint16', 0.0001, 0.0, 65535)
+
+
+def field_encoding(name: str) -> Encoding:
+    """
+    依檔名或 param_type 取得欄位的整數編碼
+    """
+    name = os.path.basename(name)
+    for key, encoding in FIELD_ENCODINGS:
+        if key in name:
+            return encoding
+    return DEFAULT_ENCODING
+
+
+def output_encoding(name: str, method: str = 'nearest') -> Encoding:
+    """
+    重新網格化輸出的整數編碼：'fraction' 使用 FRACTION_ENCODING，其他方法使用欄位的編碼
+    """
+    if method == 'fraction':
+        return FRACTION_ENCODING
+    return field_encoding(name)
+
+
+def _code_range(encoding: Encoding):
+    info = np.iinfo(encoding.dtype)
+    low, high = info.min, info.max
+    if encoding.missing == high:
+        high -= 1
+    elif encoding.missing == low:
+        low += 1
+    return low, high
+
+
+def encode(values: np.ndarray, encoding: Encoding, missing_value: float = MISSING_VALUE) -> np.ndarray:
+    """
+    物理量編碼成整數 code (超出範圍的值截到最大/最小 code，NaN 與 missing_value 為 missing code)
+    """
+    values = np.asarray(values)
+    low, high = _code_range(encoding)
+    with np.errstate(invalid='ignore'):
+        codes = np.rint((values - encoding.offset) / encoding.scale)
+    np.clip(codes, low, high, out=codes)
+    codes[~np.isfinite(values) | (values == missing_value)] = encoding.missing
+    return codes.astype(encoding.dtype)
+
+
+def decode(codes: np.ndarray, encoding: Encoding, dtype=np.float32,
+           fill_value: float = MISSING_VALUE) -> np.ndarray:
+    """
+    整數 code 換算回物理量，missing code 為 fill_value
+    """
+    values = np.multiply(codes, encoding.scale, dtype=dtype)
+    values += encoding.offset
+    values[codes == encoding.missing] = fill_value
+    return values
+
+
+def encoding_attrs(encoding: Encoding) -> dict:
+    """
+    可寫成 JSON 的編碼資訊 (archive attrs 與 npy 的說明檔)
+    """
+    return {'dtype': encoding.dtype, 'scale': encoding.scale,
+            'offset': encoding.offset, 'missing': encoding.missing}
+
+
+def encoding_from_attrs(attrs: dict) -> Encoding:
+    return Encoding(attrs['dtype'], attrs['scale'], attrs['offset'], attrs['missing'])
+
+
+def matrix_attrs(npy_path: str):
+    """
+    radar_matrix npy 的說明檔
+
+    Returns
+    -------
+    Tuple[Encoding or None, list or None]
+        整數編碼 (.encoding.json) 與各層原始 var_miss 的物理量 (.missing.json)，沒有說明檔時為 None
+    """
+    base = npy_path[:-len('.npy')]
+    encoding, var_miss = None, None
+    if os.path.exists(base + '.encoding.json'):
+        with open(base + '.encoding.json') as fh:
+            encoding = encoding_from_attrs(json.load(fh))
+    if os.path.exists(base + '.missing.json'):
+        with open(base + '.missing.json') as fh:
+            var_miss = json.load(fh)['var_miss']
+    return encoding, var_miss
+
+
+def mask_var_miss(values: np.ndarray, var_miss: list, fill_value: float = MISSING_VALUE) -> np.ndarray:
+    """
+    將 (layer, ...) 各層的原始 var_miss 換成 fill_value (原地修改)；var_miss 中的 None 略過
+    """
+    for k, sentinel in enumerate(var_miss):
+        if sentinel is not None:
+            values[k][values[k] == sentinel] = fill_value
+    return values
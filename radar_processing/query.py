@@ -0,0 +1,411 @@
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from .archive import INDEX_NAME, META_NAME, VolumeArchive
+from .geometry import beam_height, ground_to_slant_range, latlon_to_polar, polar_index
+from .quantize import MISSING_VALUE, decode, matrix_attrs
+
+QUERY_TYPES = ('point', 'ray', 'sweep', 'series')
+
+
+class Volume:
+    """
+    查詢用的 volume：各層為 memmap (未壓縮的資料庫 chunk 與 npy) 或解壓縮後的陣列，
+    有編碼的參數保留整數 code，只換算查詢到的值
+
+    site, header, thetas 只有資料庫來源才有 (npy 沒有站點與網格資訊)，點查詢需要資料庫。
+    """
+
+    def __init__(self, sweeps: list, layers: list, encoding=None, fill_value: float = MISSING_VALUE,
+                 site: dict = None, header: dict = None, thetas: list = None, var_miss: list = None):
+        self.sweeps = sweeps
+        self.var_miss = var_miss  # npy 中各層原始 var_miss 的值 (見 batch.finalize_volume)
+        self.layers = list(layers)
+        self.encoding = encoding
+        self.fill_value = fill_value
+        self.site = site
+        self.header = header
+        self.thetas = thetas
+        self.nbytes = sum(sweep.nbytes for sweep in sweeps)
+
+    def layer_position(self, layer: int) -> int:
+        if layer not in self.layers:
+            raise KeyError(f"layer {layer} not available (layers: {self.layers})")
+        return self.layers.index(layer)
+
+    def values(self, k: int, rows=slice(None), cols=slice(None)) -> np.ndarray:
+        """
+        第 k 層 (位置索引) 選取範圍的物理量 (float32，缺失為 NaN)
+
+        fill_value 與 npy 中保留的原始 var_miss 在查詢結果中一律換成 NaN
+        """
+        data = np.asarray(self.sweeps[k][rows, cols])
+        if self.encoding is not None:
+            values = decode(data, self.encoding, fill_value=np.nan)
+        else:
+            values = data.astype(np.float32)
+            missing = (data == self.fill_value) | ~np.isfinite(values)
+            if self.var_miss and self.var_miss[k] is not None:
+                missing |= data == self.var_miss[k]
+            values[missing] = np.nan
+        return values
+
+    def point(self, lat, lon, height=None, layer: int = None) -> dict:
+        """
+        經緯度點的值：指定 layer 時取該層，否則取波束高度最接近 height (海拔 m) 的層，
+        兩者都沒有時取最低層
+        """
+        if self.header is None:
+            raise ValueError("point queries need the site and grid information of the archive")
+        lat, lon = np.atleast_1d(np.asarray(lat, dtype=float)), np.atleast_1d(np.asarray(lon, dtype=float))
+        distance, azimuth = latlon_to_polar(lat, lon, self.site['rlat'], self.site['rlon'])
+        thetas = np.asarray(self.thetas, dtype=float)
+        if layer is not None:
+            k = np.full(lat.shape, self.layer_position(layer))
+        elif height is not None:
+            heights = beam_height(distance[None], thetas[:, None]) + self.site.get('radar_elev', 0.0)
+            k = np.argmin(np.abs(heights - np.asarray(height, dtype=float)), axis=0)
+        else:
+            k = np.full(lat.shape, int(np.argmin(thetas)))
+        ray, gate, valid = polar_index(ground_to_slant_range(distance, thetas[k]), azimuth, self.header)
+        values = np.full(lat.shape, np.nan, dtype=np.float32)
+        for position in np.unique(k):
+            sel = k == position
+            values[sel] = self.values(position, ray[sel], gate[sel])
+        values[~valid] = np.nan
+        return {'value': values, 'layer': np.asarray(self.layers)[k],
+                'height': beam_height(distance, thetas[k]) + self.site.get('radar_elev', 0.0),
+                'ray': ray, 'gate': gate, 'distance': distance}
+
+
+def archive_path(output_dir: str, site: str, date: str) -> str:
+    return os.path.join(output_dir, 'archive', f"{site}_{date}")
+
+
+def _npy_path(output_dir: str, date: str, time: str, param_type: str) -> str:
+    return os.path.join(output_dir, date, time, param_type, f"radar_matrix_{param_type}.npy")
+
+
+def _stat_version(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def volume_version(output_dir: str, site: str, date: str, time: str, param_type: str) -> tuple:
+    """
+    volume 來源檔案的版本 (資料庫 index 與 npy 的大小與 mtime)，重新處理後會改變
+
+    資料庫的 index 只會附加，每次寫入 chunk 都會改變其大小
+    """
+    return (_stat_version(os.path.join(archive_path(output_dir, site, date), INDEX_NAME)),
+            _stat_version(_npy_path(output_dir, date, time, param_type)))
+
+
+def load_volume(output_dir: str, site: str, date: str, time: str, param_type: str,
+                archive: VolumeArchive = None):
+    """
+    開啟某時間、某參數的 volume：優先使用每站每天的資料庫，否則以 memmap 開啟
+    output_dir/{date}/{time}/{param}/radar_matrix_{param}.npy
+
+    Parameters
+    ----------
+    archive : VolumeArchive, optional
+        已開啟的當天資料庫，未指定時開啟 (存在時)
+
+    Returns
+    -------
+    Volume or None
+        都不存在時為 None
+    """
+    path = archive_path(output_dir, site, date)
+    if archive is None and os.path.exists(os.path.join(path, META_NAME)):
+        archive = VolumeArchive(path)
+    if archive is not None:
+        layers = [n for n in archive.layers if (time, param_type, n) in archive]
+        if layers:
+            return Volume([archive.read_chunk(time, param_type, n, decoded=False) for n in layers], layers,
+                          archive.encoding(param_type), archive.fill_value, archive.attrs['site'],
+                          archive.attrs['header'], [archive.chunk_attrs(time, param_type, n)['theta']
+                                                    for n in layers])
+    npy_path = _npy_path(output_dir, date, time, param_type)
+    if not os.path.exists(npy_path):
+        return None
+    data = np.load(npy_path, mmap_mode='r')
+    encoding, var_miss = matrix_attrs(npy_path)
+    # npy 不記錄層數，依序編號
+    return Volume(list(data), range(1, len(data) + 1), encoding, var_miss=var_miss)
+
+
+def available_times(output_dir: str, site: str, date: str, param_type: str,
+                    archive: VolumeArchive = None) -> list:
+    """
+    某天某參數在資料庫或 npy 輸出中的所有時間 (archive 為已開啟的當天資料庫)
+    """
+    times = set()
+    path = archive_path(output_dir, site, date)
+    if archive is None and os.path.exists(os.path.join(path, META_NAME)):
+        archive = VolumeArchive(path)
+    if archive is not None:
+        times.update(t for t in archive.times if any((t, param_type, n) in archive for n in archive.layers))
+    date_dir = os.path.join(output_dir, date)
+    if os.path.isdir(date_dir):
+        times.update(t for t in os.listdir(date_dir) if os.path.exists(_npy_path(output_dir, date, t, param_type)))
+    return sorted(times)
+
+
+class VolumeCache:
+    """
+    以總 bytes 為上限的 LRU volume 快取 (memmap 也以其大小計算)
+
+    每個 volume 與其來源的版本一起快取，版本改變 (重新處理) 時重新載入；
+    多個 thread 同時要求同一個還沒載入的 volume 時只載入一次，其他 thread 等待同一個結果。
+    """
+
+    def __init__(self, loader, max_bytes: int):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (version, volume)
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, version=None):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            future = self._loading.get((key, version))
+            owner = future is None
+            if owner:
+                future = self._loading[(key, version)] = Future()
+                self.misses += 1
+        if not owner:
+            return future.result()
+
+        try:
+            volume = self.loader(*key)
+        except BaseException as exc:
+            with self._lock:
+                del self._loading[(key, version)]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._loading[(key, version)]
+            stale = self._entries.pop(key, None)
+            if stale is not None:
+                self.nbytes -= stale[1].nbytes
+            if volume is not None:  # 不存在的 volume 不快取，之後可能會寫入
+                self._entries[key] = (version, volume)
+                self.nbytes += volume.nbytes
+                while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+        future.set_result(volume)
+        return volume
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'volumes': len(self._entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def _to_json(obj):
+    # NaN 轉成 null
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind != 'f':
+            return obj.tolist()
+        values = obj.astype(object)
+        values[np.isnan(obj)] = None
+        return values.tolist()
+    if isinstance(obj, dict):
+        return {k: _to_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_json(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and obj != obj:
+        return None
+    return obj
+
+
+def _finite(text: str, name: str) -> float:
+    value = float(text)
+    if not np.isfinite(value):
+        raise ValueError(f"{name} must be a finite number, got {text!r}")
+    return value
+
+
+class QueryService:
+    """
+    處理查詢 (與 HTTP 無關，可直接呼叫)
+
+    - point: date, time, param, lat, lon (逗號分隔可查多點)，height (海拔 m) 或 layer
+    - ray: date, time, param, layer, azimuth
+    - sweep: date, time, param, layer
+    - series: date, param, lat, lon, height 或 layer，start 與 end 時間 (含)
+    """
+
+    def __init__(self, config: dict):
+        options = config.get('query') or {}
+        self.output_dir = os.path.normpath(os.path.abspath(config['output_dir']))
+        self.site = config.get('site', 'RCWF')
+        self.cache = VolumeCache(self._load, int(options.get('cache_mb', 1024) * 2 ** 20))
+        self._archives = {}  # 資料庫路徑 -> (index 版本, VolumeArchive)
+        self._archives_lock = threading.Lock()
+
+    def archive(self, site: str, date: str):
+        """
+        當天的資料庫 (不存在時為 None)；index 沒有改變時沿用已開啟的物件
+        """
+        path = archive_path(self.output_dir, site, date)
+        version = _stat_version(os.path.join(path, INDEX_NAME))
+        with self._archives_lock:
+            cached = self._archives.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        if not os.path.exists(os.path.join(path, META_NAME)):
+            return None
+        archive = VolumeArchive(path)
+        with self._archives_lock:
+            self._archives[path] = (version, archive)
+        return archive
+
+    def _load(self, site, date, time, param_type):
+        return load_volume(self.output_dir, site, date, time, param_type, self.archive(site, date))
+
+    def volume(self, args: dict, time: str = None) -> Volume:
+        key = (args.get('site', self.site), args['date'], time or args['time'], args['param'])
+        volume = self.cache.get(key, volume_version(self.output_dir, *key))
+        if volume is None:
+            raise FileNotFoundError(f"no processed output for {'/'.join(key)}")
+        return volume
+
+    def query(self, kind: str, args: dict):
+        """
+        Returns
+        -------
+        Tuple[dict, np.ndarray or None]
+            座標/資訊，以及陣列結果 (point 與 series 的結果在 dict 中)
+        """
+        layer = int(args['layer']) if 'layer' in args else None
+        if kind in ('point', 'series'):
+            lat = [_finite(v, 'lat') for v in args['lat'].split(',')]
+            lon = [_finite(v, 'lon') for v in args['lon'].split(',')]
+            height = _finite(args['height'], 'height') if 'height' in args else None
+        if kind == 'point':
+            result = self.volume(args).point(lat, lon, height, layer)
+            return dict(result, lat=lat, lon=lon), None
+        if kind == 'series':
+            site = args.get('site', self.site)
+            times = [t for t in available_times(self.output_dir, site, args['date'], args['param'],
+                                                self.archive(site, args['date']))
+                     if args.get('start', '0000') <= t <= args.get('end', '9999')]
+            values = np.full((len(times), len(lat)), np.nan, dtype=np.float32)
+            for i, time in enumerate(times):
+                values[i] = self.volume(args, time).point(lat, lon, height, layer)['value']
+            return {'times': times, 'lat': lat, 'lon': lon, 'value': values}, None
+
+        volume = self.volume(args)
+        if layer is None:
+            raise KeyError('layer')
+        k = volume.layer_position(layer)
+        info = {'layer': layer, 'theta': volume.thetas[k] if volume.thetas else None}
+        if volume.header is not None:
+            info['header'] = volume.header  # 距離 = gate_start + gate_sp * gate (m)
+        if kind == 'ray':
+            azimuth = _finite(args['azimuth'], 'azimuth')
+            if volume.header is not None:
+                ray, _, valid = polar_index(np.array([volume.header['gate_start']]), np.array([azimuth]),
+                                            volume.header)
+                if not valid[0]:
+                    raise ValueError(f"azimuth {azimuth} outside the sweep")
+                ray = int(ray[0])
+            else:
+                ray = int(round(azimuth)) % volume.sweeps[k].shape[0]
+            return dict(info, ray=ray), volume.values(k, ray)
+        if kind == 'sweep':
+            return info, volume.values(k)
+        raise ValueError(f"Unknown query type: {kind}")
+
+    def status(self) -> dict:
+        return {'output_dir': self.output_dir, 'queries': list(QUERY_TYPES), 'cache': self.cache.stats()}
+
+
+def _handler(service: QueryService):
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            kind = url.path.strip('/') or 'status'
+            args = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                if kind == 'status':
+                    return self._send_json(service.status())
+                if kind not in QUERY_TYPES:
+                    return self._send_json({'error': f"unknown query {kind}"}, 404)
+                info, array = service.query(kind, args)
+            except FileNotFoundError as exc:
+                return self._send_json({'error': str(exc)}, 404)
+            except KeyError as exc:
+                return self._send_json({'error': f"missing or unknown {exc}"}, 400)
+            except ValueError as exc:
+                return self._send_json({'error': str(exc)}, 400)
+
+            fmt = args.get('format', 'json' if array is None else 'npy')
+            if fmt == 'npy' and array is not None:
+                # 陣列以 npy 回傳 (缺失為 NaN)，座標資訊放在 X-Radar-Info header
+                buf = io.BytesIO()
+                np.save(buf, array)
+                return self._send(buf.getvalue(), 'application/octet-stream',
+                                  {'X-Radar-Info': json.dumps(_to_json(info))})
+            if array is not None:
+                info = dict(info, value=array)
+            return self._send_json(info)
+
+        def _send_json(self, obj, status: int = 200):
+            self._send(json.dumps(_to_json(obj)).encode(), 'application/json', status=status)
+
+        def _send(self, body: bytes, content_type: str, headers: dict = None, status: int = 200):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+
+def run_query_server(config: dict):
+    """
+    在本機執行查詢服務 (python main.py --query)，Ctrl-C 結束
+    """
+    options = config.get('query') or {}
+    service = QueryService(config)
+    server = ThreadingHTTPServer((options.get('host', '127.0.0.1'), options.get('port', 8765)),
+                                 _handler(service))
+    host, port = server.server_address[:2]
+    print(f"Serving {service.output_dir} on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped")
+    finally:
+        server.server_close()
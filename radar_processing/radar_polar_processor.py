@@ -1,8 +1,21 @@
 import numpy as np
-from pyart.config import get_metadata
-from pyart.core.radar import Radar
 from .RadarDataProcessorClass import RadarDataProcessor
-from typing import Tuple
+from .quantize import Encoding, encode
+from .regrid import get_aggregate_plan, get_nearest_plan, get_pyramid_plan, source_geometry, target_geometry
+import datetime
+import os
+from typing import TYPE_CHECKING, Tuple
+
+# pyart 只在建立 Radar 物件時才載入，只做讀檔與重新網格化時不需要
+if TYPE_CHECKING:
+    from pyart.core.radar import Radar
+
+
+def is_dbz_field(filename: str) -> bool:
+    """
+    依檔名判斷是否為 dBZ 回波場 (bref_qc, ref_raw, cref)
+    """
+    return 'ref' in os.path.basename(filename)
 
  
 def regrid_polar_data(radar_obj: "RadarDataProcessor", 
@@ -11,7 +24,11 @@ def regrid_polar_data(radar_obj: "RadarDataProcessor",
                       new_gate_start: float = 1.0,
                       new_gate_sp: float = 1.0,
                       new_azm_start: float = 0.0,
-                      new_azm_sp: float = 1.0) -> Tuple[np.ndarray, dict]:
+                      new_azm_sp: float = 1.0,
+                      method: str = 'nearest',
+                      is_dbz: bool = None,
+                      out: np.ndarray = None,
+                      encoding: Encoding = None) -> Tuple[np.ndarray, dict]:
     """
     將雷達資料重新網格化到新的解析度
     
@@ -31,39 +48,46 @@ def regrid_polar_data(radar_obj: "RadarDataProcessor",
         新的起始方位角(度)
     new_azm_sp : float
         新的方位角間隔(度)
+    method : str
+        'nearest' 取最近的原始 gate；'mean', 'max', 'median', 'fraction'
+        則聚合新格點內所有原始 gate ('fraction' 為有效 gate 比例)
+    is_dbz : bool, optional
+        'mean' 是否在線性 Z 空間平均，預設依檔名判斷是否為回波場
+    out : np.ndarray, optional
+        預先配置的 (new_nray, new_ngate) 輸出陣列 (例如 volume 的某一層)
+    encoding : quantize.Encoding, optional
+        指定時輸出整數 code ('nearest' 直接對 code 取樣，不換算成浮點數)，
+        缺失為 encoding.missing
         
     Returns
     -------
     Tuple[np.ndarray, dict]
-        重新網格化後的資料陣列和更新後的header資訊
+        重新網格化後的資料陣列和更新後的header資訊；超出原始距離範圍或沒有有效資料為
+        rf_miss (-44400)，'nearest' 的浮點數輸出與原本相同，保留原始的 var_miss (var_miss / var_scale)
     """
-    # 獲取原始資料參數
-    orig_data = radar_obj.data
-    orig_gate_start = radar_obj.gate_start / 1000.0  # 轉換到km
-    orig_gate_sp = radar_obj.gate_sp / 1000.0        # 轉換到km
-    orig_azm_start = radar_obj.azm_start
-    orig_azm_sp = radar_obj.azm_sp
-    
-    # 創建新的資料陣列
-    new_data = np.zeros((new_nray, new_ngate), dtype=np.float32)
-    
-    # 對每個新的網格點進行插值
-    for j in range(new_nray):
-        for i in range(new_ngate):
-            # 計算新網格點的實際距離和方位角
-            range_val = new_gate_start + new_gate_sp * i
-            azimuth = np.mod(new_azm_start + new_azm_sp * j, 360.0)
-            
-            # 計算對應的原始網格索引
-            gate_idx = round((range_val - orig_gate_start) / orig_gate_sp)
-            azm_idx = round((azimuth - orig_azm_start) / orig_azm_sp)
-            azm_idx = np.mod(azm_idx, radar_obj.nray)
-            
-            # 檢查索引是否在有效範圍內
-            if 0 <= gate_idx < radar_obj.ngate and 0 <= azm_idx < radar_obj.nray:
-                new_data[j, i] = orig_data[azm_idx, gate_idx]
-            else:
-                new_data[j, i] = radar_obj.rf_miss  # 使用缺失值
+    src = source_geometry(radar_obj)
+    dst = target_geometry(new_ngate, new_nray,
+                          new_gate_start, new_gate_sp,
+                          new_azm_start, new_azm_sp)
+    if method == 'nearest' and encoding is not None:
+        new_data = get_nearest_plan(src, dst).apply(radar_obj.codes(encoding), encoding.missing,
+                                                    dtype=encoding.dtype, out=out)
+    elif method == 'nearest':
+        # 取得 (快取的) 取樣索引表，一次 fancy-index 完成整個 sweep
+        new_data = get_nearest_plan(src, dst).apply(radar_obj.data, radar_obj.rf_miss, out=out)
+    else:
+        if is_dbz is None:
+            is_dbz = is_dbz_field(radar_obj.fname)
+        new_data = get_aggregate_plan(src, dst).apply(radar_obj.data, radar_obj.valid_mask(),
+                                                      radar_obj.rf_miss, method=method,
+                                                      is_dbz=is_dbz, out=None if encoding else out)
+        if encoding is not None:
+            # 聚合在浮點數中進行，結果再編碼
+            codes = encode(new_data, encoding, missing_value=radar_obj.rf_miss)
+            if out is not None:
+                out[...] = codes
+                codes = out
+            new_data = codes
     
     # 更新header資訊
     new_header = {
@@ -76,113 +100,192 @@ def regrid_polar_data(radar_obj: "RadarDataProcessor",
     }
     
     return new_data, new_header
-   
-def read_cwb_radar_sweep(fname):
+
+
+def var_miss_value(radar_obj: "RadarDataProcessor") -> float:
     """
-    Return an Radar object, representing a PPI scan.
+    原始 var_miss 換算後的物理量 ('nearest' 浮點數輸出中的缺失值)
+    """
+    return float(np.float32(np.divide(radar_obj.var_miss, radar_obj.var_scale, dtype=radar_obj.dtype)))
+
+
+def regrid_pyramid(radar_obj: "RadarDataProcessor", levels=(0.5, 1.0, 2.0, 4.0),
+                   new_ngate: int = 459,
+                   new_nray: int = 360,
+                   new_gate_start: float = 1.0,
+                   new_gate_sp: float = 1.0,
+                   new_azm_start: float = 0.0,
+                   new_azm_sp: float = 1.0,
+                   method: str = 'mean',
+                   is_dbz: bool = None) -> list:
+    """
+    一次聚合出多個距離解析度 (見 regrid.PyramidPlan)
 
     Parameters
     ----------
-    ngates : int
-        Number of gates per ray.
-    rays_per_sweep : int
-        Number of rays in each PPI sweep.
-    nsweeps : int
-        Number of sweeps.
+    radar_obj : RadarDataProcessor
+        原始雷達資料物件
+    levels : tuple
+        距離間隔(km)，每一層須為前一層的整數倍
+    new_ngate, new_nray, new_gate_start, new_gate_sp, new_azm_start, new_azm_sp
+        參考網格 (見 regrid_polar_data)，各層共用其第一個 bin 的下緣、距離範圍與方位角設定
+    method : str
+        'mean', 'max' 或 'fraction' ('median' 無法由較細一層合併)
+    is_dbz : bool, optional
+        見 regrid_polar_data
 
     Returns
     -------
-    radar : Radar
-        Radar object with no fields, other parameters are set to default
-        values.
-    transforming CWB data into object	
+    list
+        由細到粗每一層的 (資料, header)
+    """
+    src = source_geometry(radar_obj)
+    dst = target_geometry(new_ngate, new_nray, new_gate_start, new_gate_sp, new_azm_start, new_azm_sp)
+    if is_dbz is None:
+        is_dbz = is_dbz_field(radar_obj.fname)
+    plan = get_pyramid_plan(src, dst, tuple(float(sp) for sp in levels))
+    outputs = plan.apply(radar_obj.data, radar_obj.valid_mask(), radar_obj.rf_miss, method=method, is_dbz=is_dbz)
+    results = []
+    for data, (nray, ngate, azm_start, azm_sp, gate_start, gate_sp) in zip(outputs, plan.geometries):
+        header = {'nray': nray, 'ngate': ngate, 'azm_start': azm_start, 'azm_sp': azm_sp,
+                  'gate_start': gate_start * 1000, 'gate_sp': gate_sp * 1000}
+        results.append((data, header))
+    return results
+   
+# 檔名關鍵字 -> pyart 欄位名稱 (依序比對)
+FIELD_NAMES = [
+    ('ref_qc', 'corrected_reflectivity'),
+    ('ref_raw', 'reflectivity'),
+    ('vel', 'velocity'),
+    ('phi', 'differential_phase'),
+    ('zdr', 'differential_reflectivity'),
+    ('rho', 'cross_correlation_ratio'),
+    ('cref', 'composite_reflectivity'),
+    ('spw', 'spectrum_width'),
+]
+
 
+def field_name(filename: str) -> str:
     """
-    cwb_radar_object = RadarDataProcessor(fname)
+    依檔名判斷 pyart 欄位名稱
+    """
+    for key, varname in FIELD_NAMES:
+        if key in filename:
+            return varname
+    raise ValueError(f"Cannot determine field name from {filename}")
+
+
+def _sweep_datetime(radar_obj: "RadarDataProcessor") -> datetime.datetime:
+    return datetime.datetime(radar_obj.yyyy, radar_obj.mm, radar_obj.dd,
+                             radar_obj.hh, radar_obj.mn, radar_obj.ss)
+
 
-    ngates = cwb_radar_object.ngate
-    rays_per_sweep = cwb_radar_object.nray
-    nsweeps = 1
+def _build_radar(varname: str, field_data: np.ndarray, radar_objs: list, geometry: dict) -> "Radar":
+    """
+    由一或多個 sweep 建立 Radar 物件 (metadata 只建立一次)
 
+    Parameters
+    ----------
+    varname : str
+        pyart 欄位名稱
+    field_data : np.ndarray
+        (nsweeps * nray, ngate) 的資料，直接作為欄位資料不另外複製
+    radar_objs : list
+        每個 sweep 的 RadarDataProcessor (只用到 header，可為 lazy 物件)
+    geometry : dict
+        nray, ngate, azm_start, azm_sp, gate_start, gate_sp (gate 單位為 m)
+    """
+    from pyart.config import get_metadata
+    from pyart.core.radar import Radar
+
+    site = radar_objs[0]
+    nsweeps = len(radar_objs)
+    rays_per_sweep = geometry['nray']
+    ngates = geometry['ngate']
     nrays = rays_per_sweep * nsweeps
 
-    time = get_metadata('time')
-    _range = get_metadata('range')
-    latitude = get_metadata('latitude')
-    longitude = get_metadata('longitude')
-    altitude = get_metadata('altitude')
-    sweep_number = get_metadata('sweep_number')
-    sweep_mode = get_metadata('sweep_mode')
-    fixed_angle = get_metadata('fixed_angle')
-    sweep_start_ray_index = get_metadata('sweep_start_ray_index')
-    sweep_end_ray_index = get_metadata('sweep_end_ray_index')
-    azimuth = get_metadata('azimuth')
-    elevation = get_metadata('elevation')
-    if ("ref_qc" in fname):
-        varname = 'corrected_reflectivity'
-    elif ("ref_raw" in fname):
-        varname = 'reflectivity'
-    elif ("vel" in fname):
-        varname = 'velocity'
-    elif ("phi" in fname):
-        varname = 'differential_phase'
-    elif ("zdr" in fname):
-        varname = 'differential_reflectivity'
-    elif ("rho" in fname):
-        varname = 'cross_correlation_ratio'
-    elif ('cref' in fname):
-        varname = 'composite_reflectivity'
-    elif ('spw' in fname):
-        varname = 'spectrum_width'
+    # 準備metadata
+    (time, _range, latitude, longitude, altitude, sweep_number, sweep_mode, fixed_angle,
+     sweep_start_ray_index, sweep_end_ray_index, azimuth, elevation) = [
+        get_metadata(name) for name in
+        ('time', 'range', 'latitude', 'longitude', 'altitude', 'sweep_number', 'sweep_mode',
+         'fixed_angle', 'sweep_start_ray_index', 'sweep_end_ray_index', 'azimuth', 'elevation')]
 
+    # 設定資料欄位
     data_dict = get_metadata(varname)
-    data_dict['data'] = np.array(cwb_radar_object.data, dtype='float32')
+    data_dict['data'] = field_data
     fields = {varname: data_dict}
-    scan_type = 'ppi'
-    metadata = {'instrument_name': cwb_radar_object.name}
-
-    time['data'] = np.arange(nrays, dtype='float64')
-#    time['units'] = 'seconds since 1989-01-01T00:00:01Z'
-    time['units'] = 'seconds since '+str(cwb_radar_object.yyyy) +\
-        '-'+format(cwb_radar_object.mm, '02d') +\
-        '-'+format(cwb_radar_object.dd, '02d') +\
-        'T'+format(cwb_radar_object.hh, '02d') +\
-        ':'+format(cwb_radar_object.mn, '02d') +\
-        ':'+format(cwb_radar_object.ss, '02d')+'Z'
-    _range['data'] = np.linspace(cwb_radar_object.gate_start, cwb_radar_object.gate_start +
-                                 cwb_radar_object.gate_sp*(ngates-1), ngates).astype('float32')
-
-    latitude['data'] = np.array([cwb_radar_object.rlat], dtype='float64')
-    longitude['data'] = np.array([cwb_radar_object.rlon], dtype='float64')
-    altitude['data'] = np.array([cwb_radar_object.radar_elev], dtype='float64')
-    
+
+    # 設定時間 (每個 sweep 以第一個 sweep 的時間為基準)
+    start = _sweep_datetime(site)
+    sweep_offset = np.array([(_sweep_datetime(obj) - start).total_seconds() for obj in radar_objs])
+    time['data'] = (np.repeat(sweep_offset, rays_per_sweep) +
+                    np.tile(np.arange(rays_per_sweep, dtype='float64'), nsweeps))
+    time['units'] = (f'seconds since {site.yyyy:04d}-{site.mm:02d}-{site.dd:02d}'
+                     f'T{site.hh:02d}:{site.mn:02d}:{site.ss:02d}Z')
+
+    # 設定距離
+    _range['data'] = np.linspace(geometry['gate_start'],
+                                 geometry['gate_start'] + geometry['gate_sp'] * (ngates-1),
+                                 ngates).astype('float32')
+
+    # 設定位置資訊
+    latitude['data'] = np.array([site.rlat], dtype='float64')
+    longitude['data'] = np.array([site.rlon], dtype='float64')
+    altitude['data'] = np.array([site.radar_elev], dtype='float64')
+
+    # 設定掃描資訊
+    thetas = np.array([obj.theta for obj in radar_objs], dtype='float32')
     sweep_number['data'] = np.arange(nsweeps, dtype='int32')
     sweep_mode['data'] = np.array(['azimuth_surveillance'] * nsweeps)
-    fixed_angle['data'] = np.array(
-        [cwb_radar_object.theta] * nsweeps, dtype='float32')
-    sweep_start_ray_index['data'] = np.arange(0, nrays, rays_per_sweep,
-                                              dtype='int32')
-    sweep_end_ray_index['data'] = np.arange(rays_per_sweep - 1, nrays,
-                                            rays_per_sweep, dtype='int32')
-
-  #  azimuth['data'] = np.arange(nrays, dtype='float32')
-    azimuth['data'] = np.linspace(cwb_radar_object.azm_start, cwb_radar_object.azm_start +
-                                  cwb_radar_object.azm_sp*(nrays-1), nrays, dtype='float32')
-#    azimuth['data'] = np.linspace(cwb_radar_object.azm_start,cwb_radar_object.azm_start+0.5*(nrays-1),nrays, dtype='float32')
-    elevation['data'] = np.array(
-        [cwb_radar_object.theta] * nrays, dtype='float32')
-    
+    fixed_angle['data'] = thetas
+    sweep_start_ray_index['data'] = np.arange(0, nrays, rays_per_sweep, dtype='int32')
+    sweep_end_ray_index['data'] = np.arange(rays_per_sweep - 1, nrays, rays_per_sweep, dtype='int32')
+
+    # 設定方位角和仰角
+    sweep_azimuth = np.linspace(geometry['azm_start'],
+                                geometry['azm_start'] + geometry['azm_sp'] * (rays_per_sweep-1),
+                                rays_per_sweep, dtype='float32')
+    azimuth['data'] = np.tile(sweep_azimuth, nsweeps)
+    elevation['data'] = np.repeat(thetas, rays_per_sweep)
+
+    # 建立metadata
+    metadata = {'instrument_name': site.name}
+    scan_type = 'ppi'
     return Radar(time, _range, fields, metadata, scan_type,
                  latitude, longitude, altitude,
-                 sweep_number, sweep_mode, fixed_angle, sweep_start_ray_index,
-                 sweep_end_ray_index,
+                 sweep_number, sweep_mode, fixed_angle,
+                 sweep_start_ray_index, sweep_end_ray_index,
                  azimuth, elevation,
                  instrument_parameters=None)
 
+
+def read_cwb_radar_sweep(fname):
+    """
+    Return an Radar object, representing a PPI scan.
+
+    Parameters
+    ----------
+    fname : str
+        CWB 極座標雷達檔案
+
+    Returns
+    -------
+    radar : Radar
+        Radar object with a single sweep.
+    transforming CWB data into object	
+
+    """
+    cwb_radar_object = RadarDataProcessor(fname)
+    geometry = {k: getattr(cwb_radar_object, k)
+                for k in ('nray', 'ngate', 'azm_start', 'azm_sp', 'gate_start', 'gate_sp')}
+    return _build_radar(field_name(fname), np.array(cwb_radar_object.data, dtype='float32'),
+                        [cwb_radar_object], geometry)
+
 def create_radar_object_from_regridded(filename: str, 
                                      new_data: np.ndarray,
                                      radar_obj: "RadarDataProcessor",
-                                     new_header: dict) -> Radar:
+                                     new_header: dict) -> "Radar":
     """
     將重新網格化後的資料轉換為 pyart.core.radar.Radar 物件
     
@@ -202,88 +305,65 @@ def create_radar_object_from_regridded(filename: str,
     Radar
         可供pyart使用的Radar物件
     """
-    # 設定基本參數
-    nsweeps = 1
-    nrays = new_header['nray']
     ngates = new_header['ngate']
-    
-    # 準備metadata
-    time = get_metadata('time')
-    _range = get_metadata('range')
-    latitude = get_metadata('latitude')
-    longitude = get_metadata('longitude')
-    altitude = get_metadata('altitude')
-    sweep_number = get_metadata('sweep_number')
-    sweep_mode = get_metadata('sweep_mode')
-    fixed_angle = get_metadata('fixed_angle')
-    sweep_start_ray_index = get_metadata('sweep_start_ray_index')
-    sweep_end_ray_index = get_metadata('sweep_end_ray_index')
-    azimuth = get_metadata('azimuth')
-    elevation = get_metadata('elevation')
-
-    # 判斷資料類型
-    if "ref_qc" in filename:
-        varname = 'corrected_reflectivity'
-    elif "ref_raw" in filename:
-        varname = 'reflectivity'
-    elif "vel" in filename:
-        varname = 'velocity'
-    elif "phi" in filename:
-        varname = 'differential_phase'
-    elif "zdr" in filename:
-        varname = 'differential_reflectivity'
-    elif "rho" in filename:
-        varname = 'cross_correlation_ratio'
-    elif 'cref' in filename:
-        varname = 'composite_reflectivity'
-    elif 'spw' in filename:
-        varname = 'spectrum_width'
+    radar = _build_radar(field_name(filename), new_data, [radar_obj], new_header)
+    distances = np.linspace(
+        new_header['gate_start']/1000,
+        new_header['gate_start']/1000 + new_header['gate_sp']/1000 * (ngates),
+        ngates
+    )
+    return radar, distances
 
-    # 設定資料欄位
-    data_dict = get_metadata(varname)
-    data_dict['data'] = new_data
-    fields = {varname: data_dict}
-    
-    # 設定時間
-    time['data'] = np.arange(nrays, dtype='float64')
-    time['units'] = (f'seconds since {radar_obj.yyyy:04d}-{radar_obj.mm:02d}-{radar_obj.dd:02d}'
-                    f'T{radar_obj.hh:02d}:{radar_obj.mn:02d}:{radar_obj.ss:02d}Z')
 
-    # 設定距離
-    _range['data'] = np.linspace(new_header['gate_start'], 
-                                new_header['gate_start'] + new_header['gate_sp'] * (ngates-1),
-                                ngates).astype('float32')
+def regrid_volume(radar_objs: list, **kwargs) -> Tuple[np.ndarray, dict]:
+    """
+    將多個 sweep 直接重新網格化到一個連續的 (nsweeps, nray, ngate) 陣列
 
-    # 設定位置資訊
-    latitude['data'] = np.array([radar_obj.rlat], dtype='float64')
-    longitude['data'] = np.array([radar_obj.rlon], dtype='float64')
-    altitude['data'] = np.array([radar_obj.radar_elev], dtype='float64')
+    Parameters
+    ----------
+    radar_objs : list
+        每個 sweep 的 RadarDataProcessor
+    kwargs
+        傳給 regrid_polar_data 的網格設定
 
-    # 設定掃描資訊
-    sweep_number['data'] = np.arange(nsweeps, dtype='int32')
-    sweep_mode['data'] = np.array(['azimuth_surveillance'] * nsweeps)
-    fixed_angle['data'] = np.array([radar_obj.theta] * nsweeps, dtype='float32')
-    sweep_start_ray_index['data'] = np.arange(0, nrays, nrays, dtype='int32')
-    sweep_end_ray_index['data'] = np.arange(nrays-1, nrays, nrays, dtype='int32')
+    Returns
+    -------
+    Tuple[np.ndarray, dict]
+        重新網格化後的 volume 和 header 資訊
+    """
+    first, new_header = regrid_polar_data(radar_objs[0], **kwargs)
+    volume = np.empty((len(radar_objs),) + first.shape, dtype=first.dtype)
+    volume[0] = first
+    # 其餘各層直接寫入 volume 的切片
+    for k, radar_obj in enumerate(radar_objs[1:], start=1):
+        regrid_polar_data(radar_obj, out=volume[k], **kwargs)
+    return volume, new_header
 
-    # 設定方位角和仰角
-    azimuth['data'] = np.linspace(new_header['azm_start'],
-                                 new_header['azm_start'] + new_header['azm_sp'] * (nrays-1),
-                                 nrays, dtype='float32')
-    elevation['data'] = np.array([radar_obj.theta] * nrays, dtype='float32')
 
-    # 建立metadata
-    metadata = {'instrument_name': radar_obj.name}
-    scan_type = 'ppi'
-    distances = np.linspace(
-        new_header['gate_start']/1000,
-        new_header['gate_start']/1000 + new_header['gate_sp']/1000 * (ngates),
-        ngates
-    )
-    return Radar(time, _range, fields, metadata, scan_type,
-                latitude, longitude, altitude,
-                sweep_number, sweep_mode, fixed_angle,
-                sweep_start_ray_index, sweep_end_ray_index,
-                azimuth, elevation,
-                instrument_parameters=None),distances
-    
+def create_radar_volume(filename: str,
+                        volume: np.ndarray,
+                        radar_objs: list,
+                        new_header: dict) -> "Radar":
+    """
+    將多層重新網格化後的資料組成單一的多 sweep Radar 物件
+
+    Parameters
+    ----------
+    filename : str
+        任一層的檔案名稱(用於判斷資料類型)
+    volume : np.ndarray
+        (nsweeps, nray, ngate) 的資料；C-contiguous 時欄位資料直接使用其 view
+    radar_objs : list
+        每個 sweep 的 RadarDataProcessor (只用到 header，可用 RadarDataProcessor.peek)
+    new_header : dict
+        新的header資訊
+
+    Returns
+    -------
+    Radar
+        sweep_start_ray_index / fixed_angle 對應各層的 Radar 物件
+    """
+    if len(volume) != len(radar_objs):
+        raise ValueError(f"{len(volume)} sweeps but {len(radar_objs)} radar objects")
+    field_data = np.ascontiguousarray(volume).reshape(-1, new_header['ngate'])
+    return _build_radar(field_name(filename), field_data, list(radar_objs), new_header)
@@ -0,0 +1,190 @@
+import math
+import struct
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw
+from visualize.colormap import nws_precip_rgb
+from .geometry import SHAPE_PATH, check_shapefile, ground_to_slant_range, latlon_to_polar, polar_index
+
+MISSING_CODE = 0  # 缺失值或超出色階範圍 (背景色)
+NUM_LEVELS = 253  # 色階範圍內的量化階數 (code 1-253)
+OVERLAY_CODE = 254  # 縣市界線與標題
+BACKGROUND = (255, 255, 255)
+OVERLAY_COLOR = (0, 0, 0)
+
+
+@lru_cache(maxsize=4)
+def read_shapefile_parts(shape_path: str) -> list:
+    """
+    讀取 shapefile (.shp) 中所有 polygon / polyline 的各段座標
+
+    Returns
+    -------
+    list
+        每段為 (N, 2) 的 (lon, lat) 陣列 (快取，勿修改)
+
+    Raises
+    ------
+    FileNotFoundError
+        .shp 不存在時
+    """
+    check_shapefile(shape_path)
+    with open(shape_path + '.shp', 'rb') as fh:
+        buf = fh.read()
+    parts = []
+    pos = 100  # 檔頭
+    while pos + 8 <= len(buf):
+        _, content_length = struct.unpack('>2i', buf[pos:pos + 8])
+        content = buf[pos + 8:pos + 8 + content_length * 2]
+        pos += 8 + content_length * 2
+        shape_type = struct.unpack('<i', content[:4])[0]
+        if shape_type not in (3, 5, 13, 15, 23, 25):  # polyline / polygon (含 Z, M)
+            continue
+        num_parts, num_points = struct.unpack('<2i', content[36:44])
+        starts = list(struct.unpack(f'<{num_parts}i', content[44:44 + 4 * num_parts]))
+        points = np.frombuffer(content, dtype='<f8', count=2 * num_points,
+                               offset=44 + 4 * num_parts).reshape(num_points, 2)
+        for start, end in zip(starts, starts[1:] + [num_points]):
+            parts.append(points[start:end])
+    return parts
+
+
+def colormap_lut() -> np.ndarray:
+    """
+    由 nws_precip_colors 建立 256 階的 RGBA 色表
+
+    code 0 為缺失值 (透明)，code 1-253 將色階範圍 [vmin, vmax] 等分 (見 quantize_levels)，
+    每階取區間中點在 ListedColormap 中對應的顏色。
+    """
+    colors = nws_precip_rgb()
+    centers = (np.arange(NUM_LEVELS) + 0.5) / NUM_LEVELS
+    idx = np.minimum((centers * len(colors)).astype(np.intp), len(colors) - 1)
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[1:NUM_LEVELS + 1, :3] = colors[idx]
+    lut[1:NUM_LEVELS + 1, 3] = 255
+    return lut
+
+
+@lru_cache(maxsize=1)
+def shared_palette() -> bytes:
+    """
+    所有畫面共用的 256 色調色盤 (背景、色階、界線)，可直接用於 'P' 模式影像
+    """
+    palette = colormap_lut()[:, :3].copy()
+    palette[MISSING_CODE] = BACKGROUND
+    palette[OVERLAY_CODE] = OVERLAY_COLOR
+    palette[OVERLAY_CODE + 1:] = OVERLAY_COLOR
+    return palette.tobytes()
+
+
+def quantize_levels(values: np.ndarray, vmin: float = 0, vmax: float = 65) -> np.ndarray:
+    """
+    將數值量化成 colormap_lut 的 uint8 code (範圍外與 NaN 為 MISSING_CODE)
+    """
+    values = np.asarray(values, dtype=np.float32)
+    with np.errstate(invalid='ignore'):
+        inside = (values >= vmin) & (values <= vmax)
+        level = np.floor((values - vmin) * (NUM_LEVELS / (vmax - vmin)))
+    codes = np.clip(level, 0, NUM_LEVELS - 1) + 1
+    return np.where(inside, codes, MISSING_CODE).astype(np.uint8)
+
+
+@lru_cache(maxsize=16)
+def _frame_polar(rlat: float, rlon: float, size: tuple, radius_km: float):
+    """
+    畫面範圍 (雷達站周圍 radius_km 公里) 與每個像素中心相對雷達站的地表距離、方位角
+    """
+    width, height = size
+    lat_range = radius_km / 111  # 每緯度約為 111 公里
+    lon_range = radius_km / (111 * math.cos(math.radians(rlat)))  # 每經度距離依緯度變化
+    extent = (rlon - lon_range, rlon + lon_range, rlat - lat_range, rlat + lat_range)
+
+    # 像素中心的經緯度 (等經緯度投影)
+    lon = extent[0] + (np.arange(width) + 0.5) * (2 * lon_range / width)
+    lat = extent[3] - (np.arange(height) + 0.5) * (2 * lat_range / height)
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    distance, azimuth = latlon_to_polar(lat2d, lon2d, rlat, rlon)
+    return extent, distance, azimuth
+
+
+@lru_cache(maxsize=16)
+def _rasterize_overlay(extent: tuple, size: tuple) -> np.ndarray:
+    """
+    將縣市界線 (含海岸線) 畫成畫面大小的遮罩
+    """
+    width, height = size
+    mask = Image.new('1', size, 0)
+    draw = ImageDraw.Draw(mask)
+    for part in read_shapefile_parts(SHAPE_PATH):
+        x = (part[:, 0] - extent[0]) * (width / (extent[1] - extent[0]))
+        y = (extent[3] - part[:, 1]) * (height / (extent[3] - extent[2]))
+        draw.line(list(zip(x.tolist(), y.tolist())), fill=1, width=1)
+    return np.asarray(mask, dtype=bool)
+
+
+class RasterRenderer:
+    """
+    不經過 pyart / Basemap 的 PPI 快速出圖
+
+    對某雷達站、某仰角與輸出大小預先計算每個像素對應的 (ray, gate)
+    索引以及縣市界線圖層，之後每張圖只需要 gather + 色表 + PNG 編碼。
+    畫面範圍與 visualize_and_save 相同 (雷達站周圍 radius_km 公里)。
+    """
+
+    def __init__(self, rlat: float, rlon: float, header: dict, theta: float = 0.0,
+                 size: tuple = (600, 600), radius_km: float = 150,
+                 vmin: float = 0, vmax: float = 65):
+        self.extent, distance, azimuth = _frame_polar(float(rlat), float(rlon), tuple(size), radius_km)
+        self.size = size
+        self.vmin, self.vmax = vmin, vmax
+
+        # 像素 -> (ray, gate) 查表
+        ray, gate, valid = polar_index(ground_to_slant_range(distance, theta), azimuth, header)
+        self.shape = (header['nray'], header['ngate'])
+        self.index = np.where(valid, ray * header['ngate'] + gate, 0)
+        self.valid = valid
+        self.overlay = _rasterize_overlay(self.extent, tuple(size))
+
+    def codes(self, data: np.ndarray) -> np.ndarray:
+        """
+        重新網格化後的資料 (nray, ngate) 轉成每個像素的色表 code (height, width)
+        """
+        if data.shape != self.shape:
+            raise ValueError(f"data shape {data.shape} does not match geometry {self.shape}")
+        codes = quantize_levels(data.reshape(-1)[self.index], self.vmin, self.vmax)
+        codes[~self.valid] = MISSING_CODE
+        return codes
+
+    def render(self, data: np.ndarray, title: str = None) -> Image.Image:
+        """
+        出圖，回傳使用 shared_palette 的 'P' 模式 PIL Image
+        """
+        codes = self.codes(data)
+        codes[self.overlay] = OVERLAY_CODE
+        image = Image.fromarray(codes, 'P')
+        image.putpalette(shared_palette())
+        if title:
+            ImageDraw.Draw(image).text((5, 5), title, fill=OVERLAY_CODE)
+        return image
+
+    def save(self, data: np.ndarray, path: str, title: str = None, compress_level: int = 1) -> str:
+        """
+        出圖並存成 png (預設使用較快的壓縮等級)
+        """
+        self.render(data, title).save(path, compress_level=compress_level)
+        return path
+
+
+_raster_renderers = {}
+
+
+def get_raster_renderer(rlat: float, rlon: float, header: dict, theta: float = 0.0,
+                        size: tuple = (600, 600), radius_km: float = 150) -> RasterRenderer:
+    """
+    取得 (並快取) 某雷達站、網格、仰角與輸出大小的快速出圖器
+    """
+    key = (round(float(rlat), 4), round(float(rlon), 4), tuple(sorted(header.items())),
+           round(float(theta), 2), tuple(size), radius_km)
+    if key not in _raster_renderers:
+        _raster_renderers[key] = RasterRenderer(rlat, rlon, header, theta, size, radius_km)
+    return _raster_renderers[key]
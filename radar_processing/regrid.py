@@ -0,0 +1,379 @@
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from typing import Tuple
+
+
+def source_geometry(radar_obj) -> Tuple:
+    """
+    取得原始雷達資料的幾何設定，作為快取 key
+
+    Returns
+    -------
+    Tuple
+        (nray, ngate, azm_start(度), azm_sp(度), gate_start(m), gate_sp(m))
+    """
+    return (int(radar_obj.nray), int(radar_obj.ngate),
+            float(radar_obj.azm_start), float(radar_obj.azm_sp),
+            float(radar_obj.gate_start), float(radar_obj.gate_sp))
+
+
+def target_geometry(new_ngate: int, new_nray: int,
+                    new_gate_start: float, new_gate_sp: float,
+                    new_azm_start: float, new_azm_sp: float) -> Tuple:
+    """
+    取得新網格的幾何設定，作為快取 key
+
+    Returns
+    -------
+    Tuple
+        (nray, ngate, azm_start(度), azm_sp(度), gate_start(km), gate_sp(km))
+    """
+    return (int(new_nray), int(new_ngate),
+            float(new_azm_start), float(new_azm_sp),
+            float(new_gate_start), float(new_gate_sp))
+
+
+class NearestPlan:
+    """
+    最近鄰取樣的索引表
+
+    每一組 (原始幾何, 新幾何) 只需計算一次，之後每個 sweep 都用同一組索引
+    做一次 fancy-index 取值。計算方式與逐點迴圈版本完全一致。
+    """
+
+    def __init__(self, src: Tuple, dst: Tuple):
+        nray, ngate, azm_start, azm_sp, gate_start, gate_sp = src
+        new_nray, new_ngate, new_azm_start, new_azm_sp, new_gate_start, new_gate_sp = dst
+
+        orig_gate_start = gate_start / 1000.0  # 轉換到km
+        orig_gate_sp = gate_sp / 1000.0        # 轉換到km
+
+        # 新網格點的實際距離和方位角
+        range_val = new_gate_start + new_gate_sp * np.arange(new_ngate)
+        azimuth = np.mod(new_azm_start + new_azm_sp * np.arange(new_nray), 360.0)
+
+        # 對應的原始網格索引 (np.round 與 round 同為四捨六入五成雙)
+        gate_idx = np.round((range_val - orig_gate_start) / orig_gate_sp).astype(np.intp)
+        azm_idx = np.mod(np.round((azimuth - azm_start) / azm_sp).astype(np.intp), nray)
+
+        self.src = src
+        self.dst = dst
+        self.shape = (new_nray, new_ngate)
+        self.gate_valid = (gate_idx >= 0) & (gate_idx < ngate)
+        gate_take = np.where(self.gate_valid, gate_idx, 0)
+        # 攤平後的 (azimuth, gate) 取樣索引
+        self.index = azm_idx[:, None] * ngate + gate_take[None, :]
+        for arr in (self.gate_valid, self.index):
+            arr.flags.writeable = False
+
+    def apply(self, data: np.ndarray, fill_value: float,
+              dtype=np.float32, out: np.ndarray = None) -> np.ndarray:
+        """
+        將索引表套用到資料上
+
+        Parameters
+        ----------
+        data : np.ndarray
+            原始資料，形狀為 (..., nray, ngate)
+        fill_value : float
+            超出原始距離範圍時填入的缺失值
+        dtype : data-type
+            輸出資料型別
+        out : np.ndarray, optional
+            預先配置的輸出陣列，形狀為 (..., new_nray, new_ngate)
+
+        Returns
+        -------
+        np.ndarray
+            重新網格化後的資料
+        """
+        nray, ngate = self.src[0], self.src[1]
+        if data.shape[-2:] != (nray, ngate):
+            raise ValueError(f"data shape {data.shape} does not match geometry ({nray}, {ngate})")
+        flat = data.reshape(data.shape[:-2] + (nray * ngate,))
+        if out is None:
+            out = np.empty(data.shape[:-2] + self.shape, dtype=dtype)
+        out[...] = flat[..., self.index]
+        out[..., ~self.gate_valid] = fill_value
+        return out
+
+
+@lru_cache(maxsize=64)
+def get_nearest_plan(src: Tuple, dst: Tuple) -> NearestPlan:
+    """
+    取得 (並快取) 某一組幾何設定的最近鄰取樣索引表
+    """
+    return NearestPlan(src, dst)
+
+
+AGGREGATE_METHODS = ('mean', 'max', 'median', 'fraction')
+# 可由較細網格的聚合狀態合併出較粗網格的方法 (median 無法合併)
+PYRAMID_METHODS = ('mean', 'max', 'fraction')
+
+# 聚合的中間狀態 (nray, ngate)：有效值總和 (回波場為線性 Z)、有效個數、最大值、原始 gate 數；
+# 用不到的項目為 None
+AggregateState = namedtuple('AggregateState', ['sum', 'count', 'max', 'total'])
+
+
+def _bin_table(bins: np.ndarray, nbins: int) -> np.ndarray:
+    """
+    依所屬的新網格 bin 將原始索引分組
+
+    Returns
+    -------
+    np.ndarray
+        (nbins, kmax) 的原始索引表，不足的位置補 -1
+    """
+    valid = (bins >= 0) & (bins < nbins)
+    src = np.nonzero(valid)[0]
+    b = bins[valid]
+    order = np.argsort(b, kind='stable')
+    src, b = src[order], b[order]
+    counts = np.bincount(b, minlength=nbins)
+    kmax = max(int(counts.max()) if counts.size else 0, 1)
+    starts = np.cumsum(counts) - counts
+    table = np.full((nbins, kmax), -1, dtype=np.intp)
+    table[b, np.arange(b.size) - starts[b]] = src
+    return table
+
+
+class AggregatePlan:
+    """
+    區域聚合降解析度的 bin 表
+
+    每個原始 gate 依其中心位置歸入唯一的新網格格點 (格點中心 ± 半個間隔)，
+    預先建立每個新方位角/距離 bin 所包含的原始 ray/gate 索引表，
+    之後每個 sweep 以一次 gather 加上 block reduction 完成聚合。
+    """
+
+    def __init__(self, src: Tuple, dst: Tuple):
+        nray, ngate, azm_start, azm_sp, gate_start, gate_sp = src
+        new_nray, new_ngate, new_azm_start, new_azm_sp, new_gate_start, new_gate_sp = dst
+
+        # 原始 gate / ray 中心位置
+        orig_range = gate_start / 1000.0 + gate_sp / 1000.0 * np.arange(ngate)
+        orig_azimuth = azm_start + azm_sp * np.arange(nray)
+
+        # 所屬的新網格 bin (距離超出範圍的 gate 不計入任何 bin)
+        gate_bin = np.floor((orig_range - (new_gate_start - new_gate_sp / 2)) / new_gate_sp).astype(np.intp)
+        ray_bin = np.floor(np.mod(orig_azimuth - new_azm_start + new_azm_sp / 2, 360.0) / new_azm_sp).astype(np.intp)
+
+        self.src = src
+        self.dst = dst
+        self.shape = (new_nray, new_ngate)
+        self.ray_table = _bin_table(ray_bin, new_nray)
+        self.gate_table = _bin_table(gate_bin, new_ngate)
+        self._ray_index = self.ray_table[:, :, None, None]
+        self._gate_index = self.gate_table[None, None, :, :]
+        self.member = (self._ray_index >= 0) & (self._gate_index >= 0)
+        # 每個新格點包含的原始 gate 數
+        self.total = self.member.sum(axis=(1, 3))
+        for arr in (self.ray_table, self.gate_table, self.member, self.total):
+            arr.flags.writeable = False
+
+    def gather(self, data: np.ndarray) -> np.ndarray:
+        """
+        取出每個新格點所包含的原始 gate，形狀為 (new_nray, kr, new_ngate, kg)
+        """
+        return data[self._ray_index, self._gate_index]
+
+    def apply(self, data: np.ndarray, valid: np.ndarray, fill_value: float,
+              method: str = 'mean', is_dbz: bool = True,
+              dtype=np.float32, out: np.ndarray = None) -> np.ndarray:
+        """
+        將 bin 表套用到資料上做聚合
+
+        Parameters
+        ----------
+        data : np.ndarray
+            原始資料，形狀為 (..., nray, ngate)
+        valid : np.ndarray
+            有效資料的遮罩 (排除 var_miss / rf_miss)，形狀同 data
+        fill_value : float
+            沒有有效資料時填入的缺失值
+        method : str
+            'mean', 'max', 'median' 或 'fraction' (有效 gate 比例)
+        is_dbz : bool
+            'mean' 是否換算成線性 Z 後再平均
+        dtype : data-type
+            輸出資料型別
+        out : np.ndarray, optional
+            預先配置的輸出陣列，形狀為 (..., new_nray, new_ngate)
+
+        Returns
+        -------
+        np.ndarray
+            聚合後的資料
+        """
+        if method not in AGGREGATE_METHODS:
+            raise ValueError(f"Unknown aggregation method: {method}")
+        nray, ngate = self.src[0], self.src[1]
+        if data.shape[-2:] != (nray, ngate):
+            raise ValueError(f"data shape {data.shape} does not match geometry ({nray}, {ngate})")
+        if out is None:
+            out = np.empty(data.shape[:-2] + self.shape, dtype=dtype)
+
+        # 逐 sweep 處理，避免多層資料同時展開佔用過多記憶體
+        flat_data = data.reshape((-1, nray, ngate))
+        flat_valid = np.broadcast_to(valid, data.shape).reshape((-1, nray, ngate))
+        flat_out = out.reshape((-1,) + self.shape)
+        for k in range(flat_data.shape[0]):
+            flat_out[k] = self._reduce(flat_data[k], flat_valid[k], fill_value, method, is_dbz)
+        return out
+
+    def state(self, data: np.ndarray, valid: np.ndarray, method: str = 'mean',
+              is_dbz: bool = True) -> AggregateState:
+        """
+        單一 sweep (nray, ngate) 的聚合狀態，只計算 method 需要的項目 (見 finish_state)
+        """
+        if method not in PYRAMID_METHODS:
+            raise ValueError(f"Aggregation method {method} cannot be combined across levels")
+        values = self.gather(data).astype(np.float64)
+        mask = self.gather(valid) & self.member
+        count = mask.sum(axis=(1, 3))
+        total, maximum = None, None
+        if method == 'mean':
+            if is_dbz:
+                values = 10.0 ** (values / 10.0)  # dBZ -> 線性 Z
+            total = np.where(mask, values, 0.0).sum(axis=(1, 3))
+        elif method == 'max':
+            maximum = np.where(mask, values, -np.inf).max(axis=(1, 3))
+        return AggregateState(total, count, maximum, np.asarray(self.total))
+
+    def _reduce(self, data, valid, fill_value, method, is_dbz):
+        values = self.gather(data).astype(np.float64)
+        mask = self.gather(valid) & self.member
+        nvalid = mask.sum(axis=(1, 3))
+
+        if method == 'fraction':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = nvalid / self.total
+            return np.where(self.total > 0, result, fill_value)
+
+        if method == 'mean':
+            if is_dbz:
+                values = 10.0 ** (values / 10.0)  # dBZ -> 線性 Z
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = np.where(mask, values, 0.0).sum(axis=(1, 3)) / nvalid
+                if is_dbz:
+                    result = 10.0 * np.log10(result)
+        elif method == 'max':
+            result = np.where(mask, values, -np.inf).max(axis=(1, 3))
+        else:
+            # 無效值排到最後，依有效個數取中間值
+            nj, kr, ni, kg = values.shape
+            ordered = np.sort(np.where(mask, values, np.inf).transpose(0, 2, 1, 3)
+                              .reshape(nj, ni, kr * kg), axis=-1)
+            lo = np.maximum((nvalid - 1) // 2, 0)[..., None]
+            hi = (nvalid // 2)[..., None]
+            with np.errstate(invalid='ignore'):
+                result = 0.5 * (np.take_along_axis(ordered, lo, axis=-1) +
+                                np.take_along_axis(ordered, hi, axis=-1))[..., 0]
+        return np.where(nvalid > 0, result, fill_value)
+
+
+@lru_cache(maxsize=64)
+def get_aggregate_plan(src: Tuple, dst: Tuple) -> AggregatePlan:
+    """
+    取得 (並快取) 某一組幾何設定的區域聚合 bin 表
+    """
+    return AggregatePlan(src, dst)
+
+
+def coarsen_state(state: AggregateState, factor: int, ngate: int) -> AggregateState:
+    """
+    將聚合狀態在距離方向每 factor 個 gate 合併成一個，取前 ngate 個
+    """
+    def combine(arr, reduce):
+        if arr is None:
+            return None
+        nray = arr.shape[0]
+        return reduce(arr[:, :ngate * factor].reshape(nray, ngate, factor), axis=-1)
+    return AggregateState(combine(state.sum, np.sum), combine(state.count, np.sum),
+                          combine(state.max, np.max), combine(state.total, np.sum))
+
+
+def finish_state(state: AggregateState, fill_value: float, method: str = 'mean',
+                 is_dbz: bool = True, dtype=np.float32) -> np.ndarray:
+    """
+    由聚合狀態算出結果 (與 AggregatePlan.apply 相同的定義)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if method == 'fraction':
+            return np.where(state.total > 0, state.count / state.total, fill_value).astype(dtype)
+        if method == 'mean':
+            result = state.sum / state.count
+            if is_dbz:
+                result = 10.0 * np.log10(result)
+        else:
+            result = state.max
+    return np.where(state.count > 0, result, fill_value).astype(dtype)
+
+
+def pyramid_geometries(dst: Tuple, levels) -> list:
+    """
+    各解析度的新網格：方位角設定相同，距離間隔為 levels (km)，所有層共用 dst 第一個 bin 的
+    下緣與 dst 的距離範圍，因此每個較粗的 bin 剛好由較細一層的數個 bin 組成
+
+    Returns
+    -------
+    list
+        由細到粗的 target_geometry
+    """
+    new_nray, new_ngate, new_azm_start, new_azm_sp, new_gate_start, new_gate_sp = dst
+    edge = new_gate_start - new_gate_sp / 2
+    extent = new_ngate * new_gate_sp
+    levels = sorted(float(sp) for sp in levels)
+    for finer, coarser in zip(levels, levels[1:]):
+        ratio = coarser / finer
+        if abs(ratio - round(ratio)) > 1e-6 or round(ratio) < 2:
+            raise ValueError(f"pyramid level {coarser} km is not a multiple of {finer} km")
+    return [target_geometry(int(np.floor(extent / sp + 1e-6)), new_nray, edge + sp / 2, sp,
+                            new_azm_start, new_azm_sp) for sp in levels]
+
+
+class PyramidPlan:
+    """
+    多解析度 (距離方向) 的聚合表
+
+    只有最細的一層由原始資料聚合 (一次 gather)，之後每一層由前一層的聚合狀態
+    (總和、個數、最大值) 合併而成，不再讀取原始資料。
+    """
+
+    def __init__(self, src: Tuple, dst: Tuple, levels):
+        self.geometries = pyramid_geometries(dst, levels)
+        self.levels = [geometry[5] for geometry in self.geometries]
+        self.factors = [1] + [int(round(coarser / finer)) for finer, coarser in zip(self.levels, self.levels[1:])]
+        self.base = get_aggregate_plan(src, self.geometries[0])
+
+    def apply(self, data: np.ndarray, valid: np.ndarray, fill_value: float,
+              method: str = 'mean', is_dbz: bool = True, dtype=np.float32) -> list:
+        """
+        Parameters
+        ----------
+        data, valid : np.ndarray
+            原始資料與有效資料的遮罩 (nray, ngate)
+        method : str
+            'mean', 'max' 或 'fraction'
+
+        Returns
+        -------
+        list
+            由細到粗每一層的 (new_nray, new_ngate) 結果
+        """
+        state = self.base.state(data, valid, method, is_dbz)
+        outputs = []
+        for factor, geometry in zip(self.factors, self.geometries):
+            if factor > 1:
+                state = coarsen_state(state, factor, geometry[1])
+            outputs.append(finish_state(state, fill_value, method, is_dbz, dtype))
+        return outputs
+
+
+@lru_cache(maxsize=16)
+def get_pyramid_plan(src: Tuple, dst: Tuple, levels: Tuple) -> PyramidPlan:
+    """
+    取得 (並快取) 某一組幾何設定與解析度的多解析度聚合表
+    """
+    return PyramidPlan(src, dst, levels)
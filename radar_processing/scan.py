@@ -0,0 +1,136 @@
+import json
+import numpy as np
+from .batch import LAYERS, WorkUnit, input_filename
+from .prefetch import prefetch
+from .radar_polar_processor import _sweep_datetime, is_dbz_field
+from .regrid import get_aggregate_plan, get_nearest_plan, source_geometry, target_geometry
+
+
+def _check_geometry(layer_num: int, sweeps: dict):
+    """
+    確認同一層的所有參數有相同的站點、仰角與方位角/距離設定
+    """
+    params = list(sweeps)
+    first = sweeps[params[0]]
+    reference = (first.rlat, first.rlon, round(float(first.theta), 2)) + source_geometry(first)
+    for param in params[1:]:
+        obj = sweeps[param]
+        geometry = (obj.rlat, obj.rlon, round(float(obj.theta), 2)) + source_geometry(obj)
+        if geometry != reference:
+            raise ValueError(f"layer {layer_num}: geometry of {param} {geometry} "
+                             f"does not match {params[0]} {reference}")
+
+
+def load_scan(input_dir: str, date: str, time: str, param_types: list, layers=LAYERS,
+              site: str = 'RCWF', method: str = 'nearest',
+              new_ngate: int = 459, new_nray: int = 360,
+              new_gate_start: float = 1.0, new_gate_sp: float = 1.0,
+              new_azm_start: float = 0.0, new_azm_sp: float = 1.0,
+              prefetch_threads: int = 4):
+    """
+    讀取某時間所有參數與層，一次重新網格化成 (param, layer, ray, gate) 的連續陣列
+
+    同一層的所有參數共用方位角/距離設定，因此每層只取得一次取樣 (或聚合) 表，
+    並對所有參數一次套用；'nearest' 只對取樣後的 gate 換算物理量，不換算整個原始 sweep。
+
+    Parameters
+    ----------
+    input_dir : str
+        輸入資料夾
+    date, time : str
+        掃描日期與時間
+    param_types : list
+        參數 (例如 ["bref_qc", "bphi", "bspw", "bzdr", "bvel_da"])
+    layers : list
+        層數
+    site : str
+        雷達站
+    method : str
+        見 regrid_polar_data
+    new_ngate, new_nray, new_gate_start, new_gate_sp, new_azm_start, new_azm_sp
+        新網格設定 (距離單位 km)，見 regrid_polar_data
+    prefetch_threads : int
+        背景讀檔與解壓縮的 thread 數
+
+    Returns
+    -------
+    Tuple[np.ndarray, dict]
+        float32 的 (len(param_types), len(layers), new_nray, new_ngate) 陣列 (缺失為 -44400)，
+        以及座標資訊：params, layers, theta (每層仰角), azimuth(度), range(m),
+        available (param, layer) 是否有檔案, header, site, time
+    """
+    param_types, layers = list(param_types), list(layers)
+    dst = target_geometry(new_ngate, new_nray, new_gate_start, new_gate_sp, new_azm_start, new_azm_sp)
+    tensor = np.full((len(param_types), len(layers), new_nray, new_ngate), -44400, dtype=np.float32)
+    available = np.zeros((len(param_types), len(layers)), dtype=bool)
+    thetas = np.full(len(layers), np.nan)
+    site_info, scan_time = None, None
+
+    filenames = [input_filename(input_dir, WorkUnit(date, time, param, layer_num), site)
+                 for layer_num in layers for param in param_types]
+    loaded = prefetch(filenames, prefetch_threads, dtype=np.float32)
+    for k, layer_num in enumerate(layers):
+        # 依序取出這一層的各參數，後面的檔案在背景繼續讀取
+        sweeps = {param: obj for param, obj in zip(param_types, loaded) if obj is not None}
+        if not sweeps:
+            continue
+        _check_geometry(layer_num, sweeps)
+
+        first = next(iter(sweeps.values()))
+        thetas[k] = first.theta
+        if site_info is None:
+            site_info = {'name': first.name, 'rlat': float(first.rlat), 'rlon': float(first.rlon),
+                         'radar_elev': float(first.radar_elev)}
+            scan_time = _sweep_datetime(first).isoformat()
+        rows = [param_types.index(param) for param in sweeps]
+        available[rows, k] = True
+        src = source_geometry(first)
+
+        if method == 'nearest':
+            # 先以共用的索引表取出 raw 計數值，只對取樣後的 gate 換算物理量
+            plan = get_nearest_plan(src, dst)
+            raw = np.empty((len(sweeps),) + plan.shape, dtype=first.raw.dtype)
+            for i, obj in enumerate(sweeps.values()):
+                np.take(obj.raw.reshape(-1), plan.index, out=raw[i])
+            scales = np.array([obj.var_scale for obj in sweeps.values()])[:, None, None]
+            values = np.divide(raw, scales, dtype=np.float32)
+            values[..., ~plan.gate_valid] = first.rf_miss
+            tensor[rows, k] = values
+            continue
+        # 聚合：回波場與其他場 (是否在線性 Z 平均) 分開套用同一個 bin 表
+        plan = get_aggregate_plan(src, dst)
+        data = np.stack([obj.data for obj in sweeps.values()])
+        valid = np.stack([obj.valid_mask() for obj in sweeps.values()])
+        dbz = np.array([is_dbz_field(param) for param in sweeps])
+        for flag in (True, False):
+            if not (dbz == flag).any():
+                continue
+            values = plan.apply(data[dbz == flag], valid[dbz == flag], first.rf_miss,
+                                method=method, is_dbz=flag)
+            tensor[np.array(rows)[dbz == flag], k] = values
+
+    header = {'nray': new_nray, 'ngate': new_ngate, 'azm_start': new_azm_start, 'azm_sp': new_azm_sp,
+              'gate_start': new_gate_start * 1000, 'gate_sp': new_gate_sp * 1000}
+    coords = {
+        'params': param_types,
+        'layers': layers,
+        'theta': thetas,
+        'azimuth': new_azm_start + new_azm_sp * np.arange(new_nray),
+        'range': header['gate_start'] + header['gate_sp'] * np.arange(new_ngate),
+        'available': available,
+        'header': header,
+        'site': site_info,
+        'time': scan_time,
+    }
+    return tensor, coords
+
+
+def save_scan(path: str, tensor: np.ndarray, coords: dict) -> str:
+    """
+    將 load_scan 的結果存成 npz (data 與座標陣列，header, site, time 以 JSON 字串存在 attrs)
+    """
+    attrs = json.dumps({k: coords[k] for k in ('header', 'site', 'time')})
+    np.savez(path, data=tensor, params=np.array(coords['params']), layers=np.array(coords['layers']),
+             theta=coords['theta'], azimuth=coords['azimuth'], range=coords['range'],
+             available=coords['available'], attrs=np.array(attrs))
+    return path
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import re
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from .batch import (LAYERS, WorkUnit, _init_worker, batch_settings, finalize_volume, input_filename,
+                    manifest_key, manifest_params, process_unit, unit_label, volume_key)
+from .manifest import Manifest
+from .telemetry import Recorder, recording, write_report
+
+# 即時處理模式：監看 input_dir，檔案一到就處理該層，整個 volume 到齊 (或逾時) 時輸出
+
+
+def parse_filename(name: str, site: str = 'RCWF'):
+    """
+    由檔名 {site}.{date}.{time}.{param}.{layer}.gz 解析出工作單位，不符合時回傳 None
+    """
+    match = re.fullmatch(rf'{re.escape(site)}\.(\d{{8}})\.(\d{{4}})\.(\w+)\.(\d{{2}})\.gz', name)
+    if match is None:
+        return None
+    date, time_, param_type, layer = match.groups()
+    return WorkUnit(date, time_, param_type, int(layer))
+
+
+class VolumeState:
+    """
+    一個 volume 已收到的層與第一層到達的時間
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.expected = 0  # 已排入佇列的層數
+        self.layers = {}  # layer_num -> process_unit 的結果
+        self.failed = set()  # 處理失敗的層數，不再等待
+        self.inputs = []
+
+
+class IngestService:
+    """
+    監看 input_dir 的 asyncio 服務
+
+    - 輪詢資料夾，大小在兩次輪詢間不變的新檔案才視為寫入完成
+    - 有上限的佇列：worker 忙不過來時暫停掃描 (backpressure)
+    - 解碼、重新網格化與出圖在 process pool 中執行
+    - volume 的所有層到齊 (處理失敗的層不再等待) 或第一層到達後超過 volume_timeout 秒時組合輸出
+    - 已處理檔名只保留仍在 input_dir 中的檔案，已輸出 volume 的記錄保留 volume_timeout 秒
+    - 已輸出的 volume 又收到新的層時，以 input_dir 中該 volume 的所有層重新處理；
+      先前的層已移出 input_dir 時捨棄新的層，不以較少的層覆蓋完整的輸出
+    """
+
+    def __init__(self, config: dict):
+        self.settings = batch_settings(config)
+        self.param_types = set(config['param_types'])
+        self.layers = set(config.get('layers', LAYERS))
+        self.poll_interval = config.get('poll_interval', 5.0)
+        self.volume_timeout = config.get('volume_timeout', 600.0)
+        self.queue_size = config.get('queue_size') or 2 * self.settings['workers']
+
+        self.volumes = {}
+        self.finalized = {}  # volume -> (輸出的時間, 層數)
+        self.seen = set()
+        self._sizes = {}
+        self._up_to_date = {}  # volume -> 確認為最新的時間
+        self.records = []
+        self.rolling = None
+        if self.settings['rolling']:
+            from .accumulate import RollingFeed
+            self.rolling = RollingFeed(self.settings)
+        self.manifest = None
+        if self.settings['incremental']:
+            os.makedirs(self.settings['output_dir'], exist_ok=True)
+            self.manifest = Manifest(os.path.join(self.settings['output_dir'], 'manifest.json'))
+
+    def _is_up_to_date(self, key: tuple) -> bool:
+        if self.manifest is None:
+            return False
+        inputs = [input_filename(self.settings['input_dir'], WorkUnit(*key, layer), self.settings['site'])
+                  for layer in sorted(self.layers)]
+        inputs = [path for path in inputs if os.path.exists(path)]
+        return self.manifest.is_up_to_date(manifest_key(key), inputs, manifest_params(self.settings))
+
+    def scan(self) -> list:
+        """
+        掃描一次 input_dir，回傳寫入完成且尚未處理的新工作單位
+        """
+        ready = []
+        names = set()
+        with os.scandir(self.settings['input_dir']) as entries:
+            for entry in entries:
+                names.add(entry.name)
+                if entry.name in self.seen:
+                    continue
+                unit = parse_filename(entry.name, self.settings['site'])
+                if unit is None or unit.param_type not in self.param_types or unit.layer_num not in self.layers:
+                    continue
+                size = entry.stat().st_size
+                if self._sizes.get(entry.name) != size:
+                    self._sizes[entry.name] = size  # 可能還在寫入，下一次輪詢再確認
+                    continue
+                self.seen.add(entry.name)
+                del self._sizes[entry.name]
+                key = volume_key(unit)
+                if key not in self.volumes and self._is_up_to_date(key):
+                    if key not in self._up_to_date:
+                        self._up_to_date[key] = time.monotonic()
+                        print(f"Up to date: {' - '.join(key)}")
+                else:
+                    ready.append(unit)
+        # 已移出 input_dir 的檔案不需要再記住
+        self.seen &= names
+        self._sizes = {name: size for name, size in self._sizes.items() if name in names}
+        return sorted(self._reopen(ready))
+
+    def _input_name(self, key: tuple, layer: int) -> str:
+        return os.path.basename(input_filename(self.settings['input_dir'], WorkUnit(*key, layer), self.settings['site']))
+
+    def _reopen(self, ready: list) -> list:
+        """
+        已輸出過的 volume 收到新的層 (晚到的層) 時，把 input_dir 中該 volume 已處理過的層一起重新排入，
+        組合出包含新層的完整 volume；先前的層已不在 input_dir 時捨棄新的層
+        """
+        for key in sorted({volume_key(unit) for unit in ready} - set(self.volumes)):
+            previous = self._finalized_layers(key)
+            if not previous:
+                continue
+            new = {unit.layer_num for unit in ready if volume_key(unit) == key}
+            present = {layer for layer in self.layers - new if self._input_name(key, layer) in self.seen}
+            if len(present | new) < previous:
+                print(f"Late layers {sorted(new)} ignored (volume already finalized with {previous} layers, "
+                      f"earlier layers are no longer in input_dir): {' - '.join(key)}")
+                ready = [unit for unit in ready if volume_key(unit) != key]
+                continue
+            if present:
+                print(f"Late layers {sorted(new)}, reprocessing {len(present | new)} layers: {' - '.join(key)}")
+                ready += [WorkUnit(*key, layer) for layer in sorted(present)]
+        return ready
+
+    def _finalized_layers(self, key: tuple) -> int:
+        """
+        volume 先前輸出的層數 (未輸出過時為 0)
+
+        記憶體中的記錄只保留 volume_timeout 秒，之後改由 manifest、三維矩陣或 archive 判斷
+        """
+        if key in self.finalized:
+            return self.finalized[key][1]
+        if self.manifest is not None and manifest_key(key) in self.manifest.entries:
+            return len(self.manifest.entries[manifest_key(key)]['inputs'])
+        date, time_, param_type = key
+        npy_path = os.path.join(self.settings['output_dir'], date, time_, param_type,
+                                f"radar_matrix_{param_type}.npy")
+        if os.path.exists(npy_path):
+            return len(np.load(npy_path, mmap_mode='r'))
+        archive_path = os.path.join(self.settings['output_dir'], 'archive', f"{self.settings['site']}_{date}")
+        if os.path.isdir(archive_path):
+            from .archive import VolumeArchive
+            archive = VolumeArchive(archive_path)
+            return sum((time_, param_type, layer) in archive for layer in self.layers)
+        return 0
+
+    def prune(self):
+        """
+        移除 volume_timeout 秒以前已輸出或確認為最新的 volume 記錄，避免長時間執行時無限增長
+        """
+        expired = time.monotonic() - self.volume_timeout
+        for key in [key for key, (t, _) in self.finalized.items() if t < expired]:
+            del self.finalized[key]
+        for key in [key for key, t in self._up_to_date.items() if t < expired]:
+            del self._up_to_date[key]
+
+    async def watch(self, queue: asyncio.Queue, stop: asyncio.Event):
+        while not stop.is_set():
+            for unit in self.scan():
+                state = self.volumes.get(volume_key(unit))
+                if state is None:
+                    state = self.volumes[volume_key(unit)] = VolumeState()
+                    print(f"Processing {' - '.join(volume_key(unit))}")
+                state.expected += 1
+                await queue.put(unit)  # 佇列滿時在此等待
+            try:
+                await asyncio.wait_for(stop.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def work(self, queue: asyncio.Queue, pool, finalizer):
+        loop = asyncio.get_running_loop()
+        while True:
+            unit = await queue.get()
+            try:
+                try:
+                    _, result = await loop.run_in_executor(pool, process_unit, unit, self.settings)
+                except Exception as exc:
+                    print(f"Failed {unit_label(unit)}: {exc!r}")
+                    result = None
+                key = volume_key(unit)
+                state = self.volumes.get(key)
+                if state is None:
+                    continue
+                state.expected -= 1
+                if result is not None:
+                    state.layers[unit.layer_num] = result
+                    state.inputs.append(input_filename(self.settings['input_dir'], unit, self.settings['site']))
+                    self.records.extend(result['telemetry'])
+                else:
+                    state.failed.add(unit.layer_num)
+                if state.expected == 0 and set(state.layers) | state.failed >= self.layers:
+                    if state.failed:
+                        print(f"Finalizing without failed layers {sorted(state.failed)}: {' - '.join(key)}")
+                    await self.finalize(key, finalizer)
+            finally:
+                queue.task_done()
+
+    async def expire(self, finalizer, stop: asyncio.Event):
+        """
+        將等待超過 volume_timeout 的 volume 以已收到的層輸出，並清除過期的記錄
+        """
+        while not stop.is_set():
+            self.prune()
+            now = time.monotonic()
+            for key, state in list(self.volumes.items()):
+                if state.expected == 0 and now - state.started > self.volume_timeout:
+                    print(f"Timeout, finalizing {len(state.layers)} layers: {' - '.join(key)}")
+                    await self.finalize(key, finalizer)
+            try:
+                await asyncio.wait_for(stop.wait(), min(self.poll_interval, self.volume_timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def finalize(self, key: tuple, finalizer):
+        state = self.volumes.pop(key, None)
+        if state is None:
+            return
+        self.finalized[key] = (time.monotonic(), len(state.layers))
+        if not state.layers:
+            return
+        # 組合輸出在單一 thread 中依序執行 (archive 與 manifest 不支援同時寫入)
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                finalizer, self._finalize_sync, key, state)
+        except Exception as exc:
+            print(f"Failed to finalize {' - '.join(key)}: {exc!r}")
+            return
+        print(f"Finished {' - '.join(key)}: {len(outputs)} outputs")
+
+    def _finalize_sync(self, key: tuple, state: VolumeState) -> list:
+        recorder = Recorder(manifest_key(key)) if self.settings['telemetry'] else None
+        with recording(recorder):
+            outputs = finalize_volume(key, state.layers, self.settings, self.rolling)
+        if recorder:
+            self.records.extend(recorder.records)
+        if self.manifest is not None:
+            self.manifest.record(manifest_key(key), sorted(state.inputs),
+                                 manifest_params(self.settings), outputs)
+        return outputs
+
+    async def run(self, stop: asyncio.Event = None):
+        """
+        執行服務直到 stop 被設定；結束前處理完佇列中的工作並輸出未完成的 volume
+        """
+        stop = stop or asyncio.Event()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with ProcessPoolExecutor(max_workers=self.settings['workers'], initializer=_init_worker) as pool, \
+                ThreadPoolExecutor(max_workers=1) as finalizer:
+            workers = [asyncio.create_task(self.work(queue, pool, finalizer))
+                       for _ in range(self.settings['workers'])]
+            expire = asyncio.create_task(self.expire(finalizer, stop))
+            await self.watch(queue, stop)
+            await queue.join()
+            for task in workers:
+                task.cancel()
+            await expire
+            for key in list(self.volumes):
+                await self.finalize(key, finalizer)
+        if self.settings['telemetry'] and self.records:
+            for path in write_report(self.records, self.settings['output_dir']):
+                print(f"Saved {path}")
+
+
+async def _serve(service: IngestService):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):  # Windows
+            pass
+    await service.run(stop)
+
+
+def run_service(config: dict):
+    """
+    以即時處理模式執行，Ctrl-C (SIGINT) 或 SIGTERM 時處理完手上的工作後結束
+    """
+    service = IngestService(config)
+    print(f"Watching {service.settings['input_dir']}")
+    try:
+        asyncio.run(_serve(service))
+    except KeyboardInterrupt:
+        print("Stopped")
@@ -0,0 +1,253 @@
+import csv
+import os
+import warnings
+import numpy as np
+from .archive import META_NAME, VolumeArchive, require_archive
+from .geometry import beam_height, ground_to_slant_range, latlon_to_polar, polar_index
+from .quantize import decode
+from .radar_polar_processor import is_dbz_field
+
+# visualize/Taiwan.py 中標示的地面測站 (lat, lon)
+STATIONS = {
+    'Banqiao': (24.9994, 121.4338),
+    'Hualien': (23.9769, 121.6051),
+    'SunMoonLake': (23.8831, 120.8999),
+    'Taitung': (22.754, 121.1465),
+    'Wuqi': (24.2578, 120.5152),
+    'Baozhong': (23.6927, 120.2955),
+    'Chaojhou': (22.5361, 120.532),
+    'Shangdewun': (22.765, 120.6964),
+}
+STATISTICS = ('center', 'mean', 'max', 'median')
+CSV_FIELDS = ('date', 'time', 'station', 'layer', 'theta', 'height', 'value', 'count')
+
+
+class StationIndex:
+    """
+    測站在某站網格上的查表
+
+    每個測站、每一層對應的 (ray, gate) 以及周圍 (2 * kernel + 1) x (2 * kernel + 1) 個
+    ray/gate 的索引只計算一次；之後多個掃描的所有測站只需要一次 gather。
+    """
+
+    def __init__(self, stations: dict, site: dict, header: dict, thetas: list, kernel: int = 0):
+        """
+        Parameters
+        ----------
+        stations : dict
+            測站名稱 -> (lat, lon)
+        site : dict
+            雷達站 (rlat, rlon, radar_elev)
+        header : dict
+            regrid_polar_data 回傳的 header
+        thetas : list
+            各層仰角
+        kernel : int
+            鄰近範圍 (ray 與 gate 各往兩側 kernel 格)，0 為只取最近的 gate
+        """
+        self.names = list(stations)
+        self.thetas = [float(t) for t in thetas]
+        nray, ngate = header['nray'], header['ngate']
+        lat, lon = np.array([stations[name] for name in self.names], dtype=float).T
+        distance, azimuth = latlon_to_polar(lat, lon, site['rlat'], site['rlon'])
+
+        offsets = np.arange(-kernel, kernel + 1)
+        d_ray, d_gate = [a.ravel() for a in np.meshgrid(offsets, offsets, indexing='ij')]
+        full_circle = int(round(360.0 / header['azm_sp'])) == nray
+        self.shape = (len(thetas), len(self.names), d_ray.size)
+        self.sweep_shape = (nray, ngate)
+        self.index = np.zeros(self.shape, dtype=np.intp)
+        self.valid = np.zeros(self.shape, dtype=bool)
+        self.height = np.empty((len(thetas), len(self.names)))
+        for k, theta in enumerate(self.thetas):
+            ray, gate, valid = polar_index(ground_to_slant_range(distance, theta), azimuth, header)
+            rays = ray[:, None] + d_ray
+            gates = gate[:, None] + d_gate
+            if full_circle:
+                rays %= nray
+            ok = valid[:, None] & (rays >= 0) & (rays < nray) & (gates >= 0) & (gates < ngate)
+            self.index[k] = np.where(ok, rays * ngate + gates, 0)
+            self.valid[k] = ok
+            self.height[k] = beam_height(distance, theta) + site.get('radar_elev', 0.0)
+
+    def gather(self, sweep: np.ndarray, k: int) -> np.ndarray:
+        """
+        第 k 層 sweep (nray, ngate) 中所有測站的鄰近值 (nstations, nkernel)，保留原本的 dtype
+        """
+        return sweep.reshape(-1)[self.index[k]]
+
+    def extract(self, volumes: np.ndarray, missing: float = -44400, statistic: str = 'mean',
+                is_dbz: bool = True):
+        """
+        多個掃描所有測站、所有層的值
+
+        Parameters
+        ----------
+        volumes : np.ndarray
+            (ntimes, nlayers, nray, ngate) 的物理量
+        missing : float
+            缺失值
+        statistic : str
+            見 reduce
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            見 reduce
+        """
+        ntimes = volumes.shape[0]
+        if volumes.shape[1:] != (self.shape[0],) + self.sweep_shape:
+            raise ValueError(f"volume shape {volumes.shape[1:]} does not match index "
+                             f"{(self.shape[0],) + self.sweep_shape}")
+        flat = volumes.reshape(ntimes, self.shape[0], -1)
+        layers = np.arange(self.shape[0])[:, None]
+        values = flat[:, layers, self.index.reshape(self.shape[0], -1)].reshape((ntimes,) + self.shape)
+        return self.reduce(values, missing, statistic, is_dbz)
+
+    def reduce(self, values: np.ndarray, missing: float = -44400, statistic: str = 'mean',
+               is_dbz: bool = True):
+        """
+        合併每個測站的鄰近值
+
+        Parameters
+        ----------
+        values : np.ndarray
+            (ntimes, nlayers, nstations, nkernel)
+        statistic : str
+            'center' (最近的 gate)、'mean' (回波場在線性 Z 平均)、'max' 或 'median'
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            (ntimes, nlayers, nstations) 的值 (全部缺失為 NaN) 與有效的鄰近值個數；
+            missing 與非有限值 (NaN, inf) 不列入
+        """
+        if statistic not in STATISTICS:
+            raise ValueError(f"Unknown statistic: {statistic}")
+        values = values.astype(np.float32)
+        values[(values == missing) | ~np.isfinite(values) | ~self.valid] = np.nan
+        count = np.isfinite(values).sum(axis=-1)
+        if statistic == 'center':
+            center = self.shape[2] // 2
+            return values[..., center], np.isfinite(values[..., center]).astype(count.dtype)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # 全部缺失
+            if statistic == 'max':
+                return np.nanmax(values, axis=-1), count
+            if statistic == 'median':
+                return np.nanmedian(values, axis=-1), count
+            if is_dbz:
+                with np.errstate(divide='ignore'):
+                    mean = (10 * np.log10(np.nanmean(10 ** (values / 10), axis=-1))).astype(np.float32)
+                # 線性 Z 下溢為 0 時 log10 為 -inf，視為缺失
+                mean[~np.isfinite(mean)] = np.nan
+                return mean, count
+            return np.nanmean(values, axis=-1), count
+
+
+_station_indexes = {}
+
+
+def get_station_index(stations: dict, site: dict, header: dict, thetas: list, kernel: int = 0) -> StationIndex:
+    """
+    取得 (並快取) 某組測站、站點、網格與仰角的 StationIndex
+    """
+    key = (tuple((name, tuple(stations[name])) for name in stations),
+           round(float(site['rlat']), 4), round(float(site['rlon']), 4),
+           tuple(sorted(header.items())), tuple(round(float(t), 2) for t in thetas), kernel)
+    if key not in _station_indexes:
+        _station_indexes[key] = StationIndex(stations, site, header, thetas, kernel)
+    return _station_indexes[key]
+
+
+def extract_archive(archive: VolumeArchive, param_type: str, stations: dict = STATIONS,
+                    layers=None, times=None, kernel: int = 0, statistic: str = 'mean'):
+    """
+    由資料庫取出測站的時間序列
+
+    每個 chunk 只取出測站周圍的值 (有編碼的參數先取 code)，全部時間的值再一次換算與合併。
+    仰角取第一個時間的各層仰角。
+
+    Returns
+    -------
+    Tuple[dict, np.ndarray, np.ndarray]
+        座標 (times, layers, stations, theta, height)、
+        (ntimes, nlayers, nstations) 的值 (缺失為 NaN) 與有效的鄰近值個數
+    """
+    times = archive.times if times is None else [str(t) for t in times]
+    times = [t for t in times if any((t, param_type, n) in archive for n in archive.layers)]
+    layers = archive.layers if layers is None else [int(n) for n in layers]
+    thetas = []
+    for n in layers:
+        first = next((t for t in times if (t, param_type, n) in archive), None)
+        thetas.append(archive.chunk_attrs(first, param_type, n)['theta'] if first else 0.0)
+    index = get_station_index(stations, archive.attrs['site'], archive.attrs['header'], thetas, kernel)
+
+    encoding = archive.encoding(param_type)
+    fill = archive.fill_value if encoding is None else encoding.missing
+    dtype = archive.dtype if encoding is None else np.dtype(encoding.dtype)
+    values = np.full((len(times),) + index.shape, fill, dtype=dtype)
+    for i, time in enumerate(times):
+        for k, n in enumerate(layers):
+            if (time, param_type, n) in archive:
+                values[i, k] = index.gather(archive.read_chunk(time, param_type, n, decoded=False), k)
+    if encoding is not None:
+        values = decode(values, encoding, fill_value=archive.fill_value)
+    result, count = index.reduce(values, archive.fill_value, statistic, is_dbz_field(param_type))
+    coords = {'times': times, 'layers': layers, 'stations': index.names, 'theta': thetas,
+              'height': index.height}
+    return coords, result, count
+
+
+def write_table(path: str, date: str, coords: dict, values: np.ndarray, count: np.ndarray) -> str:
+    """
+    寫成每列一個 (time, station, layer) 的 CSV
+    """
+    with open(path, 'w', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(CSV_FIELDS)
+        for i, time in enumerate(coords['times']):
+            for j, name in enumerate(coords['stations']):
+                for k, layer in enumerate(coords['layers']):
+                    value = values[i, k, j]
+                    writer.writerow([date, time, name, layer, coords['theta'][k],
+                                     round(float(coords['height'][k, j]), 1),
+                                     '' if not np.isfinite(value) else round(float(value), 3), int(count[i, k, j])])
+    return path
+
+
+def run_stations(config: dict) -> list:
+    """
+    依設定由 output_dir/archive 中每天的資料庫取出測站時間序列，
+    存成 output_dir/stations/{site}_{date}_{param_type}.csv
+
+    Returns
+    -------
+    list
+        輸出路徑
+    """
+    require_archive(config, 'stations')
+    options = config['stations']
+    output_dir = os.path.normpath(os.path.abspath(config['output_dir']))
+    site = config.get('site', 'RCWF')
+    names = options.get('names')
+    stations = options.get('coordinates') or {name: STATIONS[name] for name in (names or STATIONS)}
+    outputs = []
+    for date in config['dates']:
+        path = os.path.join(output_dir, 'archive', f"{site}_{date}")
+        if not os.path.exists(os.path.join(path, META_NAME)):
+            print(f"No archive for station extraction: {site} - {date}")
+            continue
+        archive = VolumeArchive(path)
+        for param_type in config['param_types']:
+            coords, values, count = extract_archive(archive, param_type, stations, options.get('layers'),
+                                                    kernel=options.get('kernel', 0),
+                                                    statistic=options.get('statistic', 'mean'))
+            if not coords['times']:
+                continue
+            os.makedirs(os.path.join(output_dir, 'stations'), exist_ok=True)
+            csv_path = write_table(os.path.join(output_dir, 'stations', f"{site}_{date}_{param_type}.csv"),
+                                   date, coords, values, count)
+            print(f"Stations: {len(coords['times'])} times x {len(stations)} stations -> {csv_path}")
+            outputs.append(csv_path)
+    return outputs
@@ -0,0 +1,189 @@
+import cProfile
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 各階段的計時記錄，只在有啟用的 Recorder 時才記錄，否則 stage() 不做任何事
+STAGES = ('decompress', 'decode', 'regrid', 'pyramid', 'radar_build', 'render', 'save', 'archive', 'grid', 'tiles', 'rolling', 'animation')
+PERCENTILES = (50, 90, 99)
+RECORD_FIELDS = ('unit', 'stage', 'wall', 'cpu', 'bytes', 'peak_rss')
+
+# 啟用中的 Recorder (每個 thread 各自獨立；背景讀檔 thread 的記錄由 prefetch 另外收集後加到工作單位中)
+_state = threading.local()
+
+
+def peak_rss():
+    """
+    目前 process 的最大常駐記憶體 (bytes)，無法取得時為 None
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Stage:
+    """
+    一個階段的計時：離開時記錄 wall time、CPU time、讀寫 bytes (可在區塊內設定 .bytes) 與 peak RSS
+    """
+
+    def __init__(self, recorder, name, nbytes=0):
+        self.recorder = recorder
+        self.name = name
+        self.bytes = nbytes
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.records.append({
+            'unit': self.recorder.unit,
+            'stage': self.name,
+            'wall': time.perf_counter() - self._wall,
+            'cpu': time.process_time() - self._cpu,
+            'bytes': int(self.bytes),
+            'peak_rss': peak_rss(),
+        })
+        return False
+
+
+class _NullStage:
+    bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Recorder:
+    """
+    收集一個工作單位 (或整個批次) 的階段記錄
+    """
+
+    def __init__(self, unit: str = None):
+        self.unit = unit
+        self.records = []
+
+    def stage(self, name: str, nbytes: int = 0) -> Stage:
+        return Stage(self, name, nbytes)
+
+    def extend(self, records: list):
+        self.records.extend(records)
+
+
+@contextmanager
+def recording(recorder: Recorder):
+    """
+    在區塊內啟用 recorder (None 時不啟用)，stage() 的記錄會加到其中
+    """
+    previous = getattr(_state, 'recorder', None)
+    _state.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _state.recorder = previous
+
+
+def stage(name: str, nbytes: int = 0):
+    """
+    階段計時的 context manager；沒有啟用的 Recorder 時不做任何事
+    """
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is None:
+        return _NullStage()
+    return recorder.stage(name, nbytes)
+
+
+@contextmanager
+def profiled(path: str = None):
+    """
+    以 cProfile 執行區塊並將結果存到 path (None 時不做任何事)
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def summarize(records: list) -> dict:
+    """
+    各階段的統計：先依工作單位加總，再計算跨工作單位的百分位數
+
+    Returns
+    -------
+    dict
+        stage -> {'count', 'total_wall', 'total_cpu', 'bytes', 'peak_rss', 'wall_p50', ...}
+    """
+    per_unit = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0]))
+    totals = defaultdict(lambda: {'bytes': 0, 'peak_rss': 0})
+    for record in records:
+        entry = per_unit[record['stage']][record['unit']]
+        entry[0] += record['wall']
+        entry[1] += record['cpu']
+        totals[record['stage']]['bytes'] += record['bytes']
+        totals[record['stage']]['peak_rss'] = max(totals[record['stage']]['peak_rss'],
+                                                  record['peak_rss'] or 0)
+
+    order = {name: i for i, name in enumerate(STAGES)}
+    summary = {}
+    for name in sorted(per_unit, key=lambda n: (order.get(n, len(order)), n)):
+        wall, cpu = np.array(list(per_unit[name].values())).T
+        stats = {'count': len(wall), 'total_wall': float(wall.sum()), 'total_cpu': float(cpu.sum())}
+        for q in PERCENTILES:
+            stats[f'wall_p{q}'] = float(np.percentile(wall, q))
+        stats['wall_max'] = float(wall.max())
+        stats.update(totals[name])
+        summary[name] = stats
+    return summary
+
+
+def slowest_units(records: list, n: int = 10) -> list:
+    """
+    總 wall time 最長的 n 個工作單位
+    """
+    totals = defaultdict(float)
+    for record in records:
+        totals[record['unit']] += record['wall']
+    return sorted(([unit, wall] for unit, wall in totals.items()), key=lambda x: -x[1])[:n]
+
+
+def write_report(records: list, output_dir: str, name: str = 'telemetry') -> list:
+    """
+    寫出 JSON 摘要 (各階段百分位數與最慢的工作單位) 與每筆記錄的 CSV
+
+    Returns
+    -------
+    list
+        [json 路徑, csv 路徑]
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, f'{name}.json')
+    csv_path = os.path.join(output_dir, f'{name}.csv')
+    with open(json_path, 'w') as fh:
+        json.dump({'stages': summarize(records), 'slowest_units': slowest_units(records)}, fh, indent=2)
+    with open(csv_path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=RECORD_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    return [json_path, csv_path]
@@ -0,0 +1,207 @@
+import hashlib
+import io
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from .geometry import ground_to_slant_range, latlon_to_polar, polar_index, slant_to_ground_range
+from .raster import MISSING_CODE, quantize_levels, shared_palette
+
+TILE_SIZE = 256
+ZOOMS = (6, 7, 8, 9)
+
+
+def tile_range(lon_min: float, lon_max: float, lat_min: float, lat_max: float, zoom: int):
+    """
+    覆蓋經緯度範圍的 XYZ (WebMercator) tile 編號範圍
+
+    Returns
+    -------
+    Tuple[range, range]
+        x 與 y 的範圍 (y 由北往南)
+    """
+    n = 2 ** zoom
+
+    def tile_x(lon):
+        return min(max(int((lon + 180.0) / 360.0 * n), 0), n - 1)
+
+    def tile_y(lat):
+        y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+        return min(max(int(y), 0), n - 1)
+
+    return range(tile_x(lon_min), tile_x(lon_max) + 1), range(tile_y(lat_max), tile_y(lat_min) + 1)
+
+
+def tile_latlon(zoom: int, x: int, y: int, size: int = TILE_SIZE):
+    """
+    tile 中每個像素中心的經緯度
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        (size, size) 的緯度與經度
+    """
+    n = 2 ** zoom * size
+    px = x * size + np.arange(size) + 0.5
+    py = y * size + np.arange(size) + 0.5
+    lon = px / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * py / n))))
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    return lat2d, lon2d
+
+
+class TileIndex:
+    """
+    某站在 tile pyramid 上的查表
+
+    像素到雷達的地表距離依「所有仰角的 gate 邊界」切成區間，同一區間內每一層對應的 gate 都相同；
+    因此每個像素只保存 (ray, 區間) 的索引。每個掃描先在極座標上算出 (ray, 區間) 的值
+    (composite 時取各層最大值) 並量化成色表 code，之後每個 tile 只需要一次 uint8 gather + PNG 編碼。
+    只保存與雷達範圍相交的 tile 與範圍內的像素。
+    """
+
+    def __init__(self, site: dict, header: dict, thetas: list, zooms=ZOOMS, size: int = TILE_SIZE):
+        rlat, rlon = float(site['rlat']), float(site['rlon'])
+        nray, ngate = header['nray'], header['ngate']
+        self.size = size
+        self.volume_shape = (len(thetas), nray, ngate)
+
+        # 各層 gate 邊界對應的地表距離，合併排序後切成區間 (最後一個區間在所有層的範圍外)
+        slant_edges = header['gate_start'] + (np.arange(ngate + 1) - 0.5) * header['gate_sp']
+        slant_edges = np.maximum(slant_edges, 0.0)
+        self.edges = np.unique(np.concatenate([slant_to_ground_range(slant_edges, t) for t in thetas]))
+        middle = np.concatenate([[self.edges[0] / 2], (self.edges[:-1] + self.edges[1:]) / 2,
+                                 [self.edges[-1] + header['gate_sp']]])
+        self.gates = np.empty((len(thetas), middle.size), dtype=np.intp)
+        self.gate_valid = np.empty((len(thetas), middle.size), dtype=bool)
+        for k, theta in enumerate(thetas):
+            _, gate, valid = polar_index(ground_to_slant_range(middle, theta), np.zeros(middle.size), header)
+            self.gates[k], self.gate_valid[k] = gate, valid
+        self.table_shape = (nray, middle.size)
+
+        max_range = self.edges[-1]
+        lat_range = max_range / 111000.0  # 每緯度約為 111 公里
+        lon_range = max_range / (111000.0 * math.cos(math.radians(rlat)))
+        self.tiles = {}  # (z, x, y) -> (像素位置, (ray, 區間) 的攤平索引)
+        for zoom in zooms:
+            xs, ys = tile_range(rlon - lon_range, rlon + lon_range, rlat - lat_range, rlat + lat_range, zoom)
+            for x in xs:
+                for y in ys:
+                    lat, lon = tile_latlon(zoom, x, y, size)
+                    distance, azimuth = latlon_to_polar(lat.ravel(), lon.ravel(), rlat, rlon)
+                    inside = np.flatnonzero(distance < max_range)
+                    if inside.size == 0:
+                        continue
+                    interval = np.searchsorted(self.edges, distance[inside], side='right')
+                    ray, _, valid = polar_index(np.full(inside.size, header['gate_start']),
+                                                azimuth[inside], header)
+                    valid &= self.gate_valid[:, interval].any(axis=0)
+                    if valid.any():
+                        index = ray[valid] * self.table_shape[1] + interval[valid]
+                        self.tiles[(zoom, x, y)] = (inside[valid].astype(np.int32), index.astype(np.int32))
+
+    def table(self, volume: np.ndarray, sweeps=None, missing: float = -44400) -> np.ndarray:
+        """
+        極座標上每個 (ray, 區間) 的值；多個 sweep 時取垂直最大值 (composite)
+
+        Parameters
+        ----------
+        volume : np.ndarray
+            (nsweeps, nray, ngate) 的資料
+        sweeps : list, optional
+            使用 volume 中的哪幾層 (位置索引)，預設為全部
+        missing : float
+            volume 中的缺失值
+
+        Returns
+        -------
+        np.ndarray
+            (nray, 區間數) 的 float32，缺失或超出範圍為 NaN
+        """
+        if volume.shape != self.volume_shape:
+            raise ValueError(f"volume shape {volume.shape} does not match index {self.volume_shape}")
+        sweeps = range(self.volume_shape[0]) if sweeps is None else sweeps
+        table = np.full(self.table_shape, np.nan, dtype=np.float32)
+        for k in sweeps:
+            values = volume[k][:, self.gates[k]].astype(np.float32)
+            values[:, ~self.gate_valid[k]] = np.nan
+            values[values == missing] = np.nan
+            np.fmax(table, values, out=table)
+        return table
+
+    def codes(self, table_codes: np.ndarray, tile: tuple) -> np.ndarray:
+        """
+        某 tile (z, x, y) 的色表 code (size, size)
+
+        Parameters
+        ----------
+        table_codes : np.ndarray
+            table 量化後的色表 code
+        """
+        pix, index = self.tiles[tile]
+        codes = np.full(self.size * self.size, MISSING_CODE, dtype=np.uint8)
+        codes[pix] = table_codes.reshape(-1)[index]
+        return codes.reshape(self.size, self.size)
+
+
+_tile_indexes = {}
+
+
+def get_tile_index(site: dict, header: dict, thetas: list, zooms=ZOOMS, size: int = TILE_SIZE) -> TileIndex:
+    """
+    取得 (並快取) 某站、網格、仰角與 zoom 範圍的 TileIndex
+    """
+    key = (round(float(site['rlat']), 4), round(float(site['rlon']), 4),
+           tuple(sorted(header.items())), tuple(round(float(t), 2) for t in thetas),
+           tuple(zooms), size)
+    if key not in _tile_indexes:
+        _tile_indexes[key] = TileIndex(site, header, thetas, zooms, size)
+    return _tile_indexes[key]
+
+
+def encode_tile(codes: np.ndarray, compress_level: int = 1) -> bytes:
+    """
+    色表 code 編碼成使用 shared_palette 的 PNG (缺失值透明)
+    """
+    image = Image.fromarray(codes, 'P')
+    image.putpalette(shared_palette())
+    buf = io.BytesIO()
+    image.save(buf, format='PNG', transparency=MISSING_CODE, compress_level=compress_level)
+    return buf.getvalue()
+
+
+def export_tiles(volume: np.ndarray, index: TileIndex, output_dir: str, sweeps=None,
+                 missing: float = -44400, vmin: float = 0, vmax: float = 65, threads: int = 4) -> int:
+    """
+    輸出 output_dir/{z}/{x}/{y}.png
+
+    全部缺失的 tile 不輸出；內容相同的 tile 只編碼一次。PNG 編碼在多個 thread 中進行
+    (PIL 編碼時會釋放 GIL)。
+
+    Returns
+    -------
+    int
+        輸出的 tile 數
+    """
+    table_codes = quantize_levels(index.table(volume, sweeps, missing), vmin, vmax)
+    groups = {}  # code 內容的 hash -> (codes, 相同內容的 tile)
+    for tile in index.tiles:
+        codes = index.codes(table_codes, tile)
+        if not codes.any():  # MISSING_CODE 為 0
+            continue
+        digest = hashlib.sha1(codes).digest()
+        groups.setdefault(digest, (codes, []))[1].append(tile)
+
+    def write(group):
+        codes, tiles = group
+        data = encode_tile(codes)
+        for zoom, x, y in tiles:
+            tile_dir = os.path.join(output_dir, str(zoom), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f"{y}.png"), 'wb') as fh:
+                fh.write(data)
+        return len(tiles)
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tiles') as executor:
+        return sum(executor.map(write, groups.values()))
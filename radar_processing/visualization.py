@@ -1,6 +1,5 @@
 import numpy as np
 import os
-import numpy as np
 import math
 from pyart.graph import RadarMapDisplayBasemap
 import matplotlib.pyplot as plt
@@ -8,70 +7,139 @@ from visualize.colormap import nws_precip_colors
 import matplotlib.colors as mcolors
 from mpl_toolkits.basemap import Basemap
 from PIL import Image
+from .animation import write_animation
+from .geometry import SHAPE_PATH, check_shapefile
 
-def plot_taiwan_basemap(radius_km,degree_per_km,center_lat,center_lon):
-    base_dir = os.path.dirname(os.path.abspath(__file__))  # 獲取當前檔案的目錄
-    shape_path = os.path.join(base_dir, "../visualize/mapdata201805310314/COUNTY_MOI_1070516")
+def plot_taiwan_basemap(radius_km,degree_per_km,center_lat,center_lon,ax=None,coastline_width=1):
+    """
+    建立台灣範圍的 Basemap 並畫上縣市界線與海岸線 (各一次)
+    """
+    check_shapefile()
     m = Basemap(projection='merc', resolution='i', fix_aspect=True,
                 llcrnrlon=center_lon - radius_km * degree_per_km,
                 llcrnrlat=center_lat - radius_km * degree_per_km,
                 urcrnrlon=center_lon + radius_km * degree_per_km,
                 urcrnrlat=center_lat + radius_km * degree_per_km,
-                lat_ts=center_lat)
-    m.readshapefile(shape_path, linewidth=0.25, drawbounds=True, name='Taiwan')
-    m.drawcoastlines(linewidth=1)
+                lat_ts=center_lat, ax=ax)
+    m.readshapefile(SHAPE_PATH, linewidth=0.25, drawbounds=True, name='Taiwan')
+    m.drawcoastlines(linewidth=coastline_width)
     return m
 
-def visualize_and_save(radar_obj,layer_num, output_dir,date, time,param_type):
-    cmap = mcolors.ListedColormap(nws_precip_colors())
-    degree_per_km = 1 / 111  # 每公里對應的緯度或經度（粗略近似）
-    margin = 5  # 給予額外的公里邊界
 
+class RenderContext:
+    """
+    同一雷達站、同一範圍共用的繪圖環境
+
+    Basemap 投影、海岸線、縣市界線與 figure/axes 只建立一次 (海岸線只畫一層，
+    縣市界線來自 shapefile，不另外畫 drawstates)，每張圖只替換資料圖層 (pcolormesh) 與標題。
+    """
+
+    def __init__(self, center_lat, center_lon, radius_km=150, margin=5, figsize=(12, 10)):
+        degree_per_km = 1 / 111  # 每公里對應的緯度或經度（粗略近似）
+
+        # 計算經緯度範圍
+        lat_range = radius_km / 111  # 每緯度約為 111 公里
+        lon_range = radius_km / (111 * math.cos(math.radians(center_lat)))  # 每經度距離依緯度變化
+
+        # 設定雷達站的經緯度範圍
+        self.LAT_MIN = center_lat - lat_range
+        self.LAT_MAX = center_lat + lat_range
+        self.LON_MIN = center_lon - lon_range
+        self.LON_MAX = center_lon + lon_range
+
+        self.cmap = mcolors.ListedColormap(nws_precip_colors())
+        self.norm = mcolors.Normalize(vmin=0, vmax=65)
+        self.fig = plt.figure(figsize=figsize)
+        self.ax = self.fig.add_subplot(1, 1, 1)
+        self.basemap = plot_taiwan_basemap(radius_km+margin, degree_per_km, center_lat, center_lon, ax=self.ax,
+                                           coastline_width=1.25)
+        self.colorbar = self.fig.colorbar(plt.cm.ScalarMappable(norm=self.norm, cmap=self.cmap), ax=self.ax)
+        self._artist = None
+
+    def draw(self, radar_obj, title):
+        """
+        替換資料圖層並更新標題
+        """
+        if self._artist is not None:
+            self._artist.remove()
+            self._artist = None
+
+        field = list(radar_obj.fields.keys())[0]
+        display = RadarMapDisplayBasemap(radar_obj)
+        display.plot_ppi_map(
+            field,
+            sweep=0,
+            vmin=self.norm.vmin,
+            vmax=self.norm.vmax,
+            cmap=self.cmap,  # 使用自定義顏色表
+            min_lon=self.LON_MIN, max_lon=self.LON_MAX,
+            min_lat=self.LAT_MIN, max_lat=self.LAT_MAX,
+            mask_outside=True,
+            projection='aeqd',
+            basemap=self.basemap,
+            ax=self.ax, fig=self.fig,
+            title_flag=False, colorbar_flag=False, embelish=False
+        )
+        self._artist = display.plots[-1]
+        field_dict = radar_obj.fields[field]
+        self.colorbar.set_label(f"{field_dict.get('long_name', field)} ({field_dict.get('units', '')})")
+        self.ax.set_title(title)
+
+    def frame(self, radar_obj, title):
+        """
+        繪製並回傳記憶體中的 RGB 畫面
+        """
+        self.draw(radar_obj, title)
+        self.fig.canvas.draw()
+        return Image.fromarray(np.asarray(self.fig.canvas.buffer_rgba())).convert('RGB')
+
+    def save(self, radar_obj, title, path):
+        """
+        繪製並存成 png
+        """
+        self.frame(radar_obj, title).save(path)
+        return path
+
+
+_render_contexts = {}
+
+
+def get_render_context(center_lat, center_lon, radius_km=150):
+    """
+    取得 (並快取) 某雷達站、某範圍的繪圖環境
+    """
+    key = (round(float(center_lat), 4), round(float(center_lon), 4), radius_km)
+    if key not in _render_contexts:
+        _render_contexts[key] = RenderContext(center_lat, center_lon, radius_km)
+    return _render_contexts[key]
+
+
+def render_frame(radar_obj, layer_num, date, time, param_type):
+    """
+    繪製單層畫面並回傳 (不存檔)
+    """
     # 中間點
     center_lat = radar_obj.latitude['data'][0]
     center_lon = radar_obj.longitude['data'][0]
-    
-    # 半徑 150 公里
-    radius_km = 150
-
-    # 計算經緯度範圍
-    lat_range = radius_km / 111  # 每緯度約為 111 公里
-    lon_range = radius_km / (111 * math.cos(math.radians(center_lat)))  # 每經度距離依緯度變化
-
-    # 設定雷達站的經緯度範圍
-    LAT_MIN = center_lat - lat_range
-    LAT_MAX = center_lat + lat_range
-    LON_MIN = center_lon - lon_range
-    LON_MAX = center_lon + lon_range
-    m = plot_taiwan_basemap(radius_km+margin,degree_per_km,center_lat,center_lon)
-
-    # 繪製圖形
-    plt.figure(figsize=(12, 10))  # 每次創建新的圖像，避免重疊
-    display = RadarMapDisplayBasemap(radar_obj)
-    display.plot_ppi_map(
-        list(radar_obj.fields.keys())[0],
-        sweep=0,
-        resolution='h',
-        vmin=0,
-        vmax=65,
-        cmap=cmap,  # 使用自定義顏色表
-        min_lon=LON_MIN, max_lon=LON_MAX,
-        min_lat=LAT_MIN, max_lat=LAT_MAX,
-        mask_outside=True,
-        projection='aeqd',
-        basemap=m
-    )
-    plt.title(f'{date}{time}_layer_{layer_num:02d}_{param_type}')
-    plt.savefig(os.path.join(output_dir, f'{date}{time}_layer_{layer_num:02d}_{param_type}.png'))
-    plt.close()
+
+    # 半徑 150 公里，同一站的投影與地圖只建立一次
+    context = get_render_context(center_lat, center_lon, radius_km=150)
+    return context.frame(radar_obj, f'{date}{time}_layer_{layer_num:02d}_{param_type}')
+
+
+def visualize_and_save(radar_obj,layer_num, output_dir,date, time,param_type):
+    png_path = os.path.join(output_dir, f'{date}{time}_layer_{layer_num:02d}_{param_type}.png')
+    render_frame(radar_obj, layer_num, date, time, param_type).save(png_path)
+    return png_path
     
 def create_gif(image_dir, output_gif,date, time,param_type):
     """
-    創建GIF
+    由已存檔的各層 png 創建GIF (缺少的層略過)
     """
     images = []
     for layer_num in range(1, 16):
         img_path = os.path.join(image_dir, f'{date}{time}_layer_{layer_num:02d}_{param_type}.png')
-        img = Image.open(img_path)
-        images.append(img)
-    images[0].save(output_gif, save_all=True, append_images=images[1:], loop=0, duration=500)
\ No newline at end of file
+        if os.path.exists(img_path):
+            images.append(Image.open(img_path))
+    if images:
+        write_animation(images, output_gif, 'gif', duration=500)
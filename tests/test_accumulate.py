@@ -0,0 +1,50 @@
+import datetime
+import numpy as np
+from radar_processing.accumulate import RollingAccumulator, rain_rate
+
+
+def scans(n, shape=(2, 8, 10), seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2023, 1, 1, 22, 4)
+    for i in range(n):
+        volume = rng.uniform(0.0, 60.0, shape).astype(np.float32)
+        volume[rng.random(shape) < 0.2] = -44400
+        yield start + datetime.timedelta(minutes=7.5 * i), volume
+
+
+def direct(volumes, threshold, interval_minutes):
+    values = np.stack([np.where(v == -44400, np.nan, v) for v in volumes])
+    with np.errstate(invalid='ignore'):
+        count = (values >= threshold).sum(axis=0)
+    depth = np.nansum(rain_rate(values) * interval_minutes / 60.0, axis=0)
+    return np.fmax.reduce(values, axis=0), count, depth
+
+
+def test_incremental_update_matches_direct():
+    window = 4
+    accumulator = RollingAccumulator((2, 8, 10), window=window, threshold=35.0)
+    history = list(scans(10))
+    for i, (time, volume) in enumerate(history):
+        assert accumulator.update(volume, time)
+        expected_max, expected_count, expected_depth = direct(
+            [v for _, v in history[max(i - window + 1, 0):i + 1]], 35.0, 7.5)
+        np.testing.assert_array_equal(accumulator.max(), expected_max)
+        np.testing.assert_array_equal(accumulator.count_above(), expected_count)
+        np.testing.assert_allclose(accumulator.accumulation(), expected_depth, atol=1e-3)
+
+
+def test_out_of_order_and_reprocessed_scans():
+    history = list(scans(5))
+    accumulator = RollingAccumulator((2, 8, 10), window=3, threshold=35.0)
+    for time, volume in [history[4], history[2], history[3], history[0]]:
+        accumulator.update(volume, time)
+    # 比 window 中所有掃描都舊的不加入
+    assert not accumulator.update(history[1][1], history[1][0])
+    # 同一時間重新處理時取代舊的值
+    replaced = np.full_like(history[3][1], 50.0)
+    assert accumulator.update(replaced, history[3][0])
+    assert accumulator.latest == history[4][0]
+    expected_max, expected_count, expected_depth = direct([history[2][1], replaced, history[4][1]], 35.0, 7.5)
+    np.testing.assert_array_equal(accumulator.max(), expected_max)
+    np.testing.assert_array_equal(accumulator.count_above(), expected_count)
+    np.testing.assert_allclose(accumulator.accumulation(), expected_depth, atol=1e-3)
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pytest
+from radar_processing.archive import VolumeArchive
+from radar_processing.quantize import decode, encode, field_encoding
+
+
+@pytest.fixture
+def volume():
+    rng = np.random.default_rng(0)
+    volume = rng.normal(20.0, 10.0, (3, 36, 50)).astype(np.float32)
+    volume[:, :, :5] = -44400
+    return volume
+
+
+@pytest.mark.parametrize('compression', [0, 6])
+def test_round_trip(tmp_path, volume, compression):
+    archive = VolumeArchive(str(tmp_path / 'db'), shape=volume.shape[1:], compression=compression,
+                            attrs={'site': 'RCWF'})
+    archive.append_volume('2204', 'bref_qc', volume, layers=[1, 2, 3],
+                          layer_attrs=[{'theta': t} for t in (0.5, 1.4, 2.4)])
+    archive.append_volume('2211', 'bref_qc', volume + 1, layers=[1, 2, 3])
+
+    # 重新開啟後由 index 讀回
+    reopened = VolumeArchive(str(tmp_path / 'db'))
+    assert reopened.times == ['2204', '2211']
+    assert reopened.layers == [1, 2, 3]
+    assert reopened.attrs == {'site': 'RCWF'}
+    assert reopened.chunk_attrs('2204', 'bref_qc', 2) == {'theta': 1.4}
+    np.testing.assert_array_equal(reopened.read_chunk('2204', 'bref_qc', 3), volume[2])
+    out = reopened.read(times=['2211', '2218'], layers=[2, 4])
+    assert out.shape == (2, 1, 2) + volume.shape[1:]
+    np.testing.assert_array_equal(out[0, 0, 0], volume[1] + 1)
+    assert (out[0, 0, 1] == reopened.fill_value).all() and (out[1] == reopened.fill_value).all()
+
+
+def test_append_again_replaces_sweep(tmp_path, volume):
+    archive = VolumeArchive(str(tmp_path / 'db'), shape=volume.shape[1:])
+    archive.append('2204', 'bref_qc', 1, volume[0])
+    archive.append('2204', 'bref_qc', 1, volume[1])
+    np.testing.assert_array_equal(VolumeArchive(str(tmp_path / 'db')).read_chunk('2204', 'bref_qc', 1), volume[1])
+
+
+def test_encoded_round_trip(tmp_path, volume):
+    encoding = field_encoding('bref_qc')
+    archive = VolumeArchive(str(tmp_path / 'db'), shape=volume.shape[1:])
+    archive.set_encoding('bref_qc', encoding)
+    codes = encode(volume, encoding)
+    archive.append_volume('2204', 'bref_qc', codes)
+
+    reopened = VolumeArchive(str(tmp_path / 'db'))
+    assert reopened.encoding('bref_qc') == encoding
+    np.testing.assert_array_equal(reopened.read_chunk('2204', 'bref_qc', 1, decoded=False), codes[0])
+    np.testing.assert_array_equal(reopened.read_chunk('2204', 'bref_qc', 1),
+                                  decode(codes[0], encoding, fill_value=reopened.fill_value))
+    with pytest.raises(ValueError):
+        reopened.set_encoding('bref_qc', None)
+
+
+@pytest.mark.parametrize('compression', [0, 6])
+def test_reprocessing_does_not_grow_chunks(tmp_path, volume, compression):
+    archive = VolumeArchive(str(tmp_path / 'db'), shape=volume.shape[1:], compression=compression)
+    archive.append_volume('2204', 'bref_qc', volume)
+    sizes = []
+    for i in range(40):
+        archive.append_volume('2204', 'bref_qc', volume + i % 3)
+        sizes.append(os.path.getsize(os.path.join(archive.path, 'chunks.bin')))
+    # 重新處理的 chunk 寫回原位置 (壓縮後變大時才附加一次)，index 也定期重寫
+    assert sizes[-1] == sizes[3]
+    if not compression:
+        assert sizes[0] == volume.nbytes
+    with open(os.path.join(archive.path, 'index.jsonl')) as fh:
+        assert len(fh.readlines()) <= 2 * len(volume) + 16
+    reopened = VolumeArchive(str(tmp_path / 'db'))
+    np.testing.assert_array_equal(reopened.read(times=['2204'])[0, 0], volume + 39 % 3)
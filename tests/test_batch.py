@@ -0,0 +1,59 @@
+import glob
+import os
+import numpy as np
+import pytest
+from benchmarks.synthetic import THETAS, write_volume
+from radar_processing.batch import run_batch
+
+TIMES = ['2204', '2211', '2219', '2226']
+
+
+def make_config(input_dir, output_dir, **kwargs):
+    config = {'input_dir': str(input_dir), 'output_dir': str(output_dir), 'dates': ['20230101'],
+              'times': TIMES, 'param_types': ['bref_qc'], 'layers': [1, 2, 3], 'render': False,
+              'workers': 1, 'prefetch': 0}
+    config.update(kwargs)
+    return config
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    for i, time in enumerate(TIMES):
+        write_volume(str(tmp_path / 'in'), time=time, ngate=600, thetas=THETAS[:3], seed=10 * i)
+    return tmp_path / 'in'
+
+
+def test_incremental_skips_up_to_date_volumes(tmp_path, input_dir, capsys):
+    config = make_config(input_dir, tmp_path / 'out')
+    run_batch(config)
+    npy_path = str(tmp_path / 'out' / '20230101' / '2204' / 'bref_qc' / 'radar_matrix_bref_qc.npy')
+    assert np.load(npy_path).shape == (3, 360, 459)
+    mtime = os.path.getmtime(npy_path)
+    capsys.readouterr()
+
+    run_batch(config)
+    out = capsys.readouterr().out
+    assert all(f"Up to date: 20230101 - {time} - bref_qc" in out for time in TIMES)
+    assert os.path.getmtime(npy_path) == mtime
+
+    # 輸入改變的 volume 重新處理，其他的仍跳過
+    write_volume(str(input_dir), time='2211', ngate=600, thetas=THETAS[:3], seed=99)
+    run_batch(config)
+    out = capsys.readouterr().out
+    assert "Up to date: 20230101 - 2211 - bref_qc" not in out
+    assert "Up to date: 20230101 - 2204 - bref_qc" in out
+
+
+def test_rolling_matches_full_run_after_reprocessing(tmp_path, input_dir):
+    rolling = {'window': 3, 'threshold': 20.0}
+    run_batch(make_config(input_dir, tmp_path / 'out', rolling=rolling))
+    write_volume(str(input_dir), time='2211', ngate=600, thetas=THETAS[:3], seed=99)
+    run_batch(make_config(input_dir, tmp_path / 'out', rolling=rolling))
+    run_batch(make_config(input_dir, tmp_path / 'ref', rolling=rolling, incremental=False))
+
+    ref_paths = sorted(glob.glob(str(tmp_path / 'ref' / 'rolling' / '*' / '*' / '*.npz')))
+    assert len(ref_paths) == len(TIMES)
+    for ref_path in ref_paths:
+        with np.load(ref_path) as ref, np.load(ref_path.replace(str(tmp_path / 'ref'), str(tmp_path / 'out'))) as out:
+            for name in ref.files:
+                np.testing.assert_array_equal(out[name], ref[name], err_msg=f"{ref_path}: {name}")
@@ -0,0 +1,40 @@
+import numpy as np
+from benchmarks.synthetic import SITE, THETAS
+from radar_processing.gridding import GridWeights, build_grid_weights, grid_volume
+
+HEADER = {'nray': 360, 'ngate': 120, 'azm_start': 0.0, 'azm_sp': 1.0, 'gate_start': 1000.0, 'gate_sp': 1000.0}
+GRID_SHAPE = (4, 21, 21)
+GRID_LIMITS = ((1000.0, 4000.0), (-50000.0, 50000.0), (-50000.0, 50000.0))
+THETA = list(THETAS[:5])
+
+
+def test_weights_interpolate_constant_field(tmp_path):
+    weights = build_grid_weights(SITE, THETA, HEADER, GRID_SHAPE, GRID_LIMITS)
+    # 每個網格點的權重總和為 1，常數場內插後仍為同一個常數
+    np.testing.assert_allclose(weights.vals.sum(axis=1), 1.0, rtol=1e-5)
+    volume = np.full((5, 360, 120), 30.0, dtype=np.float32)
+    grid = weights.apply(volume)
+    assert grid.shape == GRID_SHAPE
+    assert np.isfinite(grid).any()
+    np.testing.assert_allclose(grid[np.isfinite(grid)], 30.0, rtol=1e-5)
+
+    path = str(tmp_path / 'weights.npz')
+    weights.save(path)
+    loaded = GridWeights.load(path)
+    np.testing.assert_array_equal(loaded.apply(volume), grid)
+
+
+def test_missing_and_linear_field():
+    volume = np.tile(np.arange(120, dtype=np.float32), (5, 360, 1))
+    grid = grid_volume(volume, SITE, THETA, HEADER, GRID_SHAPE, GRID_LIMITS)
+    # 距離方向的線性場：雙線性內插後等於網格點的距離 (km) 減 1
+    y, x = np.meshgrid(np.linspace(-50.0, 50.0, 21), np.linspace(-50.0, 50.0, 21), indexing='ij')
+    valid = np.isfinite(grid)
+    assert valid.any()
+    np.testing.assert_allclose(grid[valid], np.broadcast_to(np.hypot(x, y) - 1.0, grid.shape)[valid], atol=0.5)
+
+    missing = np.full((5, 360, 120), -44400, dtype=np.float32)
+    assert np.isnan(grid_volume(missing, SITE, THETA, HEADER, GRID_SHAPE, GRID_LIMITS)).all()
+    column_max = grid_volume(volume, SITE, THETA, HEADER, GRID_SHAPE, GRID_LIMITS, mode='column_max')
+    expected = np.where(valid.any(axis=0), np.where(valid, grid, -np.inf).max(axis=0), np.nan)
+    np.testing.assert_array_equal(column_max, expected)
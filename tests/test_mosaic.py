@@ -0,0 +1,30 @@
+import os
+import numpy as np
+import pytest
+from benchmarks.synthetic import THETAS, write_volume
+from radar_processing.batch import run_batch
+from radar_processing.mosaic import run_mosaic
+
+
+def make_config(tmp_path, **kwargs):
+    config = {'input_dir': str(tmp_path / 'in'), 'output_dir': str(tmp_path / 'out'), 'dates': ['20230101'],
+              'times': ['2204'], 'param_types': ['bref_qc'], 'layers': [1, 2, 3], 'render': False,
+              'workers': 1, 'mosaic': {'sites': ['RCWF'], 'resolution': 0.05}}
+    config.update(kwargs)
+    return config
+
+
+def test_mosaic_needs_archive(tmp_path):
+    with pytest.raises(ValueError, match="'archive'"):
+        run_mosaic(make_config(tmp_path))
+
+
+def test_mosaic_from_archive(tmp_path):
+    write_volume(str(tmp_path / 'in'), ngate=600, thetas=THETAS[:3])
+    config = make_config(tmp_path, archive=True)
+    run_batch(config)
+    paths = run_mosaic(config)
+    assert paths == [os.path.join(str(tmp_path / 'out'), 'mosaic', '20230101', '2204', 'mosaic_bref_qc.npz')]
+    with np.load(paths[0]) as f:
+        assert f['data'].shape == (len(f['lat']), len(f['lon']))
+        assert np.isfinite(f['data']).any()
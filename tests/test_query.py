@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic import THETAS, write_sweep, write_volume
+from radar_processing.batch import run_batch
+from radar_processing.query import QueryService
+
+ARGS = {'date': '20230101', 'time': '2204', 'param': 'bref_qc', 'layer': '1'}
+
+
+@pytest.fixture
+def config(tmp_path):
+    write_volume(str(tmp_path / 'in'), ngate=600, thetas=THETAS[:3])
+    config = {'input_dir': str(tmp_path / 'in'), 'output_dir': str(tmp_path / 'out'), 'dates': ['20230101'],
+              'times': ['2204'], 'param_types': ['bref_qc'], 'layers': [1, 2, 3], 'render': False,
+              'workers': 1, 'archive': True, 'quantize': True}
+    run_batch(config)
+    return config
+
+
+def test_cache_reloads_reprocessed_volume(config):
+    service = QueryService(config)
+    _, before = service.query('sweep', ARGS)
+    assert service.query('sweep', ARGS)[1] is not None and service.cache.hits == 1
+
+    write_sweep(config['input_dir'] + '/RCWF.20230101.2204.bref_qc.01.gz', 360, 600, THETAS[0], seed=42)
+    run_batch(config)
+    _, after = service.query('sweep', ARGS)
+    assert not np.array_equal(before, after, equal_nan=True)
+    assert service.cache.stats()['volumes'] == 1
+    assert service.archive('RCWF', '20230101') is service.archive('RCWF', '20230101')
+
+
+@pytest.mark.parametrize('kind, args', [
+    ('ray', dict(ARGS, azimuth='nan')),
+    ('point', dict(ARGS, lat='inf', lon='121.5')),
+])
+def test_non_finite_coordinates_are_rejected(config, kind, args):
+    with pytest.raises(ValueError):
+        QueryService(config).query(kind, args)
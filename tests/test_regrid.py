@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic import write_sweep
+from radar_processing.RadarDataProcessorClass import RadarDataProcessor
+from radar_processing.quantize import field_encoding
+from radar_processing.radar_polar_processor import regrid_polar_data
+
+
+def loop_regrid(radar_obj, new_ngate=459, new_nray=360, new_gate_start=1.0, new_gate_sp=1.0,
+                new_azm_start=0.0, new_azm_sp=1.0):
+    """
+    原本逐點迴圈的最近鄰重新網格化 (作為參考結果)
+    """
+    orig_gate_start = radar_obj.gate_start / 1000.0
+    orig_gate_sp = radar_obj.gate_sp / 1000.0
+    new_data = np.zeros((new_nray, new_ngate), dtype=np.float32)
+    for j in range(new_nray):
+        for i in range(new_ngate):
+            range_val = new_gate_start + new_gate_sp * i
+            azimuth = np.mod(new_azm_start + new_azm_sp * j, 360.0)
+            gate_idx = round((range_val - orig_gate_start) / orig_gate_sp)
+            azm_idx = np.mod(round((azimuth - radar_obj.azm_start) / radar_obj.azm_sp), radar_obj.nray)
+            if 0 <= gate_idx < radar_obj.ngate:
+                new_data[j, i] = radar_obj.data[azm_idx, gate_idx]
+            else:
+                new_data[j, i] = radar_obj.rf_miss
+    return new_data
+
+
+@pytest.fixture
+def radar_obj(tmp_path):
+    return RadarDataProcessor(write_sweep(str(tmp_path / 'sweep.gz'), 360, 600, 0.5))
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'new_ngate': 200, 'new_nray': 720, 'new_gate_start': 0.3, 'new_gate_sp': 0.75, 'new_azm_start': 0.25,
+     'new_azm_sp': 0.5},
+])
+def test_nearest_plan_matches_loop(radar_obj, kwargs):
+    expected = loop_regrid(radar_obj, **kwargs)
+    new_data, header = regrid_polar_data(radar_obj, **kwargs)
+    assert new_data.dtype == np.float32
+    np.testing.assert_array_equal(new_data, expected)
+    assert header['nray'] == expected.shape[0] and header['ngate'] == expected.shape[1]
+
+
+def test_nearest_codes_match_loop(radar_obj):
+    encoding = field_encoding('bref_qc')
+    expected = loop_regrid(radar_obj)
+    codes, _ = regrid_polar_data(radar_obj, encoding=encoding)
+    assert codes.dtype == np.dtype(encoding.dtype)
+    valid = codes != encoding.missing
+    # 範圍外與原始缺失都是缺失 code，其他格點與迴圈版本相差不超過半個量化間隔
+    assert (~valid == ((expected == radar_obj.rf_miss) | (expected <= -999))).all()
+    decoded = codes[valid] * encoding.scale + encoding.offset
+    assert np.abs(decoded - expected[valid]).max() <= encoding.scale / 2 + 1e-4
+
+
+def test_aggregate_max_matches_loop(radar_obj):
+    # 每個原始 gate 依中心位置歸入 (新格點中心 ± 半個間隔) 的格點，取其中有效值的最大值
+    kwargs = {'new_ngate': 100, 'new_nray': 180, 'new_gate_start': 1.0, 'new_gate_sp': 1.5,
+              'new_azm_start': 0.0, 'new_azm_sp': 2.0}
+    new_data, _ = regrid_polar_data(radar_obj, method='max', **kwargs)
+    valid = radar_obj.valid_mask()
+    expected = np.full((180, 100), -np.inf)
+    for j in range(radar_obj.nray):
+        azimuth = radar_obj.azm_start + radar_obj.azm_sp * j
+        ray_bin = int(np.floor(np.mod(azimuth + 1.0, 360.0) / 2.0))
+        for i in range(radar_obj.ngate):
+            distance = (radar_obj.gate_start + radar_obj.gate_sp * i) / 1000.0
+            gate_bin = int(np.floor((distance - 0.25) / 1.5))
+            if 0 <= gate_bin < 100 and valid[j, i]:
+                expected[ray_bin, gate_bin] = max(expected[ray_bin, gate_bin], radar_obj.data[j, i])
+    expected[np.isinf(expected)] = radar_obj.rf_miss
+    np.testing.assert_allclose(new_data, expected.astype(np.float32), rtol=1e-6)
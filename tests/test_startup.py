@@ -0,0 +1,13 @@
+from benchmarks.check_startup import measure_startup
+
+# 純資料模式的啟動時間與 import surface (與 benchmarks/check_startup.py 相同的檢查)
+
+
+def test_data_only_imports_skip_heavy_modules():
+    result = measure_startup(repeat=1)
+    assert result['loaded'] == []
+
+
+def test_data_only_startup_time():
+    result = measure_startup()
+    assert result['seconds'] < 0.5
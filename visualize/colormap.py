@@ -1,28 +1,27 @@
 import numpy as np
+from functools import lru_cache
 
-def nws_precip_colors():
+nan_zero = [
+    "#f0f0f0",  #  nan
+    "#ffffff"   #  0.00 
+]
 
-    nan_zero = [
-            "#f0f0f0",  #  nan
-            "#ffffff"   #  0.00 
-    ]
-
-    nws_precip_colors_original = [        
-            "#04e9e7",  #  0.01
-            "#019ff4",  #  5.00
-            "#0300f4",  # 10.00
-            "#02fd02",  # 15.00
-            "#01c501",  # 20.00
-            "#008e00",  # 25.00
-            "#fdf802",  # 30.00
-            "#e5bc00",  # 35.00
-            "#fd9500",  # 40.00
-            "#fd0000",  # 45.00
-            "#d40000",  # 50.00
-            "#bc0000",  # 55.00
-            "#f800fd",  # 60.00
-            "#9854c6",  # 65.00
-        ]
+nws_precip_colors_original = [        
+    "#04e9e7",  #  0.01
+    "#019ff4",  #  5.00
+    "#0300f4",  # 10.00
+    "#02fd02",  # 15.00
+    "#01c501",  # 20.00
+    "#008e00",  # 25.00
+    "#fdf802",  # 30.00
+    "#e5bc00",  # 35.00
+    "#fd9500",  # 40.00
+    "#fd0000",  # 45.00
+    "#d40000",  # 50.00
+    "#bc0000",  # 55.00
+    "#f800fd",  # 60.00
+    "#9854c6",  # 65.00
+]
 
 # In [5]:
 # nws_precip_colors = [
@@ -42,18 +41,35 @@ def nws_precip_colors():
 #     "#9854c6",  # 8.00 - 10.00 inches
 #     "#fdfdfd"   # 10.00+
 # ]
-    color_int = np.empty((0, 3))  # 初始化為一個空的 NumPy 陣列
-    for i, val in enumerate(nws_precip_colors_original[:-1]):
-        red = np.linspace(int(nws_precip_colors_original[i][1:3], 16), int(nws_precip_colors_original[i+1][1:3], 16), 500)
-        green = np.linspace(int(nws_precip_colors_original[i][3:5], 16), int(nws_precip_colors_original[i+1][3:5], 16), 500)
-        blue = np.linspace(int(nws_precip_colors_original[i][5:7], 16), int(nws_precip_colors_original[i+1][5:7], 16), 500)
-        
-        stack = np.vstack([red, green, blue]).T
-        color_int = np.vstack([color_int, stack])  # 使用 np.vstack 拼接
-
-    color_code = []
-    for val in color_int:
-        color_code.append('#{:02X}{:02X}{:02X}'.format(int(val[0]), int(val[1]), int(val[2])))
+
+
+def _hex_to_rgb(hex_color):
+    return [int(hex_color[1:3], 16), int(hex_color[3:5], 16), int(hex_color[5:7], 16)]
+
+
+@lru_cache(maxsize=1)
+def _nws_precip_table():
+    # 相鄰兩色之間各線性內插 500 階 (一次建立，之後重複使用)
+    stops = np.array([_hex_to_rgb(c) for c in nws_precip_colors_original], dtype=np.float64)
+    color_int = np.linspace(stops[:-1], stops[1:], 500, axis=1).reshape(-1, 3).astype(np.uint8)
+    rgb = np.concatenate([np.array([_hex_to_rgb(c) for c in nan_zero], dtype=np.uint8), color_int])
+
+    color_code = ['#{:02X}{:02X}{:02X}'.format(*val) for val in color_int.tolist()]
     color_code = np.concatenate([nan_zero, color_code])
+    rgb.flags.writeable = False
+    color_code.flags.writeable = False
+    return rgb, color_code
+
+
+def nws_precip_colors():
+    """
+    回波色階的 hex 色碼 (nan, 0, 以及 13 段各 500 階的漸層)
+    """
+    return _nws_precip_table()[1].copy()
+
 
-    return color_code
\ No newline at end of file
+def nws_precip_rgb():
+    """
+    與 nws_precip_colors 相同順序的 uint8 RGB 陣列，形狀為 (N, 3)
+    """
+    return _nws_precip_table()[0].copy()